@@ -0,0 +1,61 @@
+#!/usr/local/bin/python3
+
+# casrn_check.py
+# Time to normalize and validate a column of CASRNs with the column
+# functions of ghscas, against calling normalize_casrn() and valid_casrn()
+# for each one. The column is made of well-formed CASRNs with a few bad
+# check digits, leading zeros and stray spaces. Run from the repository
+# root:
+#   python3 benchmarks/casrn_check.py [-n ROWS]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ghscas
+
+
+def column(n, seed=0):
+    rng = random.Random(seed)
+    casrns = []
+    for i in range(n):
+        digits = '%d-%02d' % (rng.randint(10, 9999999), rng.randint(0, 99))
+        check = ghscas.check_digit(digits)
+        if rng.random() < 0.01:
+            check = (check + 1) % 10
+        casrn = '%s-%d' % (digits, check)
+        if rng.random() < 0.01:
+            casrn = '00' + casrn
+        if rng.random() < 0.001:
+            casrn = ' ' + casrn
+        casrns.append(casrn)
+    return casrns
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CASRN \
+                normalization and validation.')
+    parser.add_argument('-n', '--rows', type=int, default=1000000)
+    args = parser.parse_args()
+    casrns = column(args.rows)
+    start = time.perf_counter()
+    scalar = [ghscas.valid_casrn(ghscas.normalize_casrn(c)) for c in casrns]
+    per_casrn = time.perf_counter() - start
+    print('per CASRN %8.3f s' % per_casrn)
+    if ghscas.numpy is None:
+        print('NumPy is not installed, no column functions to compare.')
+        return
+    start = time.perf_counter()
+    valid = ghscas.validate(ghscas.normalize(casrns))
+    per_column = time.perf_counter() - start
+    assert list(valid) == scalar
+    print('column    %8.3f s (%.1fx), %d invalid of %d' %
+          (per_column, per_casrn / per_column, len(casrns) - sum(scalar),
+           len(casrns)))
+
+
+if __name__ == '__main__':
+    main()
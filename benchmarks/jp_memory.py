@@ -0,0 +1,91 @@
+#!/usr/local/bin/python3
+
+# jp_memory.py
+# Compare the memory used by the old dict-of-lists representation of the
+# Japan chemicals dictionary against the compact JpChemical records, on the
+# full 2006-2008 corpus: peak RSS of the whole process, and the memory
+# allocated for the records themselves. Run from the repository root:
+#   python3 benchmarks/jp_memory.py
+# Each representation is built in its own process, so that the peak RSS of
+# one doesn't hide the other.
+
+import gc
+import os
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ghscrunch
+
+
+def peak_rss():
+    # Peak resident set size of this process in kB (Linux reports kB).
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def build_dicts(batches):
+    # The representation used before JpChemical: a dict per chemical, with
+    # a separate list per hazard class for every CASRN on a sheet.
+    chemicals = dict()
+    for batch in batches:
+        for chemname, casrns, hazards in batch:
+            for casrn in casrns:
+                if casrn not in chemicals:
+                    chemicals[casrn] = dict(name=chemname)
+                for hazard_class, datalist in hazards:
+                    ghscrunch.update(chemicals[casrn], hazard_class,
+                                     list(datalist))
+    return chemicals
+
+
+def build_compact(batches):
+    chemicals = dict()
+    pool = dict()
+    for batch in batches:
+        ghscrunch.merge_jp(chemicals, batch, pool)
+    return chemicals
+
+
+def measure(mode, cache_dir):
+    source_files = (ghscrunch.GHS_jp_2006_files +
+                    ghscrunch.GHS_jp_2007_files +
+                    ghscrunch.GHS_jp_2008_files)
+    # tracemalloc shows how much memory the finished chemicals dictionary
+    # holds on to (including the strings it refers to), which the peak RSS
+    # of the whole process can hide.
+    tracemalloc.start()
+    batches = [ghscrunch.cached_read(ghscrunch.read_jp_workbook, f,
+                                     cache_dir) for f in source_files]
+    if mode == 'dict':
+        chemicals = build_dicts(batches)
+    else:
+        chemicals = build_compact(batches)
+    del batches
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(mode, len(chemicals), peak_rss(), retained // 1024)
+
+
+def main():
+    cache_dir = '.ghscrunch-cache'
+    if len(sys.argv) > 2:
+        measure(sys.argv[1], sys.argv[2])
+        return
+    results = dict()
+    for mode in ('dict', 'compact'):
+        out = subprocess.run([sys.executable, __file__, mode, cache_dir],
+                             check=True, capture_output=True, text=True)
+        name, n, rss, retained = out.stdout.split()
+        results[mode] = int(retained)
+        print('%-8s %6s chemicals  peak RSS %8s kB  records %8s kB' %
+              (name, n, rss, retained))
+    if results['dict']:
+        print('compact records use %.0f%% of the memory of dicts' %
+              (100.0 * results['compact'] / results['dict']))
+
+
+if __name__ == '__main__':
+    main()
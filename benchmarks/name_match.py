@@ -0,0 +1,68 @@
+#!/usr/local/bin/python3
+
+# name_match.py
+# Time per query of NameIndex.search(), against comparing the query's
+# trigrams with those of every name. Uses the names in the output files,
+# padded out to --names with misspelled copies of them (one letter dropped
+# or swapped), and queries with misspelled names too. Run from the
+# repository root after ghscrunch.py:
+#   python3 benchmarks/name_match.py [--names 50000] [-n QUERIES]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ghsnames
+
+
+def misspell(rng, name):
+    if len(name) < 4:
+        return name + 'x'
+    i = rng.randrange(len(name) - 1)
+    if rng.random() < 0.5:
+        return name[:i] + name[i + 1:]
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fuzzy name \
+                matching.')
+    parser.add_argument('--names', type=int, default=50000)
+    parser.add_argument('-n', '--queries', type=int, default=1000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    entries = [e for group in ghsnames.NameIndex.load().entries
+               for e in group]
+    if not entries:
+        print('No output files; run ghscrunch.py first.')
+        return
+    while len(entries) < args.names:
+        e = rng.choice(entries)
+        entries.append(e._replace(name=misspell(rng, e.name)))
+    start = time.perf_counter()
+    index = ghsnames.NameIndex(entries)
+    print('Indexed %d names (%d distinct) in %.2f s.' %
+          (len(entries), len(index.keys), time.perf_counter() - start))
+    queries = [misspell(rng, rng.choice(entries).name)
+               for i in range(args.queries)]
+    start = time.perf_counter()
+    for q in queries:
+        index.search(q)
+    per_query = (time.perf_counter() - start) / len(queries)
+    grams = [ghsnames.trigrams(k) for k in index.keys]
+    n = max(1, len(queries) // 100)
+    start = time.perf_counter()
+    for q in queries[:n]:
+        g = ghsnames.trigrams(ghsnames.name_key(q))
+        sorted(((len(g & h) / len(g | h), i) for i, h in enumerate(grams)),
+               reverse=True)[:5]
+    per_scan = (time.perf_counter() - start) / n
+    print('all pairs  %10.1f us per query' % (per_scan * 1e6))
+    print('NameIndex  %10.1f us per query' % (per_query * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/local/bin/python3
+
+# nz_key_studies.py
+# Time and peak memory of collecting NZ key studies: the old way
+# (concatenating each key study onto the growing string for its substance
+# and classification) against collect_nz(), which keeps lists of interned
+# key studies and joins them once when writing, with and without dedup.
+# Run from the repository root, optionally with the CCID spreadsheet or a
+# CSV/TSV export to read:
+#   python3 benchmarks/nz_key_studies.py ['GHS-nz/CCID Key Studies.csv']
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ghscrunch
+
+
+def concatenated(rows):
+    # The key study part of crunch_nz() before collect_nz().
+    chemicals = dict()
+    for casrn_cell, name_cell, text_cell, code_cell, key_cell in rows:
+        casrn = str(casrn_cell).strip() or 'no_id'
+        name = name_cell.strip()
+        c = str(code_cell)
+        k = str(key_cell)
+        if '(' in c:
+            c = c[:c.index('(')].strip() + ' ' + c[c.index('('):].strip()
+        if casrn not in chemicals:
+            chemicals[casrn] = {name: {c: k}}
+        elif name not in chemicals[casrn]:
+            chemicals[casrn][name] = {c: k}
+        elif c in chemicals[casrn][name]:
+            chemicals[casrn][name][c] = chemicals[casrn][name][c] + '\n' + k
+        else:
+            chemicals[casrn][name][c] = k
+    return chemicals
+
+
+def joined(rows, dedup):
+    # collect_nz(), plus joining the key studies like write_nz_csv() does.
+    chemicals, sublists = ghscrunch.collect_nz(rows, dedup)
+    for names in chemicals.values():
+        for thisclass in names.values():
+            for c in thisclass:
+                '\n'.join(thisclass[c])
+    return chemicals
+
+
+def measure(name, f):
+    tracemalloc.start()
+    start = time.perf_counter()
+    f()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('%-22s %8.3f s  peak %8d kB' % (name, seconds, peak // 1024))
+
+
+def main():
+    if len(sys.argv) > 1:
+        source_file = sys.argv[1]
+    else:
+        source_file = ghscrunch.NZ_SOURCE_FILE
+    # The spreadsheet, or a CSV/TSV export (read into memory here, so that
+    # the measurements don't include reading it).
+    rows = list(ghscrunch.nz_rows(source_file, '.ghscrunch-cache'))
+    print('%d rows from %s' % (len(rows), source_file))
+    measure('concatenated strings', lambda: concatenated(rows))
+    measure('lists, joined once', lambda: joined(rows, False))
+    measure('lists, deduplicated', lambda: joined(rows, True))
+
+
+if __name__ == '__main__':
+    main()
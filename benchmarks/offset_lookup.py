@@ -0,0 +1,85 @@
+#!/usr/local/bin/python3
+
+# offset_lookup.py
+# Cost and benefit of the sidecar indexes of the output files: time to
+# write a file with csv.writer and with IndexedWriter, then time to fetch
+# the rows of single chemicals by reading the whole file against
+# OffsetIndex. Uses a synthetic CCID export (see synth.py) screened into
+# GHS-nz.csv, in a temporary directory. Run from the repository root:
+#   python3 benchmarks/offset_lookup.py [-s SCALE] [-n LOOKUPS]
+
+import argparse
+import contextlib
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ghscrunch
+import ghsindex
+import synth
+
+
+def write(filename, rows, index):
+    start = time.perf_counter()
+    with ghscrunch.OutputFile(filename, newline='',
+                              buffering=ghscrunch.OUTPUT_BUFFER) as outfile:
+        ghscrunch.csv_writer(outfile, index).writerows(rows)
+    return time.perf_counter() - start
+
+
+def scan(filename, casrn):
+    # What a consumer without the index has to do.
+    with open(filename, newline='') as f:
+        return [row for row in csv.reader(f) if row[0] == casrn]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sidecar \
+                indexes of the output files.')
+    parser.add_argument('-s', '--scale', type=float, default=10)
+    parser.add_argument('-n', '--lookups', type=int, default=1000)
+    args = parser.parse_args()
+    sheet = synth.ccid_sheet(args.scale)
+    with contextlib.redirect_stdout(io.StringIO()):
+        substances, sublists = ghscrunch.collect_nz(
+            ghscrunch.read_nz_rows(sheet))
+    rows = [['CASRN', 'Substance name', 'HSNO code',
+             'HSNO classification text', 'GHS translation', 'Key study']]
+    for dest, casrn_field, casrn, name, thisclass in \
+            ghscrunch.screen_nz(substances):
+        for c in sorted(thisclass.keys()):
+            rows.append([casrn_field, name, c] + sublists[c][1:] +
+                        ['\n'.join(thisclass[c])])
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'GHS-nz.csv')
+        plain = write(filename, rows, False)
+        indexed = write(filename, rows, True)
+        size = os.path.getsize(filename)
+        print('%d rows, %.1f MB; written in %.3f s, %.3f s with the index '
+              '(%.0f%% more); index %d kB' %
+              (len(rows) - 1, size / 1e6, plain, indexed,
+               (indexed / plain - 1) * 100,
+               os.path.getsize(filename + ghscrunch.INDEX_SUFFIX) // 1024))
+        rng = random.Random(0)
+        casrns = [rng.choice(rows[1:])[0] for i in range(args.lookups)]
+        n = max(1, args.lookups // 100)
+        start = time.perf_counter()
+        for c in casrns[:n]:
+            scan(filename, c)
+        per_scan = (time.perf_counter() - start) / n
+        start = time.perf_counter()
+        with ghsindex.OffsetIndex(filename) as index:
+            for c in casrns:
+                index.rows(c)
+        per_seek = (time.perf_counter() - start) / len(casrns)
+        print('full read   %10.1f us per lookup' % (per_scan * 1e6))
+        print('OffsetIndex %10.1f us per lookup' % (per_seek * 1e6))
+
+
+if __name__ == '__main__':
+    main()
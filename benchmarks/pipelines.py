@@ -0,0 +1,239 @@
+#!/usr/local/bin/python3
+
+# pipelines.py
+# Throughput and peak memory of each stage of the Japan, Korea and NZ
+# pipelines on synthetic data (see synth.py) at several scales. Each stage
+# is run twice: once for time, and once under tracemalloc for its peak
+# memory. With --baseline, exits with status 1 if any stage got slower or
+# bigger by more than --threshold. Run from the repository root:
+#   python3 benchmarks/pipelines.py [--scales 1,10,100] [--files]
+#       [--save FILE] [--baseline FILE] [--threshold 0.25]
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ghscrunch
+import synth
+
+
+def jp_stages(books, files):
+    # Stages of crunch_jp(). books are the synthetic workbooks; with files,
+    # they are read from the written .xls files instead.
+    state = dict()
+
+    def read():
+        if files:
+            state['batches'] = [ghscrunch.read_jp_workbook(f) for f in files]
+        else:
+            state['batches'] = [ghscrunch.read_jp_book(b) for b in books]
+
+    def merge():
+        state['chemicals'] = chemicals = dict()
+        pool = dict()
+        for batch in state['batches']:
+            ghscrunch.merge_jp(chemicals, batch, pool)
+
+    def write():
+        ghscrunch.write_jp_csv(state['chemicals'], files or ['source'])
+
+    return [('read', read), ('merge', merge), ('write', write)]
+
+
+def kr_stages(book, filename):
+    state = dict()
+
+    def read():
+        if filename:
+            state['rows'] = list(ghscrunch.iter_kr_rows(filename))
+        else:
+            state['rows'] = list(ghscrunch.iter_kr_book(book))
+
+    def records():
+        state['records'] = list(ghscrunch.kr_records(state['rows']))
+
+    def write():
+        ghscrunch.write_kr_csv([state['records']], filename or 'source')
+
+    return [('read', read), ('records', records), ('write', write)]
+
+
+def nz_stages(sheet, filename):
+    state = dict()
+
+    def read():
+        if filename:
+            state['rows'] = list(ghscrunch.nz_rows(filename))
+        else:
+            state['rows'] = ghscrunch.read_nz_rows(sheet)
+
+    def collect():
+        state['collected'] = ghscrunch.collect_nz(state['rows'])
+
+    def screen():
+        state['screened'] = ghscrunch.screen_nz(state['collected'][0])
+
+    def write():
+        ghscrunch.write_nz_csv(state['screened'], state['collected'][1],
+                               filename or 'source')
+
+    return [('read', read), ('collect', collect), ('screen', screen),
+            ('write', write)]
+
+
+def run_stages(make_stages, traced):
+    # Run all stages of a fresh pipeline in a fresh output tree. Returns
+    # {stage: seconds} or, if traced, {stage: peak bytes}.
+    results = dict()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        for d in ('GHS-jp/output', 'GHS-kr/output', 'GHS-nz/output'):
+            os.makedirs(os.path.join(tmp, d))
+        with open(os.path.join(tmp, 'source'), 'w') as f:
+            f.write('synthetic\n')
+        stages = make_stages()
+        os.chdir(tmp)
+        try:
+            for name, stage in stages:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if traced:
+                        tracemalloc.start()
+                        stage()
+                        results[name] = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                    else:
+                        start = time.perf_counter()
+                        stage()
+                        results[name] = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def benchmark(pipeline, scale, root=None):
+    # Returns {stage: dict(seconds, rows_per_sec, sheets_per_sec, peak_kb)}
+    # for one pipeline at one scale. Rates are per input row and sheet. If
+    # root is given, the source files are written there and read with xlrd.
+    if pipeline == 'jp':
+        books = synth.nite_books(scale)
+        sheets = sum(b.nsheets - 1 for b in books)
+        rows = sheets * len(ghscrunch.NITE_LAYOUT['hazards'])
+        files = None
+        if root:
+            files = []
+            for n, book in enumerate(books):
+                files.append(os.path.join(root, 'jp%04d.xls' % n))
+                synth.write_xls(book, files[-1])
+        make_stages = lambda: jp_stages(books, files)
+    elif pipeline == 'kr':
+        book = synth.nier_book(scale)
+        sheets = book.nsheets
+        rows = synth.KR_ROWS * scale
+        filename = None
+        if root:
+            filename = os.path.join(root, 'kr.xls')
+            synth.write_xls(book, filename)
+        make_stages = lambda: kr_stages(book, filename)
+    else:
+        sheet = synth.ccid_sheet(scale)
+        sheets = 1
+        rows = sheet.nrows - 1
+        filename = None
+        if root:
+            if sheet.nrows <= synth.XLS_MAX_ROWS:
+                filename = os.path.join(root, 'nz.xls')
+                synth.write_xls(synth.Book([sheet]), filename)
+            else:
+                filename = os.path.join(root, 'nz.csv')
+                with open(filename, 'w', newline='', encoding='utf-8') as f:
+                    csv.writer(f).writerows(sheet.rows)
+        make_stages = lambda: nz_stages(sheet, filename)
+    seconds = run_stages(make_stages, False)
+    peaks = run_stages(make_stages, True)
+    results = dict()
+    for stage in seconds:
+        s = max(seconds[stage], 1e-9)
+        results[stage] = dict(seconds=round(s, 4),
+                              rows_per_sec=round(rows / s, 1),
+                              sheets_per_sec=round(sheets / s, 1),
+                              peak_kb=peaks[stage] // 1024)
+    return results
+
+
+def regressions(results, baseline, threshold):
+    # Messages for each stage that is slower, or needs more memory, than in
+    # the baseline by more than threshold (a fraction).
+    messages = []
+    for key, stages in sorted(results.items()):
+        for stage, r in stages.items():
+            b = baseline.get(key, dict()).get(stage)
+            if b is None:
+                continue
+            if r['rows_per_sec'] < b['rows_per_sec'] * (1 - threshold):
+                messages.append('%s %s: %.0f rows/s, baseline %.0f' %
+                                (key, stage, r['rows_per_sec'],
+                                 b['rows_per_sec']))
+            # Ignore a few kB either way, that's just noise.
+            if r['peak_kb'] > b['peak_kb'] * (1 + threshold) + 64:
+                messages.append('%s %s: peak %d kB, baseline %d kB' %
+                                (key, stage, r['peak_kb'], b['peak_kb']))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the crunch \
+                pipelines on synthetic data.')
+    parser.add_argument('--scales', default='1,10,100',
+                        help='Comma-separated scales (default 1,10,100).')
+    parser.add_argument('--pipelines', default='jp,kr,nz',
+                        help='Comma-separated pipelines (default jp,kr,nz).')
+    parser.add_argument('--files', action='store_true',
+                        help='Write real .xls files (needs xlwt) and read '
+                             'them with xlrd, instead of in-memory sheets.')
+    parser.add_argument('--save', metavar='FILE',
+                        help='Save the results as JSON, e.g. as a baseline.')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='Compare with results saved earlier.')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown or memory growth as a '
+                             'fraction of the baseline (default 0.25).')
+    args = parser.parse_args()
+    results = dict()
+    for pipeline in args.pipelines.split(','):
+        for scale in args.scales.split(','):
+            # Files and in-memory sheets are kept apart in the results.
+            key = '%s@%sx%s' % (pipeline, scale,
+                                 '-files' if args.files else '')
+            with tempfile.TemporaryDirectory() as root:
+                results[key] = benchmark(pipeline, float(scale),
+                                         root if args.files else None)
+            for stage, r in results[key].items():
+                print('%-10s %-8s %9.3f s %12.0f rows/s %10.1f sheets/s '
+                      'peak %8d kB' % (key, stage, r['seconds'],
+                                       r['rows_per_sec'], r['sheets_per_sec'],
+                                       r['peak_kb']))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.write('\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        messages = regressions(results, baseline, args.threshold)
+        for m in messages:
+            print('Regression: ' + m)
+        if messages:
+            sys.exit(1)
+        print('No regressions against %s.' % args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+#!/usr/local/bin/python3
+
+# synth.py
+# Synthetic source data for the benchmarks, in the layouts that
+# ghscrunch.py reads: NITE workbooks with one sheet per chemical (see
+# NITE_LAYOUT), the NIER classification list (one row per classification,
+# with merged name and CASRN cells), and the six-column CCID export.
+# Data is either kept in memory as sheet stand-ins that the read_* functions
+# accept, or written to real files. Run from the repository root to write a
+# source tree that ghscrunch.py can be run in (needs xlwt):
+#   python3 benchmarks/synth.py [-s SCALE] DIR
+# Above about scale 13 the CCID export no longer fits on an .xls sheet and
+# is written as 'GHS-nz/CCID Key Studies.csv', which needs
+# `ghscrunch.py nz --nz-source` (see write_files()).
+
+import argparse
+import csv
+import os
+import random
+import sys
+
+import xlrd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ghscrunch
+
+
+# Size of each dataset at scale 1, roughly that of one published NITE
+# workbook, the 2011 NIER list and a CCID export.
+JP_SHEETS = 100
+KR_ROWS = 1200
+NZ_ROWS = 5000
+
+# .xls sheets can't have more rows than this.
+XLS_MAX_ROWS = 65536
+
+JP_CLASSIFICATIONS = ['Not applicable', 'Not classified',
+                      'Classification not possible', 'Category 1',
+                      'Category 2', 'Category 3', 'Category 4',
+                      'Category 1A', 'Category 1B', 'Division 1.1',
+                      'Type B', '']
+KR_CLASSES = [('산화성 고체 (2.14)', 3, 'H272'),
+              ('인화성 액체 (2.6)', 2, 'H225'),
+              ('급성 독성-경구 (3.1)', 4, 'H302'),
+              ('급성 독성-경피 (3.1)', 3, 'H311'),
+              ('급성 독성-흡입 (3.1)', 2, 'H330'),
+              ('피부 부식성/자극성 (3.2)', 1, 'H314'),
+              ('피부 과민성 (3.4)', 1, 'H317'),
+              ('호흡기 과민성 (3.4)', 1, 'H334'),
+              ('발암성 (3.6)', 1, 'H350'),
+              ('수생환경유해성-급성 (4.1)', 1, 'H400'),
+              ('수생환경유해성-만성 (4.1)', 1, 'H410')]
+NZ_CODES = ['3.1B', '3.1C', '6.1B (inhalation)', '6.1D (oral)', '6.3A',
+            '6.4A', '6.5B (contact)', '6.7B', '6.9A (oral)', '8.2B',
+            '8.3A', '9.1A (fish)', '9.1B (algal)', '9.3C', '5.1.1B']
+WORDS = ['rat', 'mouse', 'oral', 'dermal', 'LD50', 'LC50', 'mg/kg', 'OECD',
+         'TG', '401', '471', 'study', 'reliable', 'males', 'females',
+         'observed', 'exposure', 'effects', 'dose', 'no', 'significant']
+
+
+def text(rng, n):
+    return ' '.join(rng.choice(WORDS) for i in range(n))
+
+
+def casrn(i):
+    return '%d-%02d-%d' % (50 + i, i % 100, i % 10)
+
+
+class Sheet:
+    # In-memory stand-in for an xlrd sheet, with the parts of the interface
+    # that the read_* functions use. rows is a list of lists of cell values
+    # (str, float, or '' for empty cells).
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.nrows = len(rows)
+
+    def cell_value(self, r, c):
+        row = self.rows[r]
+        return row[c] if c < len(row) else ''
+
+    def row_len(self, r):
+        return len(self.rows[r])
+
+    def row_values(self, r, start=0, end=None):
+        return self.rows[r][start:end]
+
+    def row_types(self, r, start=0, end=None):
+        return [xlrd.XL_CELL_EMPTY if v == '' else
+                xlrd.XL_CELL_NUMBER if isinstance(v, float) else
+                xlrd.XL_CELL_TEXT for v in self.rows[r][start:end]]
+
+
+class Book:
+    # In-memory stand-in for an xlrd workbook.
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.nsheets = len(sheets)
+
+    def sheet_by_index(self, index):
+        return self.sheets[index]
+
+    def unload_sheet(self, index):
+        pass
+
+    def release_resources(self):
+        pass
+
+
+def nite_sheet(rng, i, revision=False):
+    # One chemical sheet in the NITE layout. Revisions leave some hazard
+    # classes blank, like the published review workbooks do.
+    layout = ghscrunch.NITE_LAYOUT
+    rows = [[''] * 8 for r in range(43)]
+    rows[1][0] = 'ID%d' % i
+    rows[1][3] = 'Chemical %d' % i
+    rows[2][2] = casrn(i) + (', ' + casrn(i + 100000) if i % 29 == 0 else '')
+    rows[2][4] = '2008/3/31' if revision else '2006/3/31'
+    for hazard_class, r, split in layout['hazards']:
+        if split == 'skin':
+            continue
+        cells = rows[r]
+        cells[2] = hazard_class.replace('_', ' ').capitalize()
+        if revision and rng.random() < 0.7:
+            continue
+        if split == 'resp':
+            cells[3] = ('Respiratory sensitizer: ' +
+                        rng.choice(JP_CLASSIFICATIONS[:3]) +
+                        '; Skin sensitizer: ' + rng.choice(JP_CLASSIFICATIONS))
+        else:
+            cells[3] = rng.choice(JP_CLASSIFICATIONS)
+        if cells[3].startswith('Category'):
+            cells[4] = 'Exclamation mark'
+            cells[5] = 'Warning'
+            cells[6] = 'Harmful if swallowed'
+        cells[7] = text(rng, rng.randint(10, 60))
+    return rows
+
+
+def nite_books(scale, seed=0, min_books=1):
+    # Workbooks of up to 100 chemicals each, like the published ones: a
+    # list of chemicals on the first sheet, then one sheet per chemical.
+    # The chemicals are spread evenly over at least min_books workbooks.
+    # The last tenth of the chemicals are revisions of earlier ones.
+    rng = random.Random(seed)
+    total = int(JP_SHEETS * scale)
+    n = max(min_books, -(-total // 100))
+    books = []
+    for k in range(n):
+        ids = range(total * k // n, total * (k + 1) // n)
+        sheets = [Sheet('List', [['ID%d' % i] for i in ids])]
+        for i in ids:
+            revision = i >= total - total // 10
+            sheets.append(Sheet('ID%d' % i, nite_sheet(
+                rng, i - total // 2 if revision else i, revision)))
+        books.append(Book(sheets))
+    return books
+
+
+def nier_book(scale, seed=0):
+    # The NIER list: a title and header, then one row per classification
+    # with the name and CASRN only on the first row of each chemical (the
+    # merged cells), and a note at the end. Split over sheets if needed.
+    rng = random.Random(seed)
+    total = int(KR_ROWS * scale)
+    rows = []
+    i = 0
+    while len(rows) < total:
+        for k in range(rng.randint(1, 4)):
+            hazard_class, category, h_code = rng.choice(KR_CLASSES)
+            row = [float(i + 1), '', '', '', hazard_class, float(category),
+                   'GHS05', '위험', h_code,
+                   10.0 if h_code == 'H410' and k % 2 else '']
+            if k == 0:
+                row[1] = ('Chemical %d; Synonym %d' % (i, i) if i % 3 == 0
+                          else 'Chemical %d' % i)
+                row[3] = casrn(i) + (', ' + casrn(i + 100000) if i % 17 == 0
+                                     else '')
+            rows.append(row)
+        i += 1
+    rows = rows[:total]
+    header = [['유독물 GHS 분류 및 표시 목록'], [],
+              ['No', 'Name', '', 'CAS No', 'Hazard class', 'Category',
+               'Pictogram', 'Signal word', 'H-statement', 'M-factor']]
+    per_sheet = XLS_MAX_ROWS - len(header) - 1
+    sheets = []
+    for start in range(0, len(rows), per_sheet):
+        sheets.append(Sheet('Sheet%d' % (len(sheets) + 1),
+                            header + rows[start:start + per_sheet] +
+                            [['Note: synthetic data']]))
+    return Book(sheets)
+
+
+def ccid_sheet(scale, seed=0):
+    # The CCID export: one row per substance, classification and key study,
+    # with solution variants of the same CASRN and repeated key studies.
+    rng = random.Random(seed)
+    total = int(NZ_ROWS * scale)
+    rows = [['CASRN', 'Substance Name', 'Approval', 'Classification Text',
+             'Classification Code', 'Key Study']]
+    i = 0
+    while len(rows) <= total:
+        codes = rng.sample(NZ_CODES, rng.randint(1, 6))
+        names = ['Substance %d' % i] + ['Substance %d, >%d%% in water' %
+                                        (i, 5 + 10 * v)
+                                        for v in range(rng.randint(0, 3))]
+        for n, name in enumerate(names):
+            if n:
+                codes = rng.sample(codes, rng.randint(1, len(codes)))
+            for code in codes:
+                for k in range(rng.randint(1, 3)):
+                    rows.append([casrn(i) if i % 50 else '', name,
+                                 'HSR%06d' % i, 'Text for ' + code, code,
+                                 text(rng, rng.randint(20, 120))])
+        i += 1
+    return Sheet('CCID', rows[:total + 1])
+
+
+def write_xls(book, filename):
+    import xlwt
+    wb = xlwt.Workbook(encoding='utf-8')
+    for sheet in book.sheets:
+        ws = wb.add_sheet(sheet.name[:31])
+        for r, row in enumerate(sheet.rows):
+            for c, value in enumerate(row):
+                if value != '':
+                    ws.write(r, c, value)
+    wb.save(filename)
+
+
+def write_files(root, scale, seed=0):
+    # Write a source tree under root. There is a Japan workbook for each of
+    # the names that crunch_jp() reads (so at small scales they hold fewer
+    # than 100 chemicals), then ones with numbered names for the chemicals
+    # beyond 100 per workbook, which only the benchmarks read. The CCID
+    # export is written as CSV if it doesn't fit on one .xls sheet, which
+    # ghscrunch.py only reads when given it with --nz-source. Returns
+    # dict(jp=[files], kr=file, nz=file).
+    for d in ('GHS-jp', 'GHS-kr', 'GHS-nz'):
+        os.makedirs(os.path.join(root, d, 'output'), exist_ok=True)
+    names = ghscrunch.GHS_jp_2006_files + ghscrunch.GHS_jp_2007_files + \
+        ghscrunch.GHS_jp_2008_files
+    jp = []
+    for n, book in enumerate(nite_books(scale, seed, len(names))):
+        name = names[n] if n < len(names) else 'GHS-jp/synth%04d.xls' % n
+        write_xls(book, os.path.join(root, name))
+        jp.append(name)
+    kr = ghscrunch.KR_SOURCE_FILE
+    write_xls(nier_book(scale, seed), os.path.join(root, kr))
+    sheet = ccid_sheet(scale, seed)
+    if sheet.nrows <= XLS_MAX_ROWS:
+        nz = ghscrunch.NZ_SOURCE_FILE
+        write_xls(Book([sheet]), os.path.join(root, nz))
+    else:
+        nz = 'GHS-nz/CCID Key Studies.csv'
+        with open(os.path.join(root, nz), 'w', newline='',
+                  encoding='utf-8') as f:
+            csv.writer(f).writerows(sheet.rows)
+    return dict(jp=jp, kr=kr, nz=nz)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic GHS \
+                source files.')
+    parser.add_argument('root', help='Directory to write the source tree to.')
+    parser.add_argument('-s', '--scale', type=float, default=1,
+                        help='Size relative to the published datasets.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    files = write_files(args.root, args.scale, args.seed)
+    print('Wrote %d Japan workbooks, %s and %s.' %
+          (len(files['jp']), files['kr'], files['nz']))
+    if files['nz'] != ghscrunch.NZ_SOURCE_FILE:
+        print('Run ghscrunch.py nz with --nz-source %r.' % files['nz'])
+
+
+if __name__ == '__main__':
+    main()
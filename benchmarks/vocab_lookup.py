@@ -0,0 +1,36 @@
+#!/usr/local/bin/python3
+
+# vocab_lookup.py
+# Per-row cost of the GHS chapter and H-statement lookups that crunch_kr()
+# does for every row, using the prebuilt tables in ghsvocab, against
+# building the dicts from scratch for every lookup (which is what
+# ghs_hazard() and h_statement() used to do). Run from the repository root:
+#   python3 benchmarks/vocab_lookup.py
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ghsvocab
+
+
+def main(n=200000):
+    chapters = dict(ghsvocab.GHS_CHAPTERS)
+    statements = dict(ghsvocab.H_STATEMENTS)
+
+    def rebuilt(ref, h):
+        return dict(chapters)[ref], dict(statements)[h]
+
+    def prebuilt(ref, h):
+        return ghsvocab.ghs_hazard(ref), ghsvocab.h_statement(h)
+
+    for name, f, h in (('rebuilt per call', rebuilt, 'H302'),
+                       ('prebuilt', prebuilt, 'H302'),
+                       ('prebuilt combined', prebuilt, 'H302 + H332')):
+        t = timeit.timeit(lambda: f('3.1', h), number=n)
+        print('%-18s %8.1f ns per row' % (name, t / n * 1e9))
+
+
+if __name__ == '__main__':
+    main()
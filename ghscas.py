@@ -0,0 +1,269 @@
+#!/usr/local/bin/python3
+
+# ghscas.py
+# CAS Registry Numbers: normalizing, check digit validation and finding
+# duplicates, for whole columns of CASRNs at once. The column functions use
+# NumPy if it is installed, working on a matrix of code points with one row
+# per CASRN, and fall back to the single-CASRN functions otherwise.
+#
+# A CASRN is 2 to 7 digits, two digits and a check digit, separated by
+# hyphens. The check digit is the sum of the other digits, each multiplied
+# by its position counted from the right (starting at 1), modulo 10:
+# 7732-18-5 is valid since (8*1 + 1*2 + 2*3 + 3*4 + 7*5 + 7*6) % 10 == 5.
+#
+# `ghscrunch.py --check-casrns` uses this to report malformed CASRNs, bad
+# check digits, and CASRNs that are written differently in the source
+# files but are the same number (which would otherwise become separate
+# chemicals). Running this module checks CASRNs, one per line, from the
+# files given or stdin.
+
+import csv
+import re
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Well-formed enough to normalize: digits, hyphen, two digits, hyphen, digit.
+# Only ASCII digits count, as in the NumPy column functions (\d would also
+# match e.g. full-width digits).
+CASRN_FORM = re.compile(r'^[0-9]+-[0-9]{2}-[0-9]$')
+# Valid, apart from the check digit.
+CASRN_VALID = re.compile(r'^[1-9][0-9]{1,6}-[0-9]{2}-[0-9]$')
+
+# Column functions work on this many CASRNs at a time, to bound the size of
+# the code point matrix.
+CHUNK = 1 << 18
+
+# Right-aligned to WIDTH, CASRNs have their hyphens in HYPHEN_COLUMNS, and
+# the digits before the check digit in DIGIT_COLUMNS, with WEIGHTS.
+WIDTH = 12
+HYPHEN_COLUMNS = [7, 10]
+DIGIT_COLUMNS = [0, 1, 2, 3, 4, 5, 6, 8, 9]
+
+ASCII_DIGITS = '0123456789'
+
+# Code points that str.split() splits on.
+WHITESPACE = [c for c in range(0x3001) if chr(c).isspace()]
+
+WEIGHTS = numpy.array([9, 8, 7, 6, 5, 4, 3, 2, 1], dtype=numpy.int32) \
+    if numpy is not None else None
+
+# Problems that check() reports.
+NOT_CASRN = 'not a CASRN'
+BAD_FORM = 'bad format'
+BAD_CHECK_DIGIT = 'bad check digit'
+
+
+def normalize_casrn(casrn):
+    # No whitespace, and no leading zeros if the CASRN is well-formed.
+    casrn = ''.join(casrn.split())
+    if CASRN_FORM.match(casrn):
+        casrn = casrn.lstrip('0') or '0'
+    return casrn
+
+
+def check_digit(digits):
+    # The check digit for the digits before it (a string, hyphens allowed).
+    # Raises ValueError for anything but ASCII digits.
+    digits = [ASCII_DIGITS.index(d) for d in digits if d != '-']
+    return sum(n * d for n, d in enumerate(reversed(digits), 1)) % 10
+
+
+def valid_casrn(casrn):
+    # Whether a normalized CASRN has the right form and check digit.
+    return bool(CASRN_VALID.match(casrn)) and \
+        check_digit(casrn[:-2]) == int(casrn[-1])
+
+
+def code_points(column):
+    # Fixed-width unicode array of a column, and its code point matrix.
+    strings = numpy.asarray(column, dtype=str)
+    if strings.dtype.itemsize == 0:
+        strings = strings.astype('U1')
+    width = strings.dtype.itemsize // 4
+    return strings, strings.view(numpy.uint32).reshape(len(strings), width)
+
+
+def normalize_chunk(column):
+    # normalize_casrn() for an array of CASRNs. Whitespace is removed one
+    # CASRN at a time, but only from those that have any.
+    strings, cp = code_points(column)
+    spaced = numpy.flatnonzero(numpy.isin(cp, WHITESPACE).any(axis=1))
+    if len(spaced):
+        strings = strings.copy()
+        strings[spaced] = [''.join(s.split()) for s in strings[spaced]]
+        strings, cp = code_points(strings)
+    zeros = numpy.flatnonzero(cp[:, 0] == ord('0'))
+    zeros = zeros[well_formed(cp[zeros])]
+    if len(zeros):
+        stripped = numpy.char.lstrip(strings[zeros], '0')
+        stripped[stripped == ''] = '0'
+        strings = strings.copy()
+        strings[zeros] = stripped
+    return strings
+
+
+def well_formed(cp):
+    # Rows of a code point matrix that look like CASRNs: digits, then a
+    # hyphen, two digits, a hyphen and one digit, then padding.
+    length = numpy.count_nonzero(cp, axis=1)
+    column = numpy.arange(cp.shape[1])
+    last = length[:, None]
+    digit = (cp >= ord('0')) & (cp <= ord('9'))
+    hyphen_at = (column == last - 2) | (column == last - 5)
+    ok = numpy.where(column < last,
+                     numpy.where(hyphen_at, cp == ord('-'), digit), cp == 0)
+    return ok.all(axis=1) & (length >= 6)
+
+
+def validate_chunk(strings):
+    # valid_casrn() for an array of normalized CASRNs. Right-aligned and
+    # padded with zeros to the longest valid length, every CASRN has its
+    # hyphens and check digit in the same columns, and the check digit is
+    # a dot product with fixed weights (the padding adds nothing).
+    strings = numpy.asarray(strings, dtype=str)
+    length = numpy.char.str_len(strings)
+    valid = (length >= 7) & (length <= WIDTH)
+    candidates = numpy.flatnonzero(valid)
+    if len(candidates) == 0:
+        return valid
+    padded = numpy.char.rjust(strings[candidates].astype('U%d' % WIDTH),
+                              WIDTH, '0')
+    digits = padded.view(numpy.uint32).reshape(len(candidates), WIDTH) \
+        .astype(numpy.int32) - ord('0')
+    body = digits[:, DIGIT_COLUMNS]
+    ok = (digits[:, HYPHEN_COLUMNS] == ord('-') - ord('0')).all(axis=1)
+    ok &= ((body >= 0) & (body <= 9)).all(axis=1)
+    # No leading zero.
+    ok &= digits[numpy.arange(len(candidates)),
+                 WIDTH - length[candidates]] != 0
+    ok &= (body @ WEIGHTS) % 10 == digits[:, -1]
+    valid[candidates] = ok
+    return valid
+
+
+def chunked(func, column):
+    # Apply a chunk function to a column, CHUNK rows at a time.
+    parts = [func(column[start:start + CHUNK])
+             for start in range(0, len(column), CHUNK)]
+    if not parts:
+        return func(column)
+    return numpy.concatenate(parts)
+
+
+def normalize(column):
+    # Normalized CASRNs of a column (an array, or a list if there is no
+    # NumPy).
+    if numpy is None:
+        return [normalize_casrn(c) for c in column]
+    return chunked(normalize_chunk, numpy.asarray(column, dtype=str))
+
+
+def validate(column):
+    # Which CASRNs of a column of normalized CASRNs are valid (a boolean
+    # array, or a list if there is no NumPy).
+    if numpy is None:
+        return [valid_casrn(c) for c in column]
+    return chunked(validate_chunk, numpy.asarray(column, dtype=str))
+
+
+def dedupe(column):
+    # The distinct normalized CASRNs of a column, and for each CASRN of the
+    # column, the index of its normalized form in them.
+    normalized = normalize(column)
+    if numpy is None:
+        unique = sorted(set(normalized))
+        where = {c: i for i, c in enumerate(unique)}
+        return unique, [where[c] for c in normalized]
+    unique, inverse = numpy.unique(normalized, return_inverse=True)
+    return unique, inverse.reshape(-1)
+
+
+def check(columns):
+    # Check the CASRN columns of several jurisdictions, given as dict of
+    # jurisdiction -> list of CASRNs as written. Returns the problems found,
+    # as (jurisdiction, CASRN as written, normalized, problem) sorted by
+    # normalized CASRN, and a summary dict of counts. Problems are
+    # NOT_CASRN (no CASRN form at all, like the IDs made up for chemicals
+    # without one), BAD_FORM, BAD_CHECK_DIGIT, and 'same as X' for CASRNs
+    # of one jurisdiction that normalize to the same number as another
+    # written form X. Needs NumPy.
+    jurisdictions = sorted(columns)
+    written = numpy.asarray([c for j in jurisdictions for c in columns[j]],
+                            dtype=str)
+    owner = numpy.repeat(numpy.arange(len(jurisdictions)),
+                         [len(columns[j]) for j in jurisdictions])
+    unique, inverse = dedupe(written)
+    valid = validate(unique)
+    forms, form_inverse = numpy.unique(written, return_inverse=True)
+    # Each distinct (normalized, jurisdiction, written form), in order of
+    # first appearance within each (normalized, jurisdiction).
+    n_j = len(jurisdictions)
+    triples, first = numpy.unique(
+        (inverse.astype(numpy.int64) * n_j + owner) * len(forms) +
+        form_inverse.reshape(-1), return_index=True)
+    pairs = triples // len(forms)
+    order = numpy.lexsort((first, pairs))
+    triples, pairs = triples[order], pairs[order]
+    leading = numpy.ones(len(pairs), dtype=bool)
+    leading[1:] = pairs[1:] != pairs[:-1]
+    first_form = dict()
+    problems = []
+    for pair, triple, lead in zip(pairs.tolist(), triples.tolist(),
+                                  leading.tolist()):
+        j = jurisdictions[pair % n_j]
+        n = str(unique[pair // n_j])
+        c = str(forms[triple % len(forms)])
+        if lead:
+            first_form[pair] = c
+        else:
+            problems.append((j, c, n, 'same as ' + first_form[pair]))
+    unique_pairs = pairs[leading]
+    for pair in unique_pairs[~valid[unique_pairs // n_j]].tolist():
+        n = str(unique[pair // n_j])
+        # Digits of any script here, so that e.g. full-width digits are a
+        # bad format rather than not a CASRN at all.
+        if not re.search(r'\d+-\d+-\d', n):
+            problem = NOT_CASRN
+        elif CASRN_VALID.match(n):
+            problem = BAD_CHECK_DIGIT
+        else:
+            problem = BAD_FORM
+        problems.append((jurisdictions[pair % n_j], first_form[pair], n,
+                         problem))
+    problems.sort(key=lambda p: (p[2], p[0], p[1]))
+    per_casrn = numpy.bincount(unique_pairs // n_j, minlength=len(unique))
+    summary = dict(casrns=len(written), distinct=len(unique),
+                   shared=int(numpy.count_nonzero(per_casrn > 1)),
+                   invalid=int(len(valid) - numpy.count_nonzero(valid)),
+                   duplicates=int(numpy.count_nonzero(~leading)))
+    return problems, summary
+
+
+def write_report(problems, filename):
+    # Write the problems found by check() as CSV.
+    # Imported here, since ghscrunch imports this module for --check-casrns.
+    import ghscrunch
+    with ghscrunch.OutputFile(filename, newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['Jurisdiction', 'CASRN', 'Normalized', 'Problem'])
+        writer.writerows(problems)
+
+
+def main():
+    casrns = []
+    for filename in sys.argv[1:] or ['-']:
+        f = sys.stdin if filename == '-' else open(filename)
+        casrns.extend(line.strip() for line in f if line.strip())
+    normalized = normalize(casrns)
+    for c, n, ok in zip(casrns, normalized, validate(normalized)):
+        if not ok:
+            print('%s\t%s\tinvalid' % (c, n))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,125 +8,359 @@
 import xlrd
 import csv
 import argparse
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import queue
+import re
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import traceback
 
+from ghsvocab import ghs_hazard, h_statement, HSNO_GHS
+import ghsprofile
+
+
+# Bump this whenever the read_* functions change what they extract, so
+# that old entries in the spreadsheet cache are not used anymore.
+EXTRACTOR_VERSION = 3
+
+# Buffer size for output files that get lots of small writes.
+OUTPUT_BUFFER = 1 << 20
+
+# For --pipeline: rows are handed to the writer thread in batches of this
+# many, and at most this many batches wait in the queue.
+PIPELINE_BATCH = 1000
+PIPELINE_QUEUE = 16
+
+# Sidecar index of a CSV output file (see IndexedWriter), FILE.csv.idx: a
+# header (magic, key width, number of entries), then the entries sorted by
+# key, each made by index_entry().
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'GHSIDX1\0'
+INDEX_HEADER = struct.Struct('<8sII')
+
+# Permissions for new output files are set the same way open() would.
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def file_digest(filename):
+    # SHA-256 of a file's content, as a hex string.
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class OutputFile:
+    # A text output file that is written to a temporary file next to its
+    # destination. On close, the temporary file is atomically renamed into
+    # place if the content changed, or thrown away if it didn't (so the
+    # existing file keeps its mtime). Readers never see a half-written file.
+    # With binary, it is a binary file instead. If an IndexedWriter writes
+    # to it, its index is written along with it.
+    def __init__(self, path, manifest=None, newline=None, buffering=-1,
+                 binary=False):
+        self.path = path
+        self.manifest = manifest
+        directory, basename = os.path.split(path)
+        fd, self.tmp = tempfile.mkstemp(dir=directory or '.',
+                                        prefix='.' + basename + '.',
+                                        suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb' if binary else 'w', buffering,
+                              newline=newline)
+        self.closed = False
+        self.index = None
+        # Which of the manifest's source files fed this file (None for all
+        # of them); can be set until the file is closed.
+        self.sources = None
+
+    def write(self, s):
+        return self.file.write(s)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.file.close()
+        digest = file_digest(self.tmp)
+        size = os.path.getsize(self.tmp)
+        # Trust the manifest about the existing file's content, unless the
+        # file is missing or has obviously been changed since.
+        previous = None
+        if os.path.exists(self.path):
+            if self.manifest is not None:
+                previous = self.manifest.digest(self.path)
+            if previous is None:
+                previous = file_digest(self.path)
+        if digest == previous:
+            os.remove(self.tmp)
+            changed = False
+        else:
+            # mkstemp() creates files only readable by the owner.
+            os.chmod(self.tmp, 0o666 & ~UMASK)
+            os.replace(self.tmp, self.path)
+            changed = True
+        if self.manifest is not None:
+            self.manifest.record(self.path, digest, size, changed,
+                                 self.sources)
+        ghsprofile.profiler.output(size)
+        if self.index is not None:
+            write_index(self.path + INDEX_SUFFIX, self.index.entries or [],
+                        self.manifest, self.sources)
+
+    def discard(self):
+        self.closed = True
+        self.file.close()
+        os.remove(self.tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class WriterThread:
+    # Background thread that writes CSV rows to output files, so that
+    # extracting and formatting records in the calling thread overlaps with
+    # the writes. Rows reach the thread in batches through a bounded queue,
+    # so a fast producer blocks rather than piling up rows in memory. Get a
+    # csv.writer-like object for each output file with writer(), and call
+    # finish() before closing the files.
+
+    def __init__(self, batch=PIPELINE_BATCH, maxsize=PIPELINE_QUEUE):
+        self.batch = batch
+        self.queue = queue.Queue(maxsize)
+        self.writers = []
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            # After an error, keep draining the queue so the producer
+            # doesn't block; finish() raises the error.
+            if self.error is None:
+                try:
+                    item[0].writerows(item[1])
+                except BaseException as e:
+                    self.error = e
+
+    def put(self, writer, rows):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((writer, rows))
+
+    def writer(self, outfile, index=False):
+        self.writers.append(QueuedWriter(self, outfile, index))
+        return self.writers[-1]
+
+    def finish(self):
+        # Write what is still pending, and wait for the thread to finish.
+        for w in self.writers:
+            w.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class QueuedWriter:
+    # Stands in for csv_writer(outfile, index) with a WriterThread:
+    # collects rows and hands them to the thread a batch at a time.
+
+    def __init__(self, thread, outfile, index=False):
+        self.thread = thread
+        self.writer = csv_writer(outfile, index)
+        self.rows = []
+
+    def writerow(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.thread.batch:
+            self.flush()
+
+    def writerows(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.thread.batch:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.thread.put(self.writer, self.rows)
+            self.rows = []
+
+
+class IndexedWriter:
+    # csv.writer that also indexes the file it writes, for lookups that
+    # seek instead of reading the whole file (see ghsindex.OffsetIndex): for
+    # each run of rows with the same first field (the CASRN as written),
+    # the byte offset and length of the run and its number of rows. The
+    # first row is the header and isn't indexed. The index is written to
+    # FILE.csv.idx when the output file is closed.
+
+    def __init__(self, outfile):
+        self.outfile = outfile
+        self.encoding = outfile.file.encoding
+        self.writer = csv.writer(self)
+        self.offset = 0
+        self.entries = None
+        outfile.index = self
+
+    def write(self, s):
+        # Only what the csv module writes comes through here, so this keeps
+        # count of the bytes in the file.
+        if s.isascii():
+            self.offset += len(s)
+        else:
+            self.offset += len(s.encode(self.encoding))
+        return self.outfile.write(s)
+
+    def writerow(self, row):
+        start = self.offset
+        self.writer.writerow(row)
+        if self.entries is None:
+            self.entries = []
+        elif self.entries and self.entries[-1][0] == row[0]:
+            entry = self.entries[-1]
+            entry[2] = self.offset - entry[1]
+            entry[3] += 1
+        else:
+            self.entries.append([row[0], start, self.offset - start, 1])
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+
+def csv_writer(outfile, index=False):
+    # csv.writer(outfile), or with index an IndexedWriter.
+    if index:
+        return IndexedWriter(outfile)
+    return csv.writer(outfile)
+
+
+def index_entry(width):
+    # Index entries: key (UTF-8, padded with NULs to width), byte offset,
+    # byte length and number of rows.
+    return struct.Struct('<%dsQII' % width)
+
+
+def write_index(path, entries, manifest=None, sources=None):
+    # Write the entries of an IndexedWriter as a sidecar index. Keys are
+    # padded to the longest one, so the entries can be binary-searched in
+    # place; a key that occurs in several runs has an entry for each.
+    # sources are those of the indexed file (see OutputFile).
+    keys = [str(e[0]).encode('utf-8') for e in entries]
+    width = max(map(len, keys), default=1)
+    entry = index_entry(width)
+    order = sorted(range(len(entries)), key=lambda i: (keys[i], entries[i][1]))
+    with OutputFile(path, manifest, binary=True) as f:
+        f.sources = sources
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, width, len(entries)))
+        f.write(b''.join(entry.pack(keys[i], *entries[i][1:])
+                         for i in order))
 
-def ghs_hazard(ref):
-    # Look up the hazard class based on GHS chapter reference.
-    # Accurate to GHS Revision 4.
-    ghs_chapters = {
-        '2.1': 'Explosives',
-        '2.2': 'Flammable gases',
-        '2.3': 'Aerosols',
-        '2.4': 'Oxidizing gases',
-        '2.5': 'Gases under pressure',
-        '2.6': 'Flammable liquids',
-        '2.7': 'Flammable solids',
-        '2.8': 'Self-reactive substances and mixtures',
-        '2.9': 'Pyrophoric liquids',
-        '2.10': 'Pyrophoric solids',
-        '2.11': 'Self-heating substances and mixtures',
-        '2.12': 'Substances and mixtures which, in contact with water, emit flammable gases',
-        '2.13': 'Oxidizing liquids',
-        '2.14': 'Oxidizing solids',
-        '2.15': 'Organic peroxides',
-        '2.16': 'Corrosive to metals',
-        '3.1': 'Acute toxicity',
-        '3.2': 'Skin corrosion/irritation',
-        '3.3': 'Serious eye damage/irritation',
-        '3.4': 'Respiratory or skin sensitization',
-        '3.5': 'Germ cell mutagenicity',
-        '3.6': 'Carcinogenicity',
-        '3.7': 'Reproductive toxicity',
-        '3.8': 'Specific target organ toxicity - Single exposure',
-        '3.9': 'Specific target organ toxicity - Repeated exposure',
-        '3.10': 'Aspiration hazard',
-        '4.1': 'Hazardous to the aquatic environment',
-        '4.2': 'Hazardous to the ozone layer'
-        }
-    return ghs_chapters[ref]
-
-
-def h_statement(h):
-    # H-statements: List from GHS Revision 4.
-    # Did not include the abbreviated combinations (e.g. H302 + H332).
-    h_statements = {
-        'H200': 'Unstable explosive',
-        'H201': 'Explosive; mass explosion hazard',
-        'H202': 'Explosive; severe projection hazard',
-        'H203': 'Explosive; fire, blast or projection hazard',
-        'H204': 'Fire or projection hazard',
-        'H205': 'May mass explode in fire',
-        'H220': 'Extremely flammable gas',
-        'H221': 'Flammable gas',
-        'H222': 'Extremely flammable aerosol',
-        'H223': 'Flammable aerosol',
-        'H224': 'Extremely flammable liquid and vapour',
-        'H225': 'Highly flammable liquid and vapour',
-        'H226': 'Flammable liquid and vapour',
-        'H227': 'Combustible liquid',
-        'H228': 'Flammable solid',
-        'H229': 'Pressurized container: may burst if heated',
-        'H230': 'May react explosively even in the absence of air',
-        'H231': 'May react explosively even in the absence of air at elevated pressure and/or temperature',
-        'H240': 'Heating may cause an explosion',
-        'H241': 'Heating may cause a fire or explosion',
-        'H242': 'Heating may cause a fire',
-        'H250': 'Catches fire spontaneously if exposed to air',
-        'H251': 'Self-heating; may catch fire',
-        'H252': 'Self-heating in large quantities; may catch fire',
-        'H260': 'In contact with water releases flammable gases which may ignite spontaneously',
-        'H261': 'In contact with water releases flammable gas',
-        'H270': 'May cause or intensify fire; oxidizer',
-        'H271': 'May cause fire or explosion; strong oxidizer',
-        'H272': 'May intensify fire; oxidizer',
-        'H280': 'Contains gas under pressure; may explode if heated',
-        'H281': 'Contains refrigerated gas; may cause cryogenic burns or injury',
-        'H290': 'May be corrosive to metals',
-        'H300': 'Fatal if swallowed',
-        'H301': 'Toxic if swallowed',
-        'H302': 'Harmful if swallowed',
-        'H303': 'May be harmful if swallowed',
-        'H304': 'May be fatal if swallowed and enters airways',
-        'H305': 'May be harmful if swallowed and enters airways',
-        'H310': 'Fatal in contact with skin',
-        'H311': 'Toxic in contact with skin',
-        'H312': 'Harmful in contact with skin',
-        'H313': 'May be harmful in contact with skin',
-        'H314': 'Causes severe skin burns and eye damage',
-        'H315': 'Causes skin irritation',
-        'H316': 'Causes mild skin irritation',
-        'H317': 'May cause an allergic skin reaction',
-        'H318': 'Causes serious eye damage',
-        'H319': 'Causes serious eye irritation',
-        'H320': 'Causes eye irritation',
-        'H330': 'Fatal if inhaled',
-        'H331': 'Toxic if inhaled',
-        'H332': 'Harmful if inhaled',
-        'H333': 'May be harmful if inhaled',
-        'H334': 'May cause allergy or asthma symptoms or breathing difficulties if inhaled',
-        'H335': 'May cause respiratory irritation',
-        'H336': 'May cause drowsiness or dizziness',
-        'H340': 'May cause genetic defects',
-        'H341': 'Suspected of causing genetic defects',
-        'H350': 'May cause cancer',
-        'H351': 'Suspected of causing cancer',
-        'H360': 'May damage fertility or the unborn child',
-        'H361': 'Suspected of damaging fertility or the unborn child',
-        'H362': 'May cause harm to breast-fed children',
-        'H370': 'Causes damage to organs',
-        'H371': 'May cause damage to organs',
-        'H372': 'Causes damage to organs through prolonged or repeated exposure',
-        'H373': 'May cause damage to organs through prolonged or repeated exposure',
-        'H400': 'Very toxic to aquatic life',
-        'H401': 'Toxic to aquatic life',
-        'H402': 'Harmful to aquatic life',
-        'H410': 'Very toxic to aquatic life with long lasting effects',
-        'H411': 'Toxic to aquatic life with long lasting effects',
-        'H412': 'Harmful to aquatic life with long lasting effects',
-        'H413': 'May cause long lasting harmful effects to aquatic life',
-        'H420': 'Harms public health and the environment by destroying ozone in the upper atmosphere'
-        }
-    return h_statements[h]
+
+class Manifest:
+    # Keeps track of the output files in an output directory: the digest,
+    # size and mtime of each file, and the source files (with their
+    # digests) that fed it. It is saved as manifest.json in the output
+    # directory, and is used to leave output files alone when their content
+    # hasn't changed.
+    def __init__(self, output_dir, source_files):
+        self.output_dir = output_dir
+        self.filename = os.path.join(output_dir, 'manifest.json')
+        self.sources = {f: file_digest(f) for f in source_files}
+        self.outputs = dict()
+        self.changed = []
+        try:
+            with open(self.filename) as f:
+                self.previous = json.load(f)['outputs']
+        except (OSError, ValueError, KeyError):
+            self.previous = dict()
+
+    def open(self, path, newline=None, buffering=-1, sources=None):
+        # An OutputFile recorded in this manifest. sources are the source
+        # files that fed it, if not all of them.
+        outfile = OutputFile(path, self, newline, buffering)
+        outfile.sources = sources
+        return outfile
+
+    def digest(self, path):
+        # The recorded digest of an output file, or None if the file isn't
+        # in the manifest or its size or mtime don't match the recorded ones
+        # (e.g. after a hand edit).
+        entry = self.previous.get(os.path.basename(path))
+        st = os.stat(path)
+        if entry is None or entry.get('bytes') != st.st_size or \
+                entry.get('mtime_ns') != st.st_mtime_ns:
+            return None
+        return entry['sha256']
+
+    def record(self, path, digest, size, changed, sources=None):
+        # sources are the source files that fed the file (None for all).
+        if sources is not None:
+            sources = {f: self.sources[f] for f in sources}
+        self.outputs[os.path.basename(path)] = dict(
+            sha256=digest, bytes=size,
+            mtime_ns=os.stat(path).st_mtime_ns,
+            sources=self.sources if sources is None else sources)
+        if changed:
+            self.changed.append(path)
+
+    def save(self):
+        with OutputFile(self.filename) as f:
+            json.dump(dict(outputs=self.outputs), f, indent=1,
+                      sort_keys=True)
+            f.write('\n')
+        print('Updated %d of %d output files in %s.' %
+              (len(self.changed), len(self.outputs), self.output_dir))
+
+
+def cached_read(reader, source_file, cache_dir=None):
+    # Returns what reader(source_file) extracts from a spreadsheet, using an
+    # on-disk cache so that unchanged spreadsheets don't have to be parsed
+    # by xlrd again. Cache entries are keyed by the source file's content
+    # hash, the name of the reader and EXTRACTOR_VERSION, so a changed file
+    # only invalidates its own entry. No caching if cache_dir is None.
+    if cache_dir is None:
+        return reader(source_file)
+    digest = file_digest(source_file)
+    cache_file = os.path.join(cache_dir, '%s-v%d-%s.pickle' %
+                              (reader.__name__, EXTRACTOR_VERSION, digest))
+    try:
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    records = reader(source_file)
+    # Write to a temporary file first, so that a parallel run never
+    # loads a half-written cache entry.
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(records, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache_file)
+    return records
 
 
 def splitsens(info):
@@ -158,197 +392,349 @@ def splitsens(info):
     return resp_list, skin_list
 
 
+@functools.lru_cache(maxsize=None)
+def jp_sublist(hazard_name, classification):
+    # For Japan GHS classifications.
+    # Tidies up the classification (category) cell, and mashes the hazard
+    # class and category together. Returns both. The same few hundred
+    # combinations come up over and over again, hence the cache.
+    category = str(classification).replace('\n', ' ').strip()
+    return category, str(hazard_name).strip() + ' - ' + category
+
+
 def update(chemical, hazard_class, datalist):
     # For Japan GHS classifications.
     # Copies spreadsheet data to the chemical classification record.
     # Does not overwrite the original classification info with blank
-    # sections of the revised classification.
-    if hazard_class not in chemical:
-        chemical[hazard_class] = datalist
-    elif datalist[1] != '':
+    # sections of the revised classification. Returns whether the datalist
+    # was copied.
+    if hazard_class not in chemical or datalist[1] != '':
         chemical[hazard_class] = datalist
+        return True
+    return False
 
 
-def update_all(chemicals, source_file):
+# Layout of the per-chemical sheets in the NITE classification workbooks.
+# Cells are identified by (row, col) where A1 is (0, 0). For each hazard
+# class there is one row, from which columns 2-7 are extracted:
+# col 2: Hazard class name
+# col 3: Classification
+# col 4: Symbol
+# col 5: Signal word
+# col 6: Hazard statement
+# col 7: Rationale for classification
+# Respiratory & skin sensitization share one row, which has to be split
+# with splitsens(); those entries say which half of the split to use.
+# A workbook with a different layout only needs another dict like this.
+NITE_LAYOUT = dict(
+    id=(1, 0),
+    name=(1, 3),
+    casrn=(2, 2),
+    date=(2, 4),
+    columns=(2, 8),
+    hazards=(
+        ('explosive', 5, None),
+        ('flamm_gas', 6, None),
+        ('flamm_aer', 7, None),
+        ('oxid_gas', 8, None),
+        ('gas_press', 9, None),
+        ('flamm_liq', 10, None),
+        ('flamm_sol', 11, None),
+        ('self_react', 12, None),
+        ('pyro_liq', 13, None),
+        ('pyro_sol', 14, None),
+        ('self_heat', 15, None),
+        ('water_fire', 16, None),
+        ('oxid_liq', 17, None),
+        ('oxid_sol', 18, None),
+        ('org_perox', 19, None),
+        ('cor_metal', 20, None),
+        ('acute_oral', 24, None),
+        ('acute_derm', 25, None),
+        ('acute_gas', 26, None),
+        ('acute_vap', 27, None),
+        ('acute_air', 28, None),
+        ('skin_cor', 29, None),
+        ('eye_dmg', 30, None),
+        ('resp_sens', 31, 'resp'),
+        ('skin_sens', 31, 'skin'),
+        ('mutagen', 32, None),
+        ('cancer', 33, None),
+        ('repr_tox', 34, None),
+        ('sys_single', 35, None),
+        ('sys_rept', 36, None),
+        ('asp_haz', 37, None),
+        ('aq_acute', 41, None),
+        ('aq_chronic', 42, None)
+        )
+    )
+
+
+# These are all the hazard class keywords that we will use. In a JpChemical
+# record each hazard class has a fixed slot, in this order.
+JP_HAZARD_CLASSES = tuple(h for h, row, split in NITE_LAYOUT['hazards'])
+JP_HAZARD_SLOTS = {h: i for i, h in enumerate(JP_HAZARD_CLASSES)}
+
+# The hazard class names in the NITE workbooks (column 2, or what
+# splitsens() makes of the sensitization row), which the hazard sublists
+# start with.
+NITE_HAZARD_NAMES = {
+    'Explosives': 'explosive',
+    'Flammable gases': 'flamm_gas',
+    'Flammable aerosols': 'flamm_aer',
+    'Oxidizing gases': 'oxid_gas',
+    'Gases under pressure': 'gas_press',
+    'Flammable liquids': 'flamm_liq',
+    'Flammable solids': 'flamm_sol',
+    'Self-reactive substances and mixtures': 'self_react',
+    'Pyrophoric liquids': 'pyro_liq',
+    'Pyrophoric solids': 'pyro_sol',
+    'Self-heating substances and mixtures': 'self_heat',
+    'Substances and mixtures, which in contact with water, emit flammable '
+    'gases': 'water_fire',
+    'Oxidizing liquids': 'oxid_liq',
+    'Oxidizing solids': 'oxid_sol',
+    'Organic peroxides': 'org_perox',
+    'Corrosive to metals': 'cor_metal',
+    'Acute toxicity (oral)': 'acute_oral',
+    'Acute toxicity (dermal)': 'acute_derm',
+    'Acute toxicity (inhalation: gas)': 'acute_gas',
+    'Acute toxicity (inhalation: vapour)': 'acute_vap',
+    'Acute toxicity (inhalation: dust, mist)': 'acute_air',
+    'Skin corrosion / irritation': 'skin_cor',
+    'Serious eye damage / eye irritation': 'eye_dmg',
+    'Respiratory sensitizer': 'resp_sens',
+    'Skin sensitizer': 'skin_sens',
+    'Germ cell mutagenicity': 'mutagen',
+    'Carcinogenicity': 'cancer',
+    'Toxic to reproduction': 'repr_tox',
+    'Specific target organs/systemic toxicity following single exposure':
+        'sys_single',
+    'Specific target organs/systemic toxicity following repeated exposure':
+        'sys_rept',
+    'Aspiration hazard': 'asp_haz',
+    'Hazardous to the aquatic environment (acute)': 'aq_acute',
+    'Hazardous to the aquatic environment (chronic)': 'aq_chronic'
+    }
+
+# The Japan GHS classification workbooks (2006-2008), in publication order.
+GHS_jp_2006_files = [
+    'GHS-jp/classification_result_e(ID001-100).xls',
+    'GHS-jp/classification_result_e(ID101-200).xls',
+    'GHS-jp/classification_result_e(ID201-300).xls',
+    'GHS-jp/classification_result_e(ID301-400).xls',
+    'GHS-jp/classification_result_e(ID401-500).xls',
+    'GHS-jp/classification_result_e(ID501-600).xls',
+    'GHS-jp/classification_result_e(ID601-700).xls',
+    'GHS-jp/classification_result_e(ID701-800).xls',
+    'GHS-jp/classification_result_e(ID801-900).xls',
+    'GHS-jp/classification_result_e(ID901-1000).xls',
+    'GHS-jp/classification_result_e(ID1001-1100).xls',
+    'GHS-jp/classification_result_e(ID1101-1200).xls',
+    'GHS-jp/classification_result_e(ID1201-1300).xls',
+    'GHS-jp/classification_result_e(ID1301-1400).xls',
+    'GHS-jp/classification_result_e(ID1401-1424).xls'
+    ]
+GHS_jp_2007_files = [
+    'GHS-jp/METI_H19_GHS_review_e.xls',
+    'GHS-jp/METI_H19_GHS_new_e.xls'
+    ]
+GHS_jp_2008_files = [
+    'GHS-jp/METI_H20_GHS_review_e.xls',
+    'GHS-jp/METI_H20_GHS_new_e.xls'
+    ]
+
+
+class JpChemical:
     # For Japan GHS classifications.
-    # Creates or updates the dict of chemical classifications from a given
-    # spreadsheet. Specifying date allows revisions to be clearly seen, but
-    # not going to deal with parsing the dates given in the spreadsheets.
-    chembook = xlrd.open_workbook(source_file)
+    # Compact classification record for one chemical: its name, plus one
+    # slot per hazard class (see JP_HAZARD_CLASSES) holding the datalist.
+    # Behaves like the dict with 'name' and hazard class keys that it
+    # replaces, so it can be used with update(). sources has one byte per
+    # slot: 1 + the index of the source file the datalist came from (see
+    # merge_jp()), or 0.
+    __slots__ = ('name', 'hazards', 'sources')
+
+    def __init__(self, name):
+        self.name = name
+        self.hazards = [None] * len(JP_HAZARD_CLASSES)
+        self.sources = bytearray(len(JP_HAZARD_CLASSES))
+
+    def __getitem__(self, key):
+        if key == 'name':
+            return self.name
+        datalist = self.hazards[JP_HAZARD_SLOTS[key]]
+        if datalist is None:
+            raise KeyError(key)
+        return datalist
+
+    def __setitem__(self, key, value):
+        if key == 'name':
+            self.name = value
+        else:
+            self.hazards[JP_HAZARD_SLOTS[key]] = value
+
+    def __contains__(self, key):
+        if key == 'name':
+            return True
+        return self.hazards[JP_HAZARD_SLOTS[key]] is not None
+
+
+def intern_datalist(datalist, pool):
+    # For Japan GHS classifications.
+    # The same few classification, symbol, signal word, hazard statement and
+    # date values show up thousands of times, so keep just one copy of each
+    # in the pool (a dict). Rationales are left alone; they are mostly
+    # unique anyway. Whole datalists repeat too (e.g. "Not applicable"
+    # rows with the same rationale), so those are pooled as well.
+    datalist = tuple(v if i == 5 else pool.setdefault(v, v)
+                     for i, v in enumerate(datalist))
+    return pool.setdefault(datalist, datalist)
+
+
+def read_jp_sheet(chemsheet, layout=NITE_LAYOUT):
+    # For Japan GHS classifications.
+    # Extracts one chemical sheet in a single pass over the rows given by
+    # the layout. Returns an immutable record (chemical name, tuple of
+    # CASRNs, hazards), where hazards is a tuple of (hazard class, datalist)
+    # pairs in layout order. Specifying date allows revisions to be clearly
+    # seen, but not going to deal with parsing the dates given in the
+    # spreadsheets.
+    id = chemsheet.cell_value(*layout['id']).strip()
+    chemname = chemsheet.cell_value(*layout['name']).strip()
+    casrn_field = chemsheet.cell_value(*layout['casrn']).strip('- ')
+    # Must use something as unique ID if CASRN is blank. Provided index
+    # IDs are not the same across datasets (2007 - 2009). So, add a few
+    # characters of the chemical name (without introducing commas).
+    if casrn_field == '':
+        casrn_field = id + (chemname[:4] + chemname[-4:]).replace(',', '')
+    date = chemsheet.cell_value(*layout['date'])
+    # But I also want one CASRN per chemical listing.
+    casrns = tuple(c.strip() for c in casrn_field.split(','))
+    first, last = layout['columns']
+    hazards = []
+    split_rows = dict()
+    for hazard_class, row, split in layout['hazards']:
+        if split is None:
+            cells = chemsheet.row_values(row)[first:last]
+            hazards.append((hazard_class, tuple(cells) + (date,)))
+            continue
+        # For respiratory & skin sensitization, we need to split strings.
+        # Don't include the hazard class name cell, it's automatically
+        # added by splitsens(). Only read and split each row once.
+        if row not in split_rows:
+            cells = chemsheet.row_values(row)[first + 1:last]
+            split_rows[row] = dict(zip(('resp', 'skin'), splitsens(cells)))
+        hazards.append((hazard_class, tuple(split_rows[row][split]) + (date,)))
+    return (chemname, casrns, tuple(hazards))
+
+
+def read_jp_workbook(source_file, layout=NITE_LAYOUT):
+    # For Japan GHS classifications.
+    # Extracts the classification info from every chemical sheet of a given
+    # spreadsheet into a batch of records (see read_jp_sheet()), without
+    # touching the dict of chemicals.
+    return read_jp_book(xlrd.open_workbook(source_file), layout)
+
+
+def read_jp_book(chembook, layout=NITE_LAYOUT):
+    # Same as read_jp_workbook(), for an open workbook (or anything with
+    # the same nsheets/sheet_by_index() interface).
     # Ignore the first sheet (it's just a list of chemicals in the workbook).
-    for chempage in range(1, chembook.nsheets):
-        chemsheet = chembook.sheet_by_index(chempage)
-        # Cells are identified by (row, col) where A1 is (0, 0).
-        id = chemsheet.cell_value(1,0).strip()
-        chemname = chemsheet.cell_value(1, 3).strip()
-        casrn_field = chemsheet.cell_value(2, 2).strip('- ')
-        # Must use something as unique ID if CASRN is blank. Provided index
-        # IDs are not the same across datasets (2007 - 2009). So, add a few
-        # characters of the chemical name (without introducing commas).
-        if casrn_field == '':
-            casrn_field = id + (chemname[:4] + chemname[-4:]).replace(',', '')
-        date = chemsheet.cell_value(2, 4)
-        # But I also want one CASRN per chemical listing.
-        for c in casrn_field.split(','):
-            casrn = c.strip()
+    return [read_jp_sheet(chembook.sheet_by_index(chempage), layout)
+            for chempage in range(1, chembook.nsheets)]
+
+
+def merge_jp(chemicals, batch, pool=None, source=None):
+    # For Japan GHS classifications.
+    # Creates or updates the dict of chemical classifications from a batch
+    # of records made by read_jp_workbook(). Batches have to be merged in
+    # the order in which the classifications were published, so that
+    # revisions win over the original classifications.
+    # The same record is shared by all the CASRNs listed on a sheet.
+    # If a pool is given, repeated values are interned with it. source is
+    # the index of the batch's source file, recorded for the manifest.
+    for chemname, casrns, hazards in batch:
+        if pool is not None:
+            hazards = [(h, intern_datalist(datalist, pool))
+                       for h, datalist in hazards]
+        for casrn in casrns:
             if casrn not in chemicals:
-                chemicals[casrn] = dict(name=chemname)
-            # We are going to extract columns 2-7 for each of the rows.
-            # col 2: Hazard class name
-            # col 3: Classification
-            # col 4: Symbol
-            # col 5: Signal word
-            # col 6: Hazard statement
-            # col 7: Rationale for classification
-            update(chemicals[casrn], 'explosive',
-                   chemsheet.row_values(5)[2:8] + [date])
-            update(chemicals[casrn], 'flamm_gas',
-                   chemsheet.row_values(6)[2:8] + [date])
-            update(chemicals[casrn], 'flamm_aer',
-                   chemsheet.row_values(7)[2:8] + [date])
-            update(chemicals[casrn], 'oxid_gas',
-                   chemsheet.row_values(8)[2:8] + [date])
-            update(chemicals[casrn], 'gas_press',
-                   chemsheet.row_values(9)[2:8] + [date])
-            update(chemicals[casrn], 'flamm_liq',
-                   chemsheet.row_values(10)[2:8] + [date])
-            update(chemicals[casrn], 'flamm_sol',
-                   chemsheet.row_values(11)[2:8] + [date])
-            update(chemicals[casrn], 'self_react',
-                   chemsheet.row_values(12)[2:8] + [date])
-            update(chemicals[casrn], 'pyro_liq',
-                   chemsheet.row_values(13)[2:8] + [date])
-            update(chemicals[casrn], 'pyro_sol',
-                   chemsheet.row_values(14)[2:8] + [date])
-            update(chemicals[casrn], 'self_heat',
-                   chemsheet.row_values(15)[2:8] + [date])
-            update(chemicals[casrn], 'water_fire',
-                   chemsheet.row_values(16)[2:8] + [date])
-            update(chemicals[casrn], 'oxid_liq',
-                   chemsheet.row_values(17)[2:8] + [date])
-            update(chemicals[casrn], 'oxid_sol',
-                   chemsheet.row_values(18)[2:8] + [date])
-            update(chemicals[casrn], 'org_perox',
-                   chemsheet.row_values(19)[2:8] + [date])
-            update(chemicals[casrn], 'cor_metal',
-                   chemsheet.row_values(20)[2:8] + [date])
-            update(chemicals[casrn], 'acute_oral',
-                   chemsheet.row_values(24)[2:8] + [date])
-            update(chemicals[casrn], 'acute_derm',
-                   chemsheet.row_values(25)[2:8] + [date])
-            update(chemicals[casrn], 'acute_gas',
-                   chemsheet.row_values(26)[2:8] + [date])
-            update(chemicals[casrn], 'acute_vap',
-                   chemsheet.row_values(27)[2:8] + [date])
-            update(chemicals[casrn], 'acute_air',
-                   chemsheet.row_values(28)[2:8] + [date])
-            update(chemicals[casrn], 'skin_cor',
-                   chemsheet.row_values(29)[2:8] + [date])
-            update(chemicals[casrn], 'eye_dmg',
-                   chemsheet.row_values(30)[2:8] + [date])
-            # For respiratory & skin sensitization, we need to split strings.
-            # Don't include cell 2, it's automatically added by splitsens().
-            resp_only, skin_only = splitsens(chemsheet.row_values(31)[3:8])
-            update(chemicals[casrn], 'resp_sens',
-                   resp_only + [date])
-            update(chemicals[casrn], 'skin_sens',
-                   skin_only + [date])
-            update(chemicals[casrn], 'mutagen',
-                   chemsheet.row_values(32)[2:8] + [date])
-            update(chemicals[casrn], 'cancer',
-                   chemsheet.row_values(33)[2:8] + [date])
-            update(chemicals[casrn], 'repr_tox',
-                   chemsheet.row_values(34)[2:8] + [date])
-            update(chemicals[casrn], 'sys_single',
-                   chemsheet.row_values(35)[2:8] + [date])
-            update(chemicals[casrn], 'sys_rept',
-                   chemsheet.row_values(36)[2:8] + [date])
-            update(chemicals[casrn], 'asp_haz',
-                   chemsheet.row_values(37)[2:8] + [date])
-            update(chemicals[casrn], 'aq_acute',
-                   chemsheet.row_values(41)[2:8] + [date])
-            update(chemicals[casrn], 'aq_chronic',
-                   chemsheet.row_values(42)[2:8] + [date])
-
-
-def crunch_jp():
+                chemicals[casrn] = JpChemical(chemname)
+            chemical = chemicals[casrn]
+            for hazard_class, datalist in hazards:
+                if update(chemical, hazard_class, datalist) and \
+                        source is not None:
+                    chemical.sources[JP_HAZARD_SLOTS[hazard_class]] = \
+                        source + 1
+
+
+def update_all(chemicals, source_file):
+    # For Japan GHS classifications.
+    # Creates or updates the dict of chemical classifications from a given
+    # spreadsheet.
+    merge_jp(chemicals, read_jp_workbook(source_file))
+
+
+def crunch_jp(jobs=1, cache_dir=None, write_csv=True, pipeline=False):
     # Process the Japan GHS classifications (2006-2008).
-    GHS_jp_2006_files = [
-        'GHS-jp/classification_result_e(ID001-100).xls',
-        'GHS-jp/classification_result_e(ID101-200).xls',
-        'GHS-jp/classification_result_e(ID201-300).xls',
-        'GHS-jp/classification_result_e(ID301-400).xls',
-        'GHS-jp/classification_result_e(ID401-500).xls',
-        'GHS-jp/classification_result_e(ID501-600).xls',
-        'GHS-jp/classification_result_e(ID601-700).xls',
-        'GHS-jp/classification_result_e(ID701-800).xls',
-        'GHS-jp/classification_result_e(ID801-900).xls',
-        'GHS-jp/classification_result_e(ID901-1000).xls',
-        'GHS-jp/classification_result_e(ID1001-1100).xls',
-        'GHS-jp/classification_result_e(ID1101-1200).xls',
-        'GHS-jp/classification_result_e(ID1201-1300).xls',
-        'GHS-jp/classification_result_e(ID1301-1400).xls',
-        'GHS-jp/classification_result_e(ID1401-1424).xls'
-        ]
-    GHS_jp_2007_files = [
-                        'GHS-jp/METI_H19_GHS_review_e.xls',
-                        'GHS-jp/METI_H19_GHS_new_e.xls'
-                        ]
-    GHS_jp_2008_files = [
-                        'GHS-jp/METI_H20_GHS_review_e.xls',
-                        'GHS-jp/METI_H20_GHS_new_e.xls'
-                        ]
+    # With jobs > 1, the workbooks are read by a pool of worker processes.
+    # Returns the dict of chemicals, for the other output backends. CSV
+    # output files are only written if write_csv is true, and with
+    # pipeline, by a writer thread (see write_jp_csv()).
     # Initialize a dictionary of CASRN-identified chemicals. 
-    # Each key will be a CASRN, and each corresponding value will itself be 
-    # a dictionary with:
+    # Each key will be a CASRN, and each corresponding value will be a
+    # JpChemical record with:
     #   - A key called 'name', with the substance name as its value.
     #   - Keys for each hazard class, with lists of relevant classification
     #     information as their values.
     chemicals = dict()
-    # These are all the hazard class keywords that we will use.
-    hazard_classes = [
-        'explosive',
-        'flamm_gas',
-        'flamm_aer',
-        'oxid_gas',
-        'gas_press',
-        'flamm_liq',
-        'flamm_sol',
-        'self_react',
-        'pyro_liq',
-        'pyro_sol',
-        'self_heat',
-        'water_fire',
-        'oxid_liq',
-        'oxid_sol',
-        'org_perox',
-        'cor_metal',
-        'acute_oral',
-        'acute_derm',
-        'acute_gas',
-        'acute_vap',
-        'acute_air',
-        'skin_cor',
-        'eye_dmg',
-        'resp_sens',
-        'skin_sens',
-        'mutagen',
-        'cancer',
-        'repr_tox',
-        'sys_single',
-        'sys_rept',
-        'asp_haz',
-        'aq_acute',
-        'aq_chronic'
-        ]    
-    # First feed in the 2006 mass classification.
-    for filename in GHS_jp_2006_files:
-        update_all(chemicals, filename)
-    # Then add subsequent revisions and additions.
-    for filename in GHS_jp_2007_files:
-        update_all(chemicals, filename)
-    for filename in GHS_jp_2008_files:
-        update_all(chemicals, filename)
+    pool = dict()
+    # First feed in the 2006 mass classification, then add subsequent
+    # revisions and additions. The order of this list matters.
+    source_files = GHS_jp_2006_files + GHS_jp_2007_files + GHS_jp_2008_files
+    read = functools.partial(cached_read, read_jp_workbook,
+                             cache_dir=cache_dir)
+    profiler = ghsprofile.profiler
+    rows_per_sheet = len(NITE_LAYOUT['hazards'])
+    if jobs > 1:
+        # Parse the workbooks in parallel, but merge the batches one at a
+        # time in publication order (map() returns results in input order).
+        # The workers time their reads themselves.
+        read = functools.partial(ghsprofile.timed_call, read)
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            for n, (filename, (batch, seconds, maxrss)) in enumerate(zip(
+                    source_files, executor.map(read, source_files))):
+                profiler.record('jp', 'read', filename, seconds, maxrss,
+                                len(batch) * rows_per_sheet, len(batch))
+                with profiler.stage('jp', 'merge'):
+                    merge_jp(chemicals, batch, pool, n)
+    else:
+        for n, filename in enumerate(source_files):
+            with profiler.stage('jp', 'read', filename) as stage:
+                batch = read(filename)
+                stage.count(len(batch) * rows_per_sheet, len(batch))
+            with profiler.stage('jp', 'merge'):
+                merge_jp(chemicals, batch, pool, n)
+    if write_csv:
+        with profiler.stage('jp', 'write') as stage:
+            write_jp_csv(chemicals, source_files, pipeline)
+            stage.count(len(chemicals))
+    return chemicals
+
+
+def jp_sources(source_files, used):
+    # The source files for a set of JpChemical.sources values. Records that
+    # weren't merged with a source index (0) could come from any file.
+    if 0 in used:
+        return None
+    return [source_files[n - 1] for n in sorted(used)]
+
+
+def write_jp_csv(chemicals, source_files, pipeline=False):
+    # Write the CSV output files for the Japan GHS classifications. With
+    # pipeline, the per-hazard class files are written by a WriterThread.
+    hazard_classes = JP_HAZARD_CLASSES
     # Then, output a list of chemicals & their classification info for 
     # each hazard class.
     # There will be no separate hazard class field in the output, because
@@ -358,69 +744,326 @@ def crunch_jp():
               'Rationale for classification', 'Date of classification']
     # This will keep track of unique classifications.
     sublists = set()
+    # Output files are only replaced if their content changes.
+    manifest = Manifest('GHS-jp/output', source_files)
     # I want the output to be in separate CSV files for each hazard class.
     # Furthermore, I want separate files for "classification not possible",
     # "not classified", and "not applicable".
-    nafile = open('GHS-jp/output/notapplicable.csv', 'w', newline='')
-    nawriter = csv.writer(nafile)
-    nawriter.writerow(header)
-    ncfile = open('GHS-jp/output/notclassified.csv', 'w', newline='')
-    ncwriter = csv.writer(ncfile)
-    ncwriter.writerow(header)
-    npfile = open('GHS-jp/output/notpossible.csv', 'w', newline='')
-    npwriter = csv.writer(npfile)
-    npwriter.writerow(header)
-    for h in hazard_classes:
-        with open('GHS-jp/output/' + h + '.csv', 'w', newline='') as outfile:
-            listwriter = csv.writer(outfile)
+    # All the files are written in one pass over the sorted chemicals,
+    # routing each (chemical, hazard class) row to the right file.
+    # About 40 files are open at once, so they get the default buffer
+    # size rather than OUTPUT_BUFFER.
+    outfiles = [manifest.open('GHS-jp/output/' + h + '.csv', newline='')
+                for h in hazard_classes]
+    if pipeline:
+        writer_thread = WriterThread()
+        listwriters = [writer_thread.writer(outfile, index=True)
+                       for outfile in outfiles]
+    else:
+        listwriters = [csv_writer(outfile, index=True) for outfile in outfiles]
+    for listwriter in listwriters:
+        listwriter.writerow(header)
+    # The other three files list their rows by hazard class, so just
+    # remember which chemicals go where for each hazard class.
+    notfiles = {
+        'Not applicable': 'GHS-jp/output/notapplicable.csv',
+        'Not classified': 'GHS-jp/output/notclassified.csv',
+        'Classification not possible': 'GHS-jp/output/notpossible.csv'
+        }
+    notlists = {category: [[] for h in hazard_classes]
+                for category in notfiles}
+    # The source files (as in JpChemical.sources) that fed each file.
+    used = [set() for h in hazard_classes]
+    notused = {category: set() for category in notfiles}
+    casrns = sorted(chemicals.keys())
+    for c in casrns:
+        chemical = chemicals[c]
+        for i, datalist in enumerate(chemical.hazards):
+            category, s = jp_sublist(datalist[0], datalist[1])
+            # These conditions test for exact matches. Things like
+            # "Category 4 (m-cresol) Not applicable (o- and p-cresol)" 
+            # will not be filtered out, since you want to know about that
+            # Category 4. Unfortunately, you have to edit these by hand.
+            # As a side effect, things like "Not applicable (aqueous 
+            # solution)" will be kept even though they're useless.
+            if category in notlists:
+                notlists[category][i].append(c)
+                notused[category].add(chemical.sources[i])
+            elif category != '':
+                # Don't bother outputting rows of empty classifications
+                # (where no classification results were given).
+                sublists.add(s)
+                used[i].add(chemical.sources[i])
+                listwriters[i].writerow([c, chemical.name, s] +
+                                        list(datalist[2:]))
+    if pipeline:
+        writer_thread.finish()
+    for outfile, sources in zip(outfiles, used):
+        outfile.sources = jp_sources(source_files, sources)
+        outfile.close()
+    for category, filename in notfiles.items():
+        sources = jp_sources(source_files, notused[category])
+        # These are written one at a time, so they can have OUTPUT_BUFFER.
+        with manifest.open(filename, newline='', buffering=OUTPUT_BUFFER,
+                           sources=sources) as outfile:
+            listwriter = csv_writer(outfile, index=True)
             listwriter.writerow(header)
-            for c in sorted(chemicals.keys()):
-                # Mash the hazard class and category together...
-                category = str(chemicals[c][h][1]).replace('\n', ' ').strip()
-                s = str(chemicals[c][h][0]).strip() + ' - ' + category
-                # These conditions test for exact matches. Things like
-                # "Category 4 (m-cresol) Not applicable (o- and p-cresol)" 
-                # will not be filtered out, since you want to know about that
-                # Category 4. Unfortunately, you have to edit these by hand.
-                # As a side effect, things like "Not applicable (aqueous 
-                # solution)" will be kept even though they're useless.
-                if category == 'Not applicable':
-                    nawriter.writerow([c] + [chemicals[c]['name']] + 
-                                      [s] + chemicals[c][h][2:])
-                elif category == 'Not classified':
-                    ncwriter.writerow([c] + [chemicals[c]['name']] + 
-                                      [s] + chemicals[c][h][2:])
-                elif category == 'Classification not possible':
-                    npwriter.writerow([c] + [chemicals[c]['name']] + 
-                                      [s] + chemicals[c][h][2:])
-                elif category != '':
-                    # Don't bother outputting rows of empty classifications
-                    # (where no classification results were given).
-                    sublists.add(s)
-                    listwriter.writerow([c] + [chemicals[c]['name']] + 
-                                        [s] + chemicals[c][h][2:])
-    nafile.close()
-    ncfile.close()
-    npfile.close()
+            for i, casrns_for_class in enumerate(notlists[category]):
+                for c in casrns_for_class:
+                    datalist = chemicals[c].hazards[i]
+                    s = jp_sublist(datalist[0], datalist[1])[1]
+                    listwriter.writerow([c, chemicals[c].name, s] +
+                                        list(datalist[2:]))
     # Output a list of unique classifications (hazard class + category) that
     # appear in the hazard-specific output files.
-    with open('GHS-jp/output/classifications.txt', 'w') as classtxt:
+    with manifest.open('GHS-jp/output/classifications.txt') as classtxt:
         for sub in sorted(sublists):
             print(sub, file=classtxt)
     # Also output an index of chemicals, just to check for problems.
-    with open('GHS-jp/output/index.csv', 'w', newline='') as outfile:
+    with manifest.open('GHS-jp/output/index.csv', newline='') as outfile:
         listwriter = csv.writer(outfile)
         listwriter.writerow(['CASRN', 'Name'])
-        for c in sorted(chemicals.keys()):
+        for c in casrns:
             listwriter.writerow([c] + [chemicals[c]['name']])
+    manifest.save()
+
+
+# One line of the Korea GHS classification list, with the name and CASRN
+# filled in from the merged cells above it:
+#   sheet:        Sheet name
+#   row:          Row number in the sheet (from 0, as in xlrd)
+#   name:         Name field, possibly a ';'-separated list of synonyms
+#   casrn:        CASRN field, possibly a ', '-separated list of CASRNs
+#   hazard_class: Hazard class, in Korean, with the GHS chapter e.g. '(3.1)'
+#   category:     Hazard category number (int)
+#   h_code:       H-statement code
+#   m_factor:     M-factor (int), or None
+KrRow = collections.namedtuple('KrRow',
+    'sheet row name casrn hazard_class category h_code m_factor')
+
+# The NIER list that comes with this repo.
+KR_SOURCE_FILE = 'GHS-kr/GHS-kr-2011-04-15.xls'
+
+# Columns of the Korea list:
+# Name:           (r, 1)
+# CASRN:          (r, 3)
+# Hazard class    (r, 4)
+# Hazard category (r, 5)
+# Pictogram code  (r, 6) - (not used anymore?)
+# Signal word     (r, 7) - (in Korean)
+# H-stmnt code    (r, 8)
+# M-factor        (r, 9)
+KR_COLUMNS = 10
+
+# Data rows have the GHS chapter in the hazard class field.
+KR_CHAPTER = re.compile(r'\(\d+\.\d+\)')
+
+
+def is_kr_data_row(values, types):
+    # A classification line has a hazard class with a GHS chapter and a
+    # numeric hazard category. Everything else (titles, the header, notes)
+    # is not data.
+    return (types[4] == xlrd.XL_CELL_TEXT and
+            KR_CHAPTER.search(values[4]) is not None and
+            types[5] == xlrd.XL_CELL_NUMBER)
+
+
+def iter_kr_rows(source_file):
+    # For Korea GHS classifications.
+    # Yields a KrRow for each line of the classification list (see
+    # iter_kr_book()). Sheets are loaded one at a time.
+    chembook = xlrd.open_workbook(source_file, on_demand=True)
+    try:
+        for row in iter_kr_book(chembook, source_file):
+            yield row
+    finally:
+        chembook.release_resources()
+
+
+def iter_kr_book(chembook, source_file=''):
+    # Yields a KrRow for each line of the classification list in an open
+    # workbook. The data rows are found by their content rather than by
+    # fixed row numbers, so the header above them and any notes below them
+    # are skipped, and every sheet that contains such rows is read.
+    for index in range(chembook.nsheets):
+        chemsheet = chembook.sheet_by_index(index)
+        name = casrn = ''
+        first = None
+        skipped = []
+        for r in range(chemsheet.nrows):
+            n = min(chemsheet.row_len(r), KR_COLUMNS)
+            values = chemsheet.row_values(r, 0, n) + [''] * (KR_COLUMNS - n)
+            types = list(chemsheet.row_types(r, 0, n)) + \
+                [xlrd.XL_CELL_EMPTY] * (KR_COLUMNS - n)
+            if not is_kr_data_row(values, types):
+                if first is not None and any(v != '' for v in values):
+                    skipped.append(r)
+                continue
+            if first is None:
+                first = r
+            elif skipped:
+                # Lines between data rows that don't look like data
+                # probably mean the layout has changed.
+                print('Skipped rows %s in sheet %s of %s' %
+                      (', '.join(str(x) for x in skipped),
+                       chemsheet.name, source_file))
+                skipped = []
+            # Don't overwrite name and CASRN with blanks from merged cells.
+            if values[1] != '':
+                name = values[1]
+            if values[3] != '':
+                casrn = values[3]
+            # Category values are integers stored as floats.
+            yield KrRow(chemsheet.name, r, name, casrn, values[4],
+                        int(values[5]), values[8],
+                        int(values[9]) if values[9] != '' else None)
+        chembook.unload_sheet(index)
+
+
+def read_kr_sheet(source_file):
+    # All lines of the Korea list as a list of KrRow, for the cache.
+    return list(iter_kr_rows(source_file))
+
 
+# Number of rows of the Korea list to turn into records at a time.
+KR_CHUNK = 1000
 
-def crunch_kr():
+
+def kr_records(rows):
+    # Turn KrRow lines into records, one per CASRN and classification:
+    # [CASRN, name, synonyms, hazard class, category, H-statement code,
+    # H-statement, M-factor, hazard sublist]. rows can be any iterable.
+    for batch in kr_batches(rows):
+        for record in batch:
+            yield record
+
+
+def kr_batches(rows):
+    # kr_records() a chunk at a time: lists of the records of KR_CHUNK rows,
+    # for writerows(). rows is consumed a chunk at a time. The rows of a
+    # chunk share a few dozen hazard class fields and H-statement codes, so
+    # those are translated once per chunk.
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, KR_CHUNK))
+        if not chunk:
+            break
+        classes = {f: kr_hazard_class(f)
+                   for f in set(row.hazard_class for row in chunk)}
+        h_texts = {h: h_statement(h) for h in set(row.h_code for row in chunk)}
+        batch = []
+        for row in chunk:
+            haz_class_en, ref = classes[row.hazard_class]
+            if ref is not None:
+                print('Found a different hazard class ' + ref + ' in row ' +
+                      str(row.row))
+            batch.extend(kr_row_records(row, haz_class_en,
+                                        h_texts[row.h_code]))
+        yield batch
+
+
+def kr_hazard_class(haz_class_field):
+    # The English hazard class of a Korean hazard class field, and the GHS
+    # chapter reference if it is one of those that are split by route or
+    # kind (3.1, 3.4, 4.1) but the field didn't say which (else None).
+    ref = haz_class_field[haz_class_field.find('('):].strip('()')
+    haz_class_en = ghs_hazard(ref)
+    if ref == '3.1':
+        if u'급성 독성-경구' in haz_class_field:
+            return 'Acute toxicity (oral)', None
+        elif u'급성 독성-경피' in haz_class_field:
+            return 'Acute toxicity (dermal)', None
+        elif u'급성 독성-흡입' in haz_class_field:
+            return 'Acute toxicity (inhalation)', None
+        return haz_class_en, ref
+    if ref == '3.4':
+        if u'피부 과민성' in haz_class_field:
+            return 'Skin sensitization', None
+        elif u'호흡기 과민성' in haz_class_field:
+            return 'Respiratory sensitization', None
+        return haz_class_en, ref
+    if ref == '4.1':
+        if u'수생환경유해성-급성' in haz_class_field:
+            return 'Hazardous to the aquatic environment (acute)', None
+        elif u'수생환경유해성-만성' in haz_class_field:
+            return 'Hazardous to the aquatic environment (chronic)', None
+        return haz_class_en, ref
+    return haz_class_en, None
+
+
+def kr_row_records(row, haz_class_en, h_text):
+    # The records of one KrRow, given its translated hazard class and
+    # H-statement.
+    # Split lists of synonyms into 2 fields.
+    names = row.name.split(';', 1)
+    for i in range(len(names)):
+        names[i] = names[i].strip()
+    while len(names) < 2:
+        names.append('')
+    category = 'Category ' + str(row.category)
+    h_code = row.h_code
+    h_state = h_code + ' - ' + h_text
+    # Make the combined hazard class/category/H-statement field:
+    s = haz_class_en + ' - ' + category + ' [' + h_state + ']'
+    # Make M-factor field (though not really using it for anything now).
+    if row.m_factor is not None:
+        m_factor = str(row.m_factor)
+    else:
+        m_factor = ''
+    # Ensure one CASRN per line when writing output:
+    return [[casrn] + names + [haz_class_en, category, h_code, h_text,
+                               m_factor, s]
+            for casrn in row.casrn.split(', ')]
+
+
+def crunch_kr(cache_dir=None, write_csv=True, pipeline=False, keep=True):
     # Process the Korea GHS classification (2011).
-    chembook = xlrd.open_workbook('GHS-kr/GHS-kr-2011-04-15.xls')
-    chemsheet = chembook.sheet_by_index(0)
-    outfile = open('GHS-kr/output/GHS-kr.csv', 'w', newline='')
-    listwriter = csv.writer(outfile)
+    # Returns a list of records, one per CASRN and classification (see
+    # kr_records()), or None if keep is false. CSV output files are only
+    # written if write_csv is true.
+    # Without a cache, the rows are streamed from the workbook, so reading
+    # it is part of the records stage. With pipeline, the records are
+    # handed to a writer thread as they are made, so that they don't all
+    # have to be held in memory (unless keep is true).
+    source_file = KR_SOURCE_FILE
+    profiler = ghsprofile.profiler
+    if cache_dir is not None:
+        with profiler.stage('kr', 'read', source_file) as stage:
+            rows = cached_read(read_kr_sheet, source_file, cache_dir)
+            stage.count(len(rows))
+    else:
+        rows = iter_kr_rows(source_file)
+    if pipeline and write_csv:
+        kept = [] if keep else None
+        with profiler.stage('kr', 'records+write') as stage:
+            stage.count(write_kr_csv(kr_batches(rows), source_file,
+                                     pipeline, kept))
+        return kept
+    with profiler.stage('kr', 'records') as stage:
+        records = list(kr_records(rows))
+        stage.count(len(records))
+    if write_csv:
+        with profiler.stage('kr', 'write') as stage:
+            write_kr_csv([records], source_file)
+            stage.count(len(records))
+    return records
+
+
+def write_kr_csv(batches, source_file, pipeline=False, kept=None):
+    # Write the CSV output files for the Korea GHS classifications. batches
+    # is an iterable of lists of records, e.g. the generator kr_batches(),
+    # each written with one writerows(). With pipeline,
+    # GHS-kr.csv is written by a WriterThread. If a list is given as kept,
+    # the records are appended to it. Returns the number of records.
+    manifest = Manifest('GHS-kr/output', [source_file])
+    if pipeline:
+        outfile = manifest.open('GHS-kr/output/GHS-kr.csv', newline='',
+                                buffering=OUTPUT_BUFFER)
+        writer_thread = WriterThread()
+        listwriter = writer_thread.writer(outfile)
+    else:
+        outfile = manifest.open('GHS-kr/output/GHS-kr.csv', newline='')
+        listwriter = csv.writer(outfile)
     # For practical purposes, I am going to combine the hazard class,
     # category, and H-statement fields into one 'Hazard sublist' field. 
     listwriter.writerow(['CASRN', 'Name', 'Synonyms', 'Hazard sublist', 
@@ -428,229 +1071,141 @@ def crunch_kr():
     # I also want to enumerate the unique class/category/H-statement
     # combinations (sublists).
     sublists = set()
-    # Read in the spreadsheet; process and output results for each line.
-    for r in range(16,1208):
-        # Name:           (r, 1)
-        # CASRN:          (r, 3)
-        # Don't overwrite name and CASRN with blanks from merged cells.
-        if chemsheet.cell_value(r, 1) != '':
-            name_field = chemsheet.cell_value(r, 1)
-            # Split lists of synonyms into 2 fields.
-            names = name_field.split(';', 1)
-            for i in range(len(names)):
-                names[i] = names[i].strip()
-            while len(names) < 2:
-                names.append('')
-        if chemsheet.cell_value(r, 3) != '':
-            casrn_field = chemsheet.cell_value(r, 3)
-        # Hazard class    (r, 4)
-        # Hazard category (r, 5)
-        # Pictogram code  (r, 6) - (not used anymore?)
-        # Signal word     (r, 7) - (in Korean)
-        # H-stmnt code    (r, 8)
-        # M-factor        (r, 9)
-        haz_class_field = chemsheet.cell_value(r, 4)
-        ref = haz_class_field[haz_class_field.find('('):].strip('()')
-        haz_class_en = ghs_hazard(ref)
-        if ref == '3.1':
-            if u'급성 독성-경구' in haz_class_field:
-                haz_class_en = 'Acute toxicity (oral)'
-            elif u'급성 독성-경피' in haz_class_field:
-                haz_class_en = 'Acute toxicity (dermal)'
-            elif u'급성 독성-흡입' in haz_class_field:
-                haz_class_en = 'Acute toxicity (inhalation)'
-            else:
-                print('Found a different hazard class 3.1 in row ' + str(r))
-        if ref == '3.4':
-            if u'피부 과민성' in haz_class_field:
-                haz_class_en = 'Skin sensitization'
-            elif u'호흡기 과민성' in haz_class_field:
-                haz_class_en = 'Respiratory sensitization'
-            else:
-                print('Found a different hazard class 3.4 in row ' + str(r))
-        if ref == '4.1':
-            if u'수생환경유해성-급성' in haz_class_field:
-                haz_class_en = 'Hazardous to the aquatic environment (acute)'
-            elif u'수생환경유해성-만성' in haz_class_field:
-                haz_class_en = 'Hazardous to the aquatic environment (chronic)'
-            else:
-                print('Found a different hazard class 4.1 in row ' + str(r))
-        # Category values are integers stored as floats.
-        category = 'Category ' + str(int(chemsheet.cell_value(r, 5)))
-        h_code = chemsheet.cell_value(r, 8)
-        h_state = h_code + ' - ' + h_statement(h_code)
-        # Make the combined hazard class/category/H-statement field:
-        s = haz_class_en + ' - ' + category + ' [' + h_state + ']'
-        sublists.add(s)
-        # Make M-factor field (though not really using it for anything now).
-        if chemsheet.cell_value(r, 9) != '':
-            m_factor = str(int(chemsheet.cell_value(r, 9)))
-        else:
-            m_factor = ''
-        # Ensure one CASRN per line when writing output:
-        for casrn in casrn_field.split(', '):
-            listwriter.writerow([casrn] + names + [s, m_factor])
+    n = 0
+    for batch in batches:
+        sublists.update(record[8] for record in batch)
+        listwriter.writerows([record[:3] + [record[8], record[7]]
+                              for record in batch])
+        if kept is not None:
+            kept.extend(batch)
+        n += len(batch)
+    if pipeline:
+        writer_thread.finish()
     outfile.close()
     # Output some helpful information about the hazard sublists.
-    with open('GHS-kr/output/sublists.txt', 'w') as subtxt:
+    with manifest.open('GHS-kr/output/sublists.txt') as subtxt:
         for sub in sorted(sublists):
             print(sub, file=subtxt)
+    manifest.save()
+    return n
+
+
+# The HSNO CCID export that comes with this repo.
+NZ_SOURCE_FILE = 'GHS-nz/CCID Key Studies (4 June 2013).xls'
+
+
+def read_nz_sheet(source_file):
+    # For the HSNO CCID export.
+    # Extracts the cells that crunch_nz() uses from each row of the
+    # spreadsheet, as a list of (CASRN, substance name, classification text,
+    # classification code, key study) tuples. Columns are:
+    # CASRN                 (r, 0)
+    # Substance name        (r, 1)
+    # Approval              (r, 2) - ignored
+    # Classification Text   (r, 3)
+    # Classification Code   (r, 4)
+    # Key Study             (r, 5)
+    ccidbook = xlrd.open_workbook(source_file)
+    return read_nz_rows(ccidbook.sheet_by_index(0))
+
+
+def read_nz_rows(ccid):
+    # Same as read_nz_sheet(), for an open sheet (or anything with the same
+    # nrows/cell_value() interface).
+    rows = []
+    for r in range(1, ccid.nrows):
+        rows.append(tuple(ccid.cell_value(r, col) for col in (0, 1, 3, 4, 5)))
+    return rows
 
 
-def crunch_nz():
+def read_nz_csv(source_file):
+    # For CCID exports in CSV or TSV format (tab-separated if the file name
+    # ends in .tsv, .tab or .txt), with the same six columns as the
+    # spreadsheet. Yields the same tuples as read_nz_sheet(), one row at a
+    # time, so the export is never loaded into memory all at once.
+    if os.path.splitext(source_file)[1].lower() in ('.tsv', '.tab', '.txt'):
+        delimiter = '\t'
+    else:
+        delimiter = ','
+    with open(source_file, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        # Skip the header.
+        next(reader, None)
+        for row in reader:
+            if not any(row):
+                continue
+            row = row + [''] * (6 - len(row))
+            yield (row[0], row[1], row[3], row[4], row[5])
+
+
+def nz_rows(source_file, cache_dir=None):
+    # Rows of a CCID export, from a spreadsheet (through the cache) or
+    # streamed from a CSV/TSV file.
+    if os.path.splitext(source_file)[1].lower() in ('.xls', '.xlsx'):
+        return cached_read(read_nz_sheet, source_file, cache_dir)
+    return read_nz_csv(source_file)
+
+
+def crunch_nz(cache_dir=None, write_csv=True, jobs=1, dedup=False,
+              source_file=NZ_SOURCE_FILE, pipeline=False):
     # Process the HSNO CCID export.
     # Translate HSNO classifications into GHS classifications, and perform
     # some additional processing to filter out certain substances.
-    hsno_ghs = {
-                # These are GHS translations of the HSNO classes/categories,
-                # used to create a 'Hazard description' field.
-                '1.1': ['Explosives', 'Division 1.1'],
-                '1.2': ['Explosives', 'Division 1.2'],
-                '1.3': ['Explosives', 'Division 1.3'],
-                '1.4': ['Explosives', 'Division 1.4'],
-                '1.5': ['Explosives', 'Division 1.5'],
-                '1.6': ['Explosives', 'Division 1.6'],
-                '2.1.1A': ['Flammable gases', 'Category 1'],
-                '2.1.1B': ['Flammable gases', 'Category 2'],
-                '2.1.2A': ['Flammable aerosols', 'Category 1'],
-                '3.1A': ['Flammable liquids', 'Category 1'],
-                '3.1B': ['Flammable liquids', 'Category 2'],
-                '3.1C': ['Flammable liquids', 'Category 3'],
-                '3.1D': ['Flammable liquids', 'Category 4'],
-                '4.1.1A': ['Flammable solids', 'Category 1'],
-                '4.1.1B': ['Flammable solids', 'Category 2'],
-                '4.1.2A': ['Self-reactive substances and mixtures', 'Type A'],
-                '4.1.2B': ['Self-reactive substances and mixtures', 'Type B'],
-                '4.1.2C': ['Self-reactive substances and mixtures', 'Type C'],
-                '4.1.2D': ['Self-reactive substances and mixtures', 'Type D'],
-                '4.1.2E': ['Self-reactive substances and mixtures', 'Type E'],
-                '4.1.2F': ['Self-reactive substances and mixtures', 'Type F'],
-                '4.1.2G': ['Self-reactive substances and mixtures', 'Type G'],
-                # HSNO doesn't distinguish pyrophoric liquids and solids.
-                '4.2A': ['Pyrophoric substances', 'Category 1'],
-                '4.2B': ['Self-heating substances and mixtures', 'Category 1'],
-                '4.2C': ['Self-heating substances and mixtures', 'Category 2'],
-                '4.3A': ['Substances and mixtures, which in contact with water, emit flammable gases', 'Category 1'],
-                '4.3B': ['Substances and mixtures, which in contact with water, emit flammable gases', 'Category 2'],
-                '4.3C': ['Substances and mixtures, which in contact with water, emit flammable gases', 'Category 3'],
-                # HSNO doesn't distinguish between oxidizing liquids and solids 
-                # but does distinguish them from oxidizing gases.
-                '5.1.1A': ['Oxidizing liquids/solids', 'Category 1'],
-                '5.1.1B': ['Oxidizing liquids/solids', 'Category 2'],
-                '5.1.1C': ['Oxidizing liquids/solids', 'Category 3'],
-                '5.1.2A': ['Oxidizing gases', 'Category 1'],
-                '5.2A': ['Organic peroxides', 'Type A'],
-                '5.2B': ['Organic peroxides', 'Type B'],
-                '5.2C': ['Organic peroxides', 'Type C'],
-                '5.2D': ['Organic peroxides', 'Type D'],
-                '5.2E': ['Organic peroxides', 'Type E'],
-                '5.2F': ['Organic peroxides', 'Type F'],
-                '5.2G': ['Organic peroxides', 'Type G'],
-                '6.1A (dermal)': ['Acute toxicity: Dermal', 'Category 1'],
-                '6.1A (inhalation)': ['Acute toxicity: Inhalation', 'Category 1'],
-                '6.1A (oral)': ['Acute toxicity: Oral', 'Category 1'],
-                '6.1B (dermal)': ['Acute toxicity: Dermal', 'Category 2'],
-                '6.1B (inhalation)': ['Acute toxicity: Inhalation', 'Category 2'],
-                '6.1B (oral)': ['Acute toxicity: Oral', 'Category 2'],
-                '6.1C (dermal)': ['Acute toxicity: Dermal', 'Category 3'],
-                '6.1C (inhalation)': ['Acute toxicity: Inhalation', 'Category 3'],
-                '6.1C (oral)': ['Acute toxicity: Oral', 'Category 3'],
-                '6.1D (dermal)': ['Acute toxicity: Dermal', 'Category 4'],
-                '6.1D (inhalation)': ['Acute toxicity: Inhalation', 'Category 4'],
-                '6.1D (oral)': ['Acute toxicity: Oral', 'Category 4'],
-                '6.1E (dermal)': ['Acute toxicity: Dermal', 'Category 5'],
-                '6.1E (inhalation)': ['Acute toxicity: Inhalation', 'Category 5'],
-                '6.1E (oral)': ['Acute toxicity: Oral', 'Category 5'],
-                '6.3A': ['Skin corrosion/irritation', 'Category 2'],
-                '6.3B': ['Skin corrosion/irritation', 'Category 3'],
-                # 6.4A is both Category 2A and 2B.
-                '6.4A': ['Serious eye damage/eye irritation', 'Category 2'],
-                '6.5A (respiratory)': ['Respiratory sensitization', 'Category 1'],
-                '6.5B (contact)': ['Skin sensitization', 'Category 1'],
-                # 6.6A is both Category 1A and 1B.
-                '6.6A': ['Germ cell mutagenicity', 'Category 1'],
-                '6.6B': ['Germ cell mutagenicity', 'Category 2'],
-                # 6.7A is both Category 1A and 1B.
-                '6.7A': ['Carcinogenicity', 'Category 1'],
-                '6.7B': ['Carcinogenicity', 'Category 2'],
-                # 6.8A is both Category 1A and 1B.
-                '6.8A': ['Reproductive toxicity', 'Category 1'],
-                '6.8B': ['Reproductive toxicity', 'Category 2'],
-                '6.8C': ['Reproductive toxicity', 'Effects on or via lactation'],
-                # HSNO doesn't distinguish between single or repeated exposure,
-                # but does distinguish among exposure routes.
-                '6.9A (dermal)': ['Specific Target Organ Systemic Toxicity', 'Category 1'],
-                '6.9A (inhalation)': ['Specific Target Organ Systemic Toxicity', 'Category 1'],
-                '6.9A (oral)': ['Specific Target Organ Systemic Toxicity', 'Category 1'],
-                '6.9A (other)': ['Specific Target Organ Systemic Toxicity', 'Category 1'],
-                '6.9B (dermal)': ['Specific Target Organ Systemic Toxicity', 'Category 2'],
-                '6.9B (inhalation)': ['Specific Target Organ Systemic Toxicity', 'Category 2'],
-                '6.9B (oral)': ['Specific Target Organ Systemic Toxicity', 'Category 2'],
-                '6.9B (other)': ['Specific Target Organ Systemic Toxicity', 'Category 2'],
-                '8.1A': ['Corrosive to metals', 'Category 1'],
-                '8.2A': ['Skin corrosion/irritation', 'Category 1A'],
-                '8.2B': ['Skin corrosion/irritation', 'Category 1B'],
-                '8.2C': ['Skin corrosion/irritation', 'Category 1C'],
-                '8.3A': ['Serious eye damage/eye irritation', 'Category 1'],
-                # In 9.1A, HSNO doesn't distinguish between acute and chronic.
-                '9.1A (algal)': ['Aquatic toxicity (Acute or Chronic)', 'Category 1'],
-                '9.1A (crustacean)': ['Aquatic toxicity (Acute or Chronic)', 'Category 1'],
-                '9.1A (fish)': ['Aquatic toxicity (Acute or Chronic)', 'Category 1'],
-                '9.1A (other)': ['Aquatic toxicity (Acute or Chronic)', 'Category 1'],
-                '9.1B (algal)': ['Aquatic toxicity (Chronic)', 'Category 2'],
-                '9.1B (crustacean)': ['Aquatic toxicity (Chronic)', 'Category 2'],
-                '9.1B (fish)': ['Aquatic toxicity (Chronic)', 'Category 2'],
-                '9.1B (other)': ['Aquatic toxicity (Chronic)', 'Category 2'],
-                '9.1C (algal)': ['Aquatic toxicity (Chronic)', 'Category 3'],
-                '9.1C (crustacean)': ['Aquatic toxicity (Chronic)', 'Category 3'],
-                '9.1C (fish)': ['Aquatic toxicity (Chronic)', 'Category 3'],
-                '9.1C (other)': ['Aquatic toxicity (Chronic)', 'Category 3'],
-                # The mapping of 9.1D to GHS is very odd.
-                '9.1D (algal)': ['Aquatic toxicity', 'Category 2-3 (Acute) or Category 4 (Chronic)'],
-                '9.1D (crustacean)': ['Aquatic toxicity', 'Category 2-3 (Acute) or Category 4 (Chronic)'],
-                '9.1D (fish)': ['Aquatic toxicity', 'Category 2-3 (Acute) or Category 4 (Chronic)'],
-                '9.1D (other)': ['Aquatic toxicity', 'Category 2-3 (Acute) or Category 4 (Chronic)'],
-                # Classes that aren't GHS-translatable:
-                '3.2A': '', # Liquid desensitized explosives
-                '3.2B': '', # Liquid desensitized explosives
-                '3.2C': '', # Liquid desensitized explosives
-                '4.1.3A': '', # Solid desensitized explosives: high hazard
-                '4.1.3B': '', # Solid desensitized explosives: medium hazard
-                '4.1.3C': '', # Solid desensitized explosives: low hazard
-                '9.2A': '', # Ecotoxic to soil environment
-                '9.2B': '', # Ecotoxic to soil environment
-                '9.2C': '', # Ecotoxic to soil environment
-                '9.2D': '', # Ecotoxic to soil environment
-                '9.3A': '', # Ecotoxic to terrestrial vertebrates
-                '9.3B': '', # Ecotoxic to terrestrial vertebrates
-                '9.3C': '', # Ecotoxic to terrestrial vertebrates
-                '9.4A': '', # Ecotoxic to terrestrial invertebrates
-                '9.4B': '', # Ecotoxic to terrestrial invertebrates
-                '9.4C': '', # Ecotoxic to terrestrial invertebrates
-                }
-    ccidbook = xlrd.open_workbook('GHS-nz/CCID Key Studies (4 June 2013).xls')
-    ccid = ccidbook.sheet_by_index(0)
+    # Returns a dict with the chemicals and sublists tables (see
+    # collect_nz()) and the screened substances, for the other output
+    # backends. CSV output files are only written if write_csv is true. With
+    # jobs > 1, the redundancy screening runs in a pool of worker processes.
+    # With dedup, repeated key studies are only kept once per classification.
+    # With pipeline, the CSV files are written by a writer thread.
+    # The source can be the CCID spreadsheet or a CSV/TSV export (which is
+    # streamed, so reading it is part of the collect stage).
+    profiler = ghsprofile.profiler
+    with profiler.stage('nz', 'read', source_file) as stage:
+        rows = nz_rows(source_file, cache_dir)
+        if isinstance(rows, list):
+            stage.count(len(rows))
+    with profiler.stage('nz', 'collect') as stage:
+        chemicals, sublists = collect_nz(rows, dedup)
+        stage.count(len(chemicals))
+    with profiler.stage('nz', 'screen') as stage:
+        screened = screen_nz(chemicals, jobs)
+        stage.count(len(chemicals))
+    if write_csv:
+        with profiler.stage('nz', 'write') as stage:
+            write_nz_csv(screened, sublists, source_file, pipeline)
+            stage.count(len(screened))
+    return dict(chemicals=chemicals, sublists=sublists, screened=screened)
+
+
+def collect_nz(rows, dedup=False):
+    # For the HSNO CCID export.
+    # Go through the spreadsheet rows (see read_nz_sheet()) and generate
+    # GHS translations. rows can be any iterable, e.g. the generator
+    # read_nz_csv(). Returns the dict of chemicals and the dict of sublists
+    # (see below).
+    # GHS translations of the HSNO classes/categories (see ghsvocab).
+    hsno_ghs = HSNO_GHS
     # Initialize a dictionary of CASRN-identified chemicals. See below...
     chemicals = dict()
     # Also, enumerate the unique classifications (sublists).
     sublists = dict()
-    # Read in the spreadsheet and generate GHS translations.
-    for r in range(1, ccid.nrows):
-        # CASRN                 (r, 0)
-        # Substance name        (r, 1)
-        # Approval              (r, 2) - ignored
-        # Classification Text   (r, 3)
-        # Classification Code   (r, 4)
-        # Key Study             (r, 5)
-        casrn = str(ccid.cell_value(r, 0)).strip()
+    # The same key study summaries show up for many solution variants of a
+    # substance, so keep just one copy of each.
+    studies = dict()
+    # With dedup, the set of key studies in each list that has more than
+    # one, so that checking for a repeat doesn't scan the list.
+    seen = dict()
+    for casrn_cell, name_cell, text_cell, code_cell, key_cell in rows:
+        casrn = str(casrn_cell).strip()
         # There is conveniently one substance without a CASRN. If there were
         # more, it might pose a problem for the redundancy filtering (below).
         if casrn == '':
             casrn = 'no_id'
-        name = ccid.cell_value(r, 1).strip()
+        name = name_cell.strip()
         # The following needs to be known for every substance:
-        c = str(ccid.cell_value(r, 4))  # Classification code
-        k = str(ccid.cell_value(r, 5))  # Key study
+        c = str(code_cell)  # Classification code
+        k = str(key_cell)  # Key study
+        k = studies.setdefault(k, k)
         # Fix inconsistent spaces around punctuation (for style):
         if '(' in c:
             c = c[:c.index('(')].strip() + ' ' + c[c.index('('):].strip()
@@ -658,7 +1213,7 @@ def crunch_nz():
         # and store them in a dict where the keys are classification codes.
         if c not in sublists:
             # Tidy up classification text:
-            t = ccid.cell_value(r, 3)
+            t = text_cell
             if ':' in t:
                 t = t[:t.index(':')].strip() + ': ' + \
                     t[t.index(':')+1:].strip()
@@ -678,110 +1233,625 @@ def crunch_nz():
         # corresponding value is itself a dictionary. The keys of that dict
         # are all the different chemical names assigned to that CASRN.
         # The values for those keys will be dictionaries (!) where the keys
-        # are classification codes and the values are key study summaries. 
+        # are classification codes and the values are lists of key study
+        # summaries. They are joined with newlines when written out.
         if casrn not in chemicals:
-            chemicals[casrn] = {name: {c: k}}
+            chemicals[casrn] = {name: {c: [k]}}
         elif name not in chemicals[casrn]:
-            chemicals[casrn][name] = {c: k}
+            chemicals[casrn][name] = {c: [k]}
         elif c in chemicals[casrn][name]:
-            chemicals[casrn][name][c] = chemicals[casrn][name][c] + '\n' + k
+            keys = chemicals[casrn][name][c]
+            if not dedup:
+                keys.append(k)
+            else:
+                if (casrn, name, c) not in seen:
+                    seen[casrn, name, c] = set(keys)
+                if k not in seen[casrn, name, c]:
+                    seen[casrn, name, c].add(k)
+                    keys.append(k)
         else: 
-            chemicals[casrn][name][c] = k
-    # Create output files...
-    outfile_inc = open('GHS-nz/output/GHS-nz.csv', 'w', newline='')
-    outfile_var = open('GHS-nz/output/variants.csv', 'w', newline='')
-    outfile_exc = open('GHS-nz/output/exclude.csv', 'w', newline='')
-    writer_inc = csv.writer(outfile_inc)
-    writer_var = csv.writer(outfile_var)
-    writer_exc = csv.writer(outfile_exc)
-    header = ['CASRN', 'Substance name', 'HSNO code',
-              'HSNO classification text', 'GHS translation', 'Key study']
-    writer_inc.writerow(header)
-    writer_var.writerow(header)
-    writer_exc.writerow(header)
+            chemicals[casrn][name][c] = [k]
+    return chemicals, sublists
+
+
+def screen_casrn(names):
+    # For the HSNO CCID export.
     # The following section attempts to filter the list so that pure
     # substances, solutions, and 'redundant' solutions are output in separate
     # files. This is done for practical reasons, to avoid minting hundreds of
     # identifiers for differently-dilute solutions of the same chemical.
-    for casrn in sorted(chemicals.keys()):
-        # The list of names given to this CASRN:
-        names = sorted(chemicals[casrn].keys())
-        # Find the principal (definitely non-redundant) substance from the 
-        # list of names. If they all contain %, then there's no pure substance.
-        # If there are multiple names which do not contain %, then all but one
-        # of those will end up in the redundant list. So far, the only such
-        # case is a substance that seems redundant anyway.
-        p = -1
-        for i in range(len(names)):
-            if '%' not in names[i]:
-                p = i
-                break
-        # If we didn't find any pure substances, assume they are all 
-        # potentially non-redundant; output and continue to next CASRN.
-        if p == -1:
-            for j in range(len(names)):
-                thisclass = chemicals[casrn][names[j]]
-                for c in sorted(thisclass.keys()):
-                    writer_var.writerow(
-                        ['_v' + str(j) + '_' + casrn, names[j], c] + 
-                         sublists[c][1:] + [thisclass[c]])
-            continue
-        # Having found the principal substance, pop it out of the list of
-        # names, save its set of classifications, and output them.
-        pname = names.pop(p)
-        pclass = chemicals[casrn][pname]
-        pset = pclass.keys()
-        for c in sorted(pset):
-            writer_inc.writerow(
-                [casrn, pname, c] + sublists[c][1:] + [pclass[c]])
-        # Next, screen the rest of the named substances against the principal.
-        # Since these all should be variants of the principal substance, I'll
-        # add a flag to the CASRN field to help with identifier wrangling.
-        for n in range(len(names)):
-            thisclass = chemicals[casrn][names[n]]
-            thisset = set(thisclass.keys())
-            if thisset <= pset:
-                # Redundant: All classifications are included within the
-                # principal substance's classifications.
-                for c in sorted(thisset):
-                    writer_exc.writerow(
-                        ['_v' + str(n) + '_' + casrn, names[n], c] + 
-                         sublists[c][1:] + [thisclass[c]])
+    # names is the sorted list of (name, classification bitmask) for the
+    # substances sharing one CASRN. Returns a list of (destination, variant
+    # number, name), where destination is 'include', 'variant' or 'exclude'
+    # and the variant number is None for the principal substance.
+    # Find the principal (definitely non-redundant) substance from the 
+    # list of names. If they all contain %, then there's no pure substance.
+    # If there are multiple names which do not contain %, then all but one
+    # of those will end up in the redundant list. So far, the only such
+    # case is a substance that seems redundant anyway.
+    p = -1
+    for i in range(len(names)):
+        if '%' not in names[i][0]:
+            p = i
+            break
+    # If we didn't find any pure substances, assume they are all 
+    # potentially non-redundant; output and continue to next CASRN.
+    if p == -1:
+        return [('variant', j, names[j][0]) for j in range(len(names))]
+    # Having found the principal substance, pop it out of the list of
+    # names, save its set of classifications, and output them.
+    names = list(names)
+    pname, pmask = names.pop(p)
+    screened = [('include', None, pname)]
+    # Next, screen the rest of the named substances against the principal.
+    # Since these all should be variants of the principal substance, I'll
+    # add a flag to the CASRN field to help with identifier wrangling.
+    for n in range(len(names)):
+        name, mask = names[n]
+        if mask & ~pmask == 0:
+            # Redundant: All classifications are included within the
+            # principal substance's classifications.
+            screened.append(('exclude', n, name))
+        else:
+            # Not redundant, but set aside for further scrutiny. The codes
+            # it adds to the principal's are mask & ~pmask.
+            screened.append(('variant', n, name))
+    return screened
+
+
+def screen_shard(shard):
+    # Screen a list of CASRNs' names (see screen_casrn()) in one go, for
+    # the worker processes of screen_nz().
+    return [screen_casrn(names) for names in shard]
+
+
+def screen_nz(chemicals, jobs=1, shard_size=2000):
+    # For the HSNO CCID export.
+    # Screens the substances of each CASRN for redundancy (see
+    # screen_casrn()). Each substance's set of classification codes is
+    # turned into an integer bitmask, so that testing whether a variant's
+    # classifications are a subset of the principal substance's is a single
+    # integer operation. With jobs > 1, shards of CASRNs are screened by a
+    # pool of worker processes.
+    # Returns a list of (destination, CASRN field, CASRN, name,
+    # classifications) in output order.
+    codes = sorted({c for names in chemicals.values()
+                    for thisclass in names.values() for c in thisclass})
+    bits = {c: 1 << i for i, c in enumerate(codes)}
+    casrns = sorted(chemicals.keys())
+    masks = []
+    for casrn in casrns:
+        names = []
+        for name in sorted(chemicals[casrn].keys()):
+            mask = 0
+            for c in chemicals[casrn][name]:
+                mask |= bits[c]
+            names.append((name, mask))
+        masks.append(names)
+    if jobs > 1:
+        shards = [masks[i:i + shard_size]
+                  for i in range(0, len(masks), shard_size)]
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            decisions = [d for shard in executor.map(screen_shard, shards)
+                         for d in shard]
+    else:
+        decisions = screen_shard(masks)
+    screened = []
+    for casrn, decision in zip(casrns, decisions):
+        for dest, n, name in decision:
+            if n is None:
+                casrn_field = casrn
             else:
-                # Not redundant, but set aside for further scrutiny.
-                for c in sorted(thisset):
-                    writer_var.writerow(
-                        ['_v' + str(n) + '_' + casrn, names[n], c] + 
-                         sublists[c][1:] + [thisclass[c]])
+                casrn_field = '_v' + str(n) + '_' + casrn
+            screened.append((dest, casrn_field, casrn, name,
+                             chemicals[casrn][name]))
+    return screened
+
+
+def write_nz_csv(screened, sublists, source_file, pipeline=False):
+    # Write the CSV output files for the HSNO CCID export. With pipeline,
+    # the substance files are written by a WriterThread.
+    # Create output files...
+    manifest = Manifest('GHS-nz/output', [source_file])
+    if pipeline:
+        writer_thread = WriterThread()
+        make_writer = writer_thread.writer
+        buffering = OUTPUT_BUFFER
+    else:
+        make_writer = csv_writer
+        buffering = -1
+    outfile_inc = manifest.open('GHS-nz/output/GHS-nz.csv', newline='',
+                                buffering=buffering)
+    outfile_var = manifest.open('GHS-nz/output/variants.csv', newline='',
+                                buffering=buffering)
+    outfile_exc = manifest.open('GHS-nz/output/exclude.csv', newline='',
+                                buffering=buffering)
+    writers = dict(include=make_writer(outfile_inc, index=True),
+                   variant=make_writer(outfile_var, index=True),
+                   exclude=make_writer(outfile_exc, index=True))
+    header = ['CASRN', 'Substance name', 'HSNO code',
+              'HSNO classification text', 'GHS translation', 'Key study']
+    for writer in writers.values():
+        writer.writerow(header)
+    for dest, casrn_field, casrn, name, thisclass in screened:
+        for c in sorted(thisclass.keys()):
+            writers[dest].writerow(
+                [casrn_field, name, c] + sublists[c][1:] +
+                ['\n'.join(thisclass[c])])
+    if pipeline:
+        writer_thread.finish()
     outfile_inc.close()
     outfile_var.close()
     outfile_exc.close()
     # Output some helpful information about the classification sublists.
     subs = sorted(sublists.keys())
-    subfile = open('GHS-nz/output/sublists.csv', 'w', newline='')
+    subfile = manifest.open('GHS-nz/output/sublists.csv', newline='')
     subwriter = csv.writer(subfile)
     subwriter.writerow(['HSNO code', 'HSNO classification', 'GHS translation'])
     for sl in subs:
         subwriter.writerow([sl] + [sublists[sl][0], sublists[sl][2]])
     subfile.close()
+    manifest.save()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE chemicals (
+    id INTEGER PRIMARY KEY,
+    jurisdiction TEXT NOT NULL,
+    casrn TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    name TEXT,
+    status TEXT
+);
+CREATE TABLE synonyms (
+    chemical_id INTEGER NOT NULL REFERENCES chemicals(id),
+    synonym TEXT NOT NULL
+);
+CREATE TABLE classifications (
+    id INTEGER PRIMARY KEY,
+    chemical_id INTEGER NOT NULL REFERENCES chemicals(id),
+    hazard_class TEXT,
+    category TEXT,
+    code TEXT,
+    symbol TEXT,
+    signal_word TEXT,
+    hazard_statement TEXT,
+    rationale TEXT,
+    date TEXT,
+    m_factor TEXT
+);
+CREATE TABLE hsno_ghs (
+    code TEXT PRIMARY KEY,
+    hsno_classification TEXT,
+    ghs_hazard_class TEXT,
+    ghs_category TEXT
+);
+CREATE TABLE key_studies (
+    classification_id INTEGER NOT NULL REFERENCES classifications(id),
+    key_study TEXT
+);
+CREATE INDEX chemicals_casrn ON chemicals(casrn);
+CREATE INDEX synonyms_chemical ON synonyms(chemical_id);
+CREATE INDEX classifications_chemical ON classifications(chemical_id);
+CREATE INDEX classifications_hazard ON classifications(hazard_class, category);
+CREATE INDEX classifications_category ON classifications(category);
+CREATE INDEX key_studies_classification ON key_studies(classification_id);
+"""
+
+
+def write_sqlite(path, jp=None, kr=None, nz=None):
+    # Write crunched results to a SQLite database, in normalized tables
+    # (see SQLITE_SCHEMA). jp, kr and nz are what crunch_jp(), crunch_kr()
+    # and crunch_nz() return. Everything is loaded in a single transaction
+    # into a new database file, which then replaces the old one.
+    # In the chemicals table, record_id is the identifier used in the CSV
+    # output (e.g. '_v1_' + CASRN for NZ variants), and status says which
+    # NZ output file a substance went to.
+    directory, basename = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(dir=directory or '.', prefix='.' + basename,
+                               suffix='.tmp')
+    os.close(fd)
+    conn = sqlite3.connect(tmp)
+    try:
+        with conn:
+            conn.executescript(SQLITE_SCHEMA)
+            chemicals = []
+            synonyms = []
+            classifications = []
+            key_studies = []
+            if jp is not None:
+                for casrn in sorted(jp.keys()):
+                    chem_id = len(chemicals) + 1
+                    chemicals.append((chem_id, 'jp', casrn, casrn,
+                                      jp[casrn].name, None))
+                    for h, datalist in zip(JP_HAZARD_CLASSES,
+                                           jp[casrn].hazards):
+                        category = jp_sublist(datalist[0], datalist[1])[0]
+                        if category == '':
+                            continue
+                        classifications.append(
+                            (len(classifications) + 1, chem_id,
+                             str(datalist[0]).strip(), category, h) +
+                            tuple(datalist[2:]) + (None,))
+            if kr is not None:
+                kr_ids = dict()
+                for record in kr:
+                    casrn, name, syns = record[:3]
+                    if (casrn, name) not in kr_ids:
+                        chem_id = len(chemicals) + 1
+                        kr_ids[(casrn, name)] = chem_id
+                        chemicals.append((chem_id, 'kr', casrn, casrn, name,
+                                          None))
+                        for syn in syns.split(';'):
+                            if syn.strip() != '':
+                                synonyms.append((chem_id, syn.strip()))
+                    haz_class_en, category, h_code, h_text, m_factor = \
+                        record[3:8]
+                    classifications.append(
+                        (len(classifications) + 1, kr_ids[(casrn, name)],
+                         haz_class_en, category, h_code, None, None,
+                         h_code + ' - ' + h_text, None, None, m_factor))
+            if nz is not None:
+                sublists = nz['sublists']
+                hsno_ghs = HSNO_GHS
+                for dest, casrn_field, casrn, name, thisclass in \
+                        nz['screened']:
+                    chem_id = len(chemicals) + 1
+                    chemicals.append((chem_id, 'nz', casrn, casrn_field, name,
+                                      dest))
+                    for c in sorted(thisclass.keys()):
+                        if hsno_ghs[c] != '':
+                            ghs_class, ghs_category = hsno_ghs[c]
+                        else:
+                            ghs_class = ghs_category = None
+                        class_id = len(classifications) + 1
+                        classifications.append(
+                            (class_id, chem_id, ghs_class, ghs_category, c,
+                             None, None, sublists[c][1], None, None, None))
+                        key_studies.extend((class_id, k)
+                                           for k in thisclass[c])
+                conn.executemany('INSERT INTO hsno_ghs VALUES (?, ?, ?, ?)',
+                    [(c, sublists[c][0] if c in sublists else None) +
+                     (tuple(hsno_ghs[c]) if hsno_ghs[c] != '' else
+                      (None, None)) for c in sorted(hsno_ghs.keys())])
+            conn.executemany('INSERT INTO chemicals VALUES (?, ?, ?, ?, ?, ?)',
+                             chemicals)
+            conn.executemany('INSERT INTO synonyms VALUES (?, ?)', synonyms)
+            conn.executemany('INSERT INTO classifications VALUES '
+                             '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             classifications)
+            conn.executemany('INSERT INTO key_studies VALUES (?, ?)',
+                             key_studies)
+        conn.close()
+    except BaseException:
+        conn.close()
+        os.remove(tmp)
+        raise
+    os.chmod(tmp, 0o666 & ~UMASK)
+    os.replace(tmp, path)
+    print('Wrote %d chemicals and %d classifications to %s.' %
+          (len(chemicals), len(classifications), path))
+
+
+def check_casrns(results, filename='GHS-all/output/casrn_check.csv'):
+    # Check the CASRNs that the processed countries use as keys (see
+    # ghscas.check()): the Japan chemicals, the Korea records and the NZ
+    # substances before variants are told apart.
+    import ghscas
+    columns = dict()
+    if results.get('jp') is not None:
+        columns['jp'] = list(results['jp'].keys())
+    if results.get('kr') is not None:
+        columns['kr'] = [record[0] for record in results['kr']]
+    if results.get('nz') is not None:
+        columns['nz'] = [s[2] for s in results['nz']['screened']]
+    problems, summary = ghscas.check(columns)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    ghscas.write_report(problems, filename)
+    print('Checked %(casrns)d CASRNs, %(distinct)d distinct (%(shared)d in '
+          'more than one country): %(invalid)d invalid, %(duplicates)d '
+          'written in more than one way.' % summary)
+    print('Wrote %d problems to %s.' % (len(problems), filename))
+
+
+# What main() prints when it starts on a country.
+COUNTRY_NAMES = dict(jp='Japan GHS classifications',
+                     kr='Republic of Korea GHS classifications',
+                     nz='Aotearoa New Zealand HSNO classifications')
+
+
+class PrefixedOutput:
+    # Text stream for print() that passes whole lines on to stream, each
+    # starting with prefix, so that the output of processes sharing a
+    # terminal doesn't get mixed up within lines.
+
+    def __init__(self, stream, prefix):
+        self.stream = stream
+        self.prefix = prefix
+        self.pending = ''
+
+    def write(self, text):
+        lines = (self.pending + text).split('\n')
+        self.pending = lines.pop()
+        if lines:
+            self.stream.write(''.join(self.prefix + line + '\n'
+                                      for line in lines))
+            self.stream.flush()
+        return len(text)
+
+    def flush(self):
+        if self.pending:
+            self.write('\n')
+        self.stream.flush()
+
+
+def crunch_country(country, options):
+    # Process one country with the options from main().
+    print('Processing ' + COUNTRY_NAMES[country] + '.')
+    if country == 'jp':
+        return crunch_jp(jobs=options['jobs'], cache_dir=options['cache_dir'],
+                         write_csv=options['write_csv'],
+                         pipeline=options['pipeline'])
+    if country == 'kr':
+        return crunch_kr(cache_dir=options['cache_dir'],
+                         write_csv=options['write_csv'],
+                         pipeline=options['pipeline'], keep=options['keep'])
+    return crunch_nz(cache_dir=options['cache_dir'],
+                     write_csv=options['write_csv'], jobs=options['jobs'],
+                     dedup=options['dedup'], source_file=options['nz_source'],
+                     pipeline=options['pipeline'])
+
+
+def run_country(country, options, keep_result=True, prefix=False):
+    # Returns the result of crunch_country() (or None, if keep_result is
+    # false, so a worker process doesn't have to send it back), the
+    # wall-clock time it took, and with options['profile'], the profile
+    # (see profile_country()). With prefix, every line of output starts with
+    # the country code.
+    start = time.perf_counter()
+    if not prefix:
+        result, profile = profile_country(country, options)
+        return result, time.perf_counter() - start, profile
+    stdout = sys.stdout
+    sys.stdout = PrefixedOutput(stdout, '[%s] ' % country)
+    try:
+        result, profile = profile_country(country, options)
+    finally:
+        sys.stdout.flush()
+        sys.stdout = stdout
+    return ((result if keep_result else None), time.perf_counter() - start,
+            profile)
+
+
+def profile_country(country, options):
+    # Runs crunch_country(), with a profiler if options['profile'] is true.
+    # Returns the result and dict(stages, cprofile) (see ghsprofile), or
+    # None.
+    if not options['profile']:
+        return crunch_country(country, options), None
+    result, stages, dumps = ghsprofile.profiled(
+        lambda: crunch_country(country, options), options['cprofile_dir'])
+    return result, dict(stages=stages, cprofile=dumps)
+
+
+def run_parallel(countries, options, keep_results=True):
+    # Run the countries in a process pool, one process each (the countries
+    # share nothing and write to separate output directories). Returns the
+    # dicts of results, timings and profiles like the sequential loop in
+    # main(), or (None, None, None) if a country failed. Then the other
+    # countries stop before their next stage (see ghsprofile.stop_event)
+    # rather than being killed, so that no temporary output files are left
+    # behind, and the time each country took is printed.
+    results = dict()
+    timings = dict()
+    profiles = dict()
+    failed = dict()
+    context = multiprocessing.get_context()
+    stop = context.Event()
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+            len(countries), mp_context=context,
+            initializer=ghsprofile.set_stop_event,
+            initargs=(stop,)) as executor:
+        futures = {executor.submit(run_country, c, options, keep_results,
+                                   True): c for c in countries}
+        for future in concurrent.futures.as_completed(futures):
+            country = futures[future]
+            try:
+                results[country], timings[country], profiles[country] = \
+                    future.result()
+            except ghsprofile.Stopped:
+                timings[country] = time.perf_counter() - start
+                failed[country] = 'stopped'
+            except Exception as e:
+                timings[country] = time.perf_counter() - start
+                failed[country] = 'failed'
+                print('[%s] Failed:' % country, file=sys.stderr)
+                # The cause holds the traceback from the worker process.
+                traceback.print_exception(e.__cause__ or e, file=sys.stderr)
+                stop.set()
+    if failed:
+        print('Stopped after %s failed, in %.1f s (%s).' %
+              (', '.join(c for c in countries if failed.get(c) == 'failed'),
+               time.perf_counter() - start,
+               ', '.join('%s %.1f s%s' % (c, timings[c],
+                                          ' ' + failed[c] if c in failed
+                                          else '')
+                         for c in countries)), file=sys.stderr)
+        return None, None, None
+    return results, timings, profiles
 
 
 def main():
     parser = argparse.ArgumentParser(description='Extract GHS hazard \
                 classifications from country-specific documents.') 
     parser.add_argument('countries', action='store', nargs='+', 
-                choices=['jp', 'kr', 'nz'], 
-                help='Process GHS classifications from these countries.')
+                choices=['jp', 'kr', 'nz', 'merge', 'score', 'serve'], 
+                help='Process GHS classifications from these countries. '
+                     '"merge" joins the output of all three countries into '
+                     'one hazard matrix. "score" assigns GreenScreen hazard '
+                     'levels to every chemical in it. "serve" then answers '
+                     'CASRN lookups over HTTP until interrupted (see '
+                     'ghsserve.py).')
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=1,
+                help='Number of worker processes for reading the Japan '
+                     'workbooks and screening NZ substances.')
+    parser.add_argument('--cache-dir', action='store',
+                default='.ghscrunch-cache',
+                help='Directory for the cache of extracted spreadsheet data.')
+    parser.add_argument('--no-cache', action='store_true',
+                help='Always read the spreadsheets with xlrd.')
+    parser.add_argument('--dedup-key-studies', action='store_true',
+                help='Only keep one copy of key studies that are repeated '
+                     'for the same NZ substance and classification.')
+    parser.add_argument('--nz-source', action='store',
+                default=NZ_SOURCE_FILE, metavar='FILE',
+                help='HSNO CCID export to process: the .xls spreadsheet, '
+                     'or a CSV/TSV file with the same six columns.')
+    parser.add_argument('--parallel', action='store_true',
+                help='Process the countries at the same time, each in a '
+                     'process of its own.')
+    parser.add_argument('--pipeline', action='store_true',
+                help='Write the CSV files from a background thread while '
+                     'records are still being made.')
+    parser.add_argument('--profile', action='store', metavar='FILE',
+                help='Write a JSON report of wall time, rows, memory '
+                     'high-water mark and output bytes for each stage and '
+                     'source file.')
+    parser.add_argument('--cprofile', action='store', metavar='DIR',
+                help='Also run each stage under cProfile and write the '
+                     'stats to DIR/COUNTRY-STAGE.prof.')
+    parser.add_argument('--greenscreen-mapping', action='store',
+                metavar='FILE',
+                help='JSON file with the GreenScreen endpoints and hazard '
+                     'levels to use for "score" (see ghsscore.py).')
+    parser.add_argument('--check-casrns', action='store_true',
+                help='Check the CASRNs of the processed countries for bad '
+                     'formats, bad check digits and numbers written in '
+                     'more than one way, and list them in '
+                     'GHS-all/output/casrn_check.csv (needs NumPy).')
+    parser.add_argument('--text-index', action='store', metavar='PATH',
+                help='Update a full-text index (SQLite) of the Japan '
+                     'rationales and NZ key studies (see ghstext.py).')
+    parser.add_argument('--host', action='store', default='127.0.0.1',
+                help='Address for "serve" to listen on.')
+    parser.add_argument('--port', action='store', type=int, default=8765,
+                help='Port for "serve" to listen on.')
+    parser.add_argument('--socket', action='store', metavar='PATH',
+                help='Have "serve" listen on a Unix socket instead.')
+    parser.add_argument('--watch-interval', action='store', type=float,
+                default=5.0, metavar='SECONDS',
+                help='How often "serve" checks for new output files.')
+    parser.add_argument('--recrunch', action='store_true',
+                help='Have "serve" also check the source files, and run '
+                     'ghscrunch.py again for countries whose files change.')
+    parser.add_argument('--output', action='append', metavar='BACKEND',
+                help='Where to write the results: "csv" (the default) for '
+                     'the CSV files in each output directory, '
+                     '"sqlite:PATH" for a SQLite database, or "npz:PATH" '
+                     '(one .npz file) or "npy:DIR" (a .npy file per array) '
+                     'for the hazard matrix as NumPy arrays. Can be given '
+                     'more than once.')
     args = parser.parse_args()
-    if 'jp' in args.countries:
-        print('Processing Japan GHS classifications.')
-        crunch_jp()
-    if 'kr' in args.countries:
-        print('Processing Republic of Korea GHS classifications.')
-        crunch_kr()
-    if 'nz' in args.countries:
-        print('Processing Aotearoa New Zealand HSNO classifications.')
-        crunch_nz()
+    cache_dir = None if args.no_cache else args.cache_dir
+    outputs = args.output or ['csv']
+    sqlite_paths = []
+    array_paths = []
+    for o in outputs:
+        backend, sep, path = o.partition(':')
+        if backend == 'sqlite' and path:
+            sqlite_paths.append(path)
+        elif backend in ('npz', 'npy') and path:
+            array_paths.append((path, backend == 'npy'))
+        elif o != 'csv':
+            parser.error('unknown output backend: ' + o)
+    if array_paths or 'score' in args.countries:
+        # Imported here, since ghsmatrix itself imports this module.
+        import ghsmatrix
+        if ghsmatrix.numpy is None:
+            parser.error('"score" and the npz and npy outputs need NumPy')
+    if args.check_casrns:
+        import ghscas
+        if ghscas.numpy is None:
+            parser.error('--check-casrns needs NumPy')
+    profiling = args.profile is not None or args.cprofile is not None
+    options = dict(jobs=args.jobs, cache_dir=cache_dir,
+                   write_csv='csv' in outputs,
+                   dedup=args.dedup_key_studies, nz_source=args.nz_source,
+                   profile=profiling, cprofile_dir=args.cprofile,
+                   pipeline=args.pipeline,
+                   keep=bool(sqlite_paths or args.text_index or
+                             args.check_casrns))
+    countries = [c for c in ('jp', 'kr', 'nz') if c in args.countries]
+    start = time.perf_counter()
+    if args.parallel and len(countries) > 1:
+        results, timings, profiles = run_parallel(
+            countries, options, keep_results=options['keep'])
+    else:
+        results = dict()
+        timings = dict()
+        profiles = dict()
+        for country in countries:
+            results[country], timings[country], profiles[country] = \
+                run_country(country, options)
+    if timings is None:
+        sys.exit(1)
+    if profiling:
+        ghsprofile.profiler = ghsprofile.Profiler(args.cprofile)
+    profiler = ghsprofile.profiler
+    for path in sqlite_paths:
+        with profiler.stage('all', 'sqlite', path):
+            write_sqlite(path, **results)
+            profiler.output(os.path.getsize(path))
+    if args.check_casrns:
+        with profiler.stage('all', 'casrns'):
+            check_casrns(results)
+    if args.text_index is not None:
+        import ghstext
+        with profiler.stage('all', 'text', args.text_index):
+            ghstext.update_index(args.text_index, jp=results.get('jp'),
+                                 nz=results.get('nz'))
+    matrix = None
+    if 'merge' in args.countries:
+        # Imported here, since ghsmatrix itself imports this module.
+        import ghsmatrix
+        print('Merging classifications into a hazard matrix.')
+        with profiler.stage('all', 'merge'):
+            matrix = ghsmatrix.merge()
+    for path, npy in array_paths:
+        # Like merge, these are made from the CSV output files.
+        with profiler.stage('all', 'npy' if npy else 'npz', path):
+            if matrix is None:
+                matrix = ghsmatrix.build_matrix(ghsmatrix.read_all())
+            ghsmatrix.write_arrays(path, matrix, npy=npy)
+    if 'score' in args.countries:
+        import ghsscore
+        print('Scoring GreenScreen hazard levels.')
+        with profiler.stage('all', 'score'):
+            ghsscore.main(matrix, args.greenscreen_mapping)
+    seconds = time.perf_counter() - start
+    if countries:
+        print('Finished in %.1f s (%s).' %
+              (seconds,
+               ', '.join('%s %.1f s' % (c, timings[c]) for c in countries)))
+    if profiling:
+        stages = [stage for c in countries for stage in profiles[c]['stages']]
+        dumps = [f for c in countries for f in profiles[c]['cprofile']]
+        stages += profiler.stages
+        dumps += profiler.dump()
+    if args.profile is not None:
+        with OutputFile(args.profile) as f:
+            json.dump(dict(arguments=sys.argv[1:], seconds=seconds,
+                           countries=timings, stages=stages,
+                           cprofile=dumps), f, indent=1)
+            f.write('\n')
+        print('Wrote profile to %s.' % args.profile)
+    if 'serve' in args.countries:
+        import ghsserve
+        service = ghsserve.Service(interval=args.watch_interval,
+                                   recrunch=args.recrunch,
+                                   nz_source=args.nz_source)
+        ghsserve.serve(service, args.host, args.port, args.socket)
 
 
 if __name__ == '__main__':
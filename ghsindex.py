@@ -0,0 +1,329 @@
+#!/usr/local/bin/python3
+
+# ghsindex.py
+# In-memory index of the crunched GHS classifications, for looking up
+# chemicals by CASRN from other programs without re-reading the CSV output
+# files every time. Run ghscrunch.py first to produce the output files.
+#
+#   index = GHSIndex.load()
+#   index.lookup('50-00-0')
+#   index.lookup_many(['50-00-0', '71-43-2'])
+#   index.by_hazard('cancer', jurisdiction='jp')
+#
+# OffsetIndex reads single chemicals out of a Japan or NZ output file
+# through its sidecar index instead, without loading the file:
+#
+#   with OffsetIndex('GHS-jp/output/cancer.csv') as f:
+#       f.rows('50-00-0')
+
+import collections
+import csv
+import functools
+import io
+import mmap
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+import ghscas
+import ghscrunch
+
+
+# One classification of one chemical in one jurisdiction's output.
+#   jurisdiction:   'jp', 'kr' or 'nz'
+#   casrn:          Normalized CASRN (see normalize_casrn())
+#   record_id:      CASRN field as written in the output file
+#   name:           Substance name
+#   hazard_class:   jp hazard class key (e.g. 'cancer'), kr hazard class
+#                   name, or nz HSNO code
+#   classification: The classification, as written in the output file
+#   fields:         The remaining columns of the output row
+Classification = collections.namedtuple('Classification',
+    'jurisdiction casrn record_id name hazard_class classification fields')
+
+# Identifiers of NZ solution variants look like '_v1_' + CASRN.
+VARIANT_PREFIX = re.compile(r'^_v\d+_')
+
+
+def normalize_casrn(casrn):
+    # Make CASRNs from different sources comparable: no whitespace, no
+    # variant prefix, and no leading zeros (see ghscas).
+    casrn = VARIANT_PREFIX.sub('', ''.join(casrn.split()))
+    return ghscas.normalize_casrn(casrn)
+
+
+def read_csv(filename):
+    # Rows of a CSV output file, without the header.
+    with open(filename, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            yield row
+
+
+def read_jp(root='.'):
+    # Classifications from the Japan per-hazard-class output files.
+    for h in ghscrunch.JP_HAZARD_CLASSES:
+        filename = os.path.join(root, 'GHS-jp/output', h + '.csv')
+        for row in read_csv(filename):
+            yield Classification('jp', normalize_casrn(row[0]), row[0],
+                                 row[1], h, row[2], tuple(row[3:]))
+
+
+# The Japan output files for the rows that are exactly one of the "not"
+# classifications, with that classification.
+JP_NOT_FILES = (('notclassified.csv', 'Not classified'),
+                ('notpossible.csv', 'Classification not possible'),
+                ('notapplicable.csv', 'Not applicable'))
+
+
+def jp_hazard_names(pairs):
+    # Hazard class name -> key, for the names that the classification
+    # fields of Japan records start with (name, ' - ', category), given as
+    # (classification, key) pairs. As a category may contain ' - ' too,
+    # every such prefix counts; prefixes seen with more than one key are
+    # left out.
+    names = dict()
+    for classification, key in set(pairs):
+        end = classification.find(' - ')
+        while end != -1:
+            name = classification[:end]
+            names[name] = key if names.get(name, key) == key else None
+            end = classification.find(' - ', end + 3)
+    return {name: key for name, key in names.items() if key is not None}
+
+
+def read_jp_not(root='.', names=None):
+    # Classifications from the Japan "not" output files (see JP_NOT_FILES).
+    # Their rows don't say the hazard class key, so it is looked up by the
+    # hazard class name in names (see jp_hazard_names()), then in
+    # ghscrunch.NITE_HAZARD_NAMES. Rows with a name found in neither are
+    # left out, and counted on stderr.
+    unknown = collections.Counter()
+    for f, category in JP_NOT_FILES:
+        filename = os.path.join(root, 'GHS-jp/output', f)
+        for row in read_csv(filename):
+            name = row[2][:-len(' - ' + category)]
+            key = (names or {}).get(name) or \
+                ghscrunch.NITE_HAZARD_NAMES.get(name)
+            if key is None:
+                unknown[name] += 1
+                continue
+            yield Classification('jp', normalize_casrn(row[0]), row[0],
+                                 row[1], key, row[2], tuple(row[3:]))
+    for name, n in sorted(unknown.items()):
+        print('Left out %d Japan rows with unknown hazard class %r.' %
+              (n, name), file=sys.stderr)
+
+
+def read_kr(root='.'):
+    # Classifications from the Korea output file. The hazard sublist field
+    # is split back into hazard class and the rest.
+    filename = os.path.join(root, 'GHS-kr/output/GHS-kr.csv')
+    for row in read_csv(filename):
+        hazard_class, sep, rest = row[3].partition(' - Category ')
+        yield Classification('kr', normalize_casrn(row[0]), row[0], row[1],
+                             hazard_class, row[3], (row[2], row[4]))
+
+
+def read_nz(root='.', files=('GHS-nz.csv', 'variants.csv', 'exclude.csv')):
+    # Classifications from the NZ output files, by default including the
+    # variants and the excluded (redundant) solutions.
+    for f in files:
+        filename = os.path.join(root, 'GHS-nz/output', f)
+        for row in read_csv(filename):
+            yield Classification('nz', normalize_casrn(row[0]), row[0],
+                                 row[1], row[2], row[4] or row[3],
+                                 (row[3], row[5]))
+
+
+READERS = dict(jp=read_jp, kr=read_kr, nz=read_nz)
+
+
+class GHSIndex:
+    # Hash index of crunched classifications keyed by normalized CASRN,
+    # plus an index by (jurisdiction, hazard class). Joined views made by
+    # profile() are kept in a bounded LRU cache. Records are namedtuples
+    # and results are tuples; treat them as read-only since they are shared.
+    # Keys that aren't valid CASRNs (see ghscas) are listed in invalid.
+
+    def __init__(self, records=(), cache_size=4096):
+        # Records can only be added before freeze() is called.
+        self.by_casrn = dict()
+        self.by_class = dict()
+        self._cached_profile = functools.lru_cache(maxsize=cache_size)(
+            self._profile)
+        self.stats = dict(chemicals=0, records=0, invalid_casrns=0,
+                          load_seconds=0.0, memory_bytes=None)
+        self.invalid = ()
+        if records:
+            for record in records:
+                self.add(record)
+            self.freeze()
+
+    @classmethod
+    def load(cls, root='.', jurisdictions=('jp', 'kr', 'nz'),
+             cache_size=4096, measure_memory=False):
+        # Load the output files of the given jurisdictions (skipping any
+        # that haven't been crunched). Load time and, if measure_memory is
+        # true, the memory allocated by the index are kept in stats.
+        if measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        index = cls(cache_size=cache_size)
+        for j in jurisdictions:
+            try:
+                for record in READERS[j](root):
+                    index.add(record)
+            except FileNotFoundError as e:
+                print('Skipping %s: %s' % (j, e), file=sys.stderr)
+        index.freeze()
+        index.stats['load_seconds'] = time.perf_counter() - start
+        if measure_memory:
+            index.stats['memory_bytes'] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+        return index
+
+    def add(self, record):
+        self.by_casrn.setdefault(record.casrn, []).append(record)
+        self.by_class.setdefault((record.jurisdiction, record.hazard_class),
+                                 []).append(record)
+
+    def freeze(self):
+        # Turn the lists of records into tuples, so that lookups can hand
+        # them out without copying.
+        for d in (self.by_casrn, self.by_class):
+            for key in d:
+                d[key] = tuple(d[key])
+        self.stats['chemicals'] = len(self.by_casrn)
+        self.stats['records'] = sum(len(v) for v in self.by_casrn.values())
+        # Keys that aren't valid CASRNs (made-up IDs, typos), checked all at
+        # once.
+        keys = list(self.by_casrn)
+        self.invalid = tuple(c for c, ok in zip(keys, ghscas.validate(keys))
+                             if not ok)
+        self.stats['invalid_casrns'] = len(self.invalid)
+
+    def lookup(self, casrn):
+        # All classifications of a chemical, from all jurisdictions.
+        return self.by_casrn.get(normalize_casrn(casrn), ())
+
+    def lookup_many(self, casrns):
+        # Dict of CASRN (as given) -> classifications, for many CASRNs.
+        get = self.by_casrn.get
+        return {c: get(normalize_casrn(c), ()) for c in casrns}
+
+    def by_hazard(self, hazard_class, jurisdiction=None):
+        # All classifications for one hazard class, optionally limited to
+        # one jurisdiction.
+        if jurisdiction is not None:
+            return self.by_class.get((jurisdiction, hazard_class), ())
+        return tuple(r for j in READERS
+                     for r in self.by_class.get((j, hazard_class), ()))
+
+    def hazard_classes(self, jurisdiction=None):
+        return sorted(h for j, h in self.by_class
+                      if jurisdiction in (None, j))
+
+    def profile(self, casrn):
+        # Joined view of a chemical: dict of jurisdiction -> hazard class ->
+        # tuple of classifications. Cached, so don't modify the result.
+        return self._cached_profile(normalize_casrn(casrn))
+
+    def _profile(self, casrn):
+        view = dict()
+        for r in self.by_casrn.get(casrn, ()):
+            view.setdefault(r.jurisdiction, dict()).setdefault(
+                r.hazard_class, []).append(r.classification)
+        for hazards in view.values():
+            for h in hazards:
+                hazards[h] = tuple(hazards[h])
+        return view
+
+
+class OffsetIndex:
+    # Seek-based lookups in a CSV output file that has a sidecar index
+    # (FILE.csv.idx, see ghscrunch.IndexedWriter). Both files are
+    # memory-mapped; a lookup binary-searches the index entries and parses
+    # only the rows of that chemical. Keys are the CASRN field as written
+    # (so '_v1_' + CASRN for NZ variants), not normalized.
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(filename + ghscrunch.INDEX_SUFFIX, 'rb') as f:
+            self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.width, self.count = \
+            ghscrunch.INDEX_HEADER.unpack_from(self.index)
+        if magic != ghscrunch.INDEX_MAGIC:
+            raise ValueError('%s: not a sidecar index' %
+                             (filename + ghscrunch.INDEX_SUFFIX))
+        self.entry = ghscrunch.index_entry(self.width)
+        self.start = ghscrunch.INDEX_HEADER.size
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self.count
+
+    def read_entry(self, i):
+        return self.entry.unpack_from(self.index,
+                                      self.start + i * self.entry.size)
+
+    def rows(self, casrn):
+        # The rows whose CASRN field is casrn, as lists of strings, in file
+        # order.
+        key = casrn.encode('utf-8')
+        if len(key) > self.width:
+            return []
+        key = key.ljust(self.width, b'\0')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.read_entry(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        rows = []
+        while lo < self.count:
+            k, offset, length, n = self.read_entry(lo)
+            if k != key:
+                break
+            text = self.data[offset:offset + length].decode('utf-8')
+            run = list(csv.reader(io.StringIO(text, newline='')))
+            # The CSV file is replaced before its index, so a reader can
+            # catch them out of step.
+            if len(run) != n or any(row[0] != casrn for row in run):
+                raise ValueError('%s: index is out of date' % self.filename)
+            rows.extend(run)
+            lo += 1
+        return rows
+
+
+def main():
+    index = GHSIndex.load(measure_memory=True)
+    print('Loaded %(records)d classifications of %(chemicals)d chemicals '
+          'in %(load_seconds).2f s' % index.stats, file=sys.stderr)
+    print('Index memory: %d kB' % (index.stats['memory_bytes'] // 1024),
+          file=sys.stderr)
+    for casrn in sys.argv[1:]:
+        for j, hazards in sorted(index.profile(casrn).items()):
+            for h, classifications in sorted(hazards.items()):
+                for c in classifications:
+                    print('\t'.join([casrn, j, h, c]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,439 @@
+#!/usr/local/bin/python3
+
+# ghsmatrix.py
+# Join the crunched Japan, Korea and NZ classifications on CASRN into one
+# chemical x hazard class matrix, using a common hazard class vocabulary.
+# Run ghscrunch.py first to produce the output files; `ghscrunch.py merge`
+# (or running this module) writes GHS-all/output/matrix.csv.
+# `ghscrunch.py --output npz:PATH` (or npy:DIR) writes the same matrix as
+# NumPy arrays of category codes instead (see build_arrays()).
+
+import collections
+import csv
+import os
+import re
+import sys
+import tempfile
+
+import ghscrunch
+import ghsindex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# The common hazard class vocabulary: (key, column heading). It follows the
+# Japan hazard class keys, except where a jurisdiction doesn't distinguish
+# classes that the others do: then the classes are combined (pyrophoric
+# liquids/solids, oxidizing liquids/solids, acute toxicity by inhalation of
+# gas/vapour/dust), or NZ gets a column of its own for the classifications
+# that can't be placed (target organ toxicity without single/repeated
+# exposure, aquatic toxicity without acute/chronic).
+COMMON_HAZARDS = [
+    ('explosive', 'Explosives'),
+    ('flamm_gas', 'Flammable gases'),
+    ('flamm_aer', 'Flammable aerosols'),
+    ('oxid_gas', 'Oxidizing gases'),
+    ('gas_press', 'Gases under pressure'),
+    ('flamm_liq', 'Flammable liquids'),
+    ('flamm_sol', 'Flammable solids'),
+    ('self_react', 'Self-reactive substances and mixtures'),
+    ('pyrophoric', 'Pyrophoric liquids/solids'),
+    ('self_heat', 'Self-heating substances and mixtures'),
+    ('water_fire', 'Substances and mixtures which, in contact with water, '
+                   'emit flammable gases'),
+    ('oxidizer', 'Oxidizing liquids/solids'),
+    ('org_perox', 'Organic peroxides'),
+    ('cor_metal', 'Corrosive to metals'),
+    ('acute_oral', 'Acute toxicity (oral)'),
+    ('acute_derm', 'Acute toxicity (dermal)'),
+    ('acute_inhal', 'Acute toxicity (inhalation)'),
+    ('skin_cor', 'Skin corrosion/irritation'),
+    ('eye_dmg', 'Serious eye damage/eye irritation'),
+    ('resp_sens', 'Respiratory sensitization'),
+    ('skin_sens', 'Skin sensitization'),
+    ('mutagen', 'Germ cell mutagenicity'),
+    ('cancer', 'Carcinogenicity'),
+    ('repr_tox', 'Reproductive toxicity'),
+    ('sys_single', 'Specific target organ toxicity - Single exposure'),
+    ('sys_rept', 'Specific target organ toxicity - Repeated exposure'),
+    ('sys_organ', 'Specific target organ toxicity (exposure not specified)'),
+    ('asp_haz', 'Aspiration hazard'),
+    ('aq_acute', 'Hazardous to the aquatic environment (acute)'),
+    ('aq_chronic', 'Hazardous to the aquatic environment (chronic)'),
+    ('aquatic', 'Hazardous to the aquatic environment (acute or chronic)'),
+    ('ozone', 'Hazardous to the ozone layer')
+    ]
+
+# Japan hazard class keys -> common keys. Not listed: same key.
+JP_COMMON = {
+    'pyro_liq': 'pyrophoric',
+    'pyro_sol': 'pyrophoric',
+    'oxid_liq': 'oxidizer',
+    'oxid_sol': 'oxidizer',
+    'acute_gas': 'acute_inhal',
+    'acute_vap': 'acute_inhal',
+    'acute_air': 'acute_inhal'
+    }
+
+# Korea hazard class names (from ghs_hazard() and crunch_kr()) -> common keys.
+# Not listed: 'Acute toxicity' and 'Respiratory or skin sensitization',
+# which crunch_kr() falls back on when it can't tell the route or the kind
+# of sensitization; those classifications are left out of the matrix.
+KR_COMMON = {
+    'Explosives': 'explosive',
+    'Flammable gases': 'flamm_gas',
+    'Aerosols': 'flamm_aer',
+    'Oxidizing gases': 'oxid_gas',
+    'Gases under pressure': 'gas_press',
+    'Flammable liquids': 'flamm_liq',
+    'Flammable solids': 'flamm_sol',
+    'Self-reactive substances and mixtures': 'self_react',
+    'Pyrophoric liquids': 'pyrophoric',
+    'Pyrophoric solids': 'pyrophoric',
+    'Self-heating substances and mixtures': 'self_heat',
+    'Substances and mixtures which, in contact with water, emit flammable '
+    'gases': 'water_fire',
+    'Oxidizing liquids': 'oxidizer',
+    'Oxidizing solids': 'oxidizer',
+    'Organic peroxides': 'org_perox',
+    'Corrosive to metals': 'cor_metal',
+    'Acute toxicity (oral)': 'acute_oral',
+    'Acute toxicity (dermal)': 'acute_derm',
+    'Acute toxicity (inhalation)': 'acute_inhal',
+    'Skin corrosion/irritation': 'skin_cor',
+    'Serious eye damage/irritation': 'eye_dmg',
+    'Respiratory sensitization': 'resp_sens',
+    'Skin sensitization': 'skin_sens',
+    'Germ cell mutagenicity': 'mutagen',
+    'Carcinogenicity': 'cancer',
+    'Reproductive toxicity': 'repr_tox',
+    'Specific target organ toxicity - Single exposure': 'sys_single',
+    'Specific target organ toxicity - Repeated exposure': 'sys_rept',
+    'Aspiration hazard': 'asp_haz',
+    'Hazardous to the aquatic environment (acute)': 'aq_acute',
+    'Hazardous to the aquatic environment (chronic)': 'aq_chronic',
+    'Hazardous to the aquatic environment': 'aquatic',
+    'Hazardous to the ozone layer': 'ozone'
+    }
+
+# GHS hazard classes of the NZ hsno_ghs translations -> common keys.
+NZ_COMMON = {
+    'Explosives': 'explosive',
+    'Flammable gases': 'flamm_gas',
+    'Flammable aerosols': 'flamm_aer',
+    'Flammable liquids': 'flamm_liq',
+    'Flammable solids': 'flamm_sol',
+    'Self-reactive substances and mixtures': 'self_react',
+    'Pyrophoric substances': 'pyrophoric',
+    'Self-heating substances and mixtures': 'self_heat',
+    'Substances and mixtures, which in contact with water, emit flammable '
+    'gases': 'water_fire',
+    'Oxidizing liquids/solids': 'oxidizer',
+    'Oxidizing gases': 'oxid_gas',
+    'Organic peroxides': 'org_perox',
+    'Acute toxicity: Dermal': 'acute_derm',
+    'Acute toxicity: Inhalation': 'acute_inhal',
+    'Acute toxicity: Oral': 'acute_oral',
+    'Skin corrosion/irritation': 'skin_cor',
+    'Serious eye damage/eye irritation': 'eye_dmg',
+    'Respiratory sensitization': 'resp_sens',
+    'Skin sensitization': 'skin_sens',
+    'Germ cell mutagenicity': 'mutagen',
+    'Carcinogenicity': 'cancer',
+    'Reproductive toxicity': 'repr_tox',
+    'Specific Target Organ Systemic Toxicity': 'sys_organ',
+    'Corrosive to metals': 'cor_metal',
+    'Aquatic toxicity (Acute or Chronic)': 'aquatic',
+    'Aquatic toxicity (Chronic)': 'aq_chronic',
+    'Aquatic toxicity': 'aquatic'
+    }
+
+JURISDICTIONS = ('jp', 'kr', 'nz')
+
+# The output files that read_all() reads, per jurisdiction. For NZ, only
+# the principal substances are used: variants and excluded solutions would
+# mix classifications of solutions into the chemical's row.
+MATRIX_FILES = dict(
+    jp=['GHS-jp/output/' + h + '.csv' for h in ghscrunch.JP_HAZARD_CLASSES] +
+       ['GHS-jp/output/' + f for f, category in ghsindex.JP_NOT_FILES],
+    kr=['GHS-kr/output/GHS-kr.csv'],
+    nz=['GHS-nz/output/GHS-nz.csv'])
+
+
+def common_hazard(record):
+    # Map a ghsindex.Classification onto the common vocabulary. Returns
+    # (common key, category), None if the classification has no GHS
+    # equivalent, or (None, category) if its hazard class isn't in the
+    # common vocabulary.
+    if record.jurisdiction == 'jp':
+        category = record.classification.partition(' - ')[2]
+        return JP_COMMON.get(record.hazard_class, record.hazard_class), \
+            category
+    if record.jurisdiction == 'kr':
+        rest = record.classification.partition(' - ')[2]
+        category = rest[:rest.find(' [')] if ' [' in rest else rest
+        return KR_COMMON.get(record.hazard_class), category
+    # NZ classifications carry a GHS translation like
+    # 'GHS: Carcinogenicity - Category 2', or none at all.
+    if not record.classification.startswith('GHS: '):
+        return None
+    ghs_class, sep, category = record.classification[5:].partition(' - ')
+    return NZ_COMMON.get(ghs_class), category
+
+
+def read_all(root='.'):
+    # Stream the classifications of all three jurisdictions (see
+    # MATRIX_FILES). A jurisdiction is skipped if any of its files is
+    # missing, rather than half read.
+    for j in JURISDICTIONS:
+        missing = [f for f in MATRIX_FILES[j]
+                   if not os.path.exists(os.path.join(root, f))]
+        if missing:
+            print('Skipping %s: %d of %d output files missing, e.g. %s' %
+                  (j, len(missing), len(MATRIX_FILES[j]), missing[0]))
+            continue
+        if j == 'jp':
+            for record in read_jp(root):
+                yield record
+            continue
+        if j == 'nz':
+            records = ghsindex.read_nz(root, files=('GHS-nz.csv',))
+        else:
+            records = ghsindex.READERS[j](root)
+        for record in records:
+            yield record
+
+
+def read_jp(root='.'):
+    # The Japan classifications, including the rows of the "not" files
+    # (whose hazard classes are told by the names that the per-hazard-class
+    # files use for them).
+    pairs = set()
+    for record in ghsindex.read_jp(root):
+        pairs.add((record.classification, record.hazard_class))
+        yield record
+    for record in ghsindex.read_jp_not(root, ghsindex.jp_hazard_names(pairs)):
+        yield record
+
+
+def build_matrix(records):
+    # Hash join on normalized CASRN. Only the cells are kept: a dict of
+    # CASRN -> [name, {common key: {jurisdiction: [categories]}}], so memory
+    # is bounded by the size of the matrix, not by the input rows.
+    # Classifications whose hazard class has no common key are counted
+    # and reported.
+    matrix = dict()
+    unknown = collections.Counter()
+    for record in records:
+        mapped = common_hazard(record)
+        if mapped is None:
+            continue
+        key, category = mapped
+        if key is None:
+            unknown[record.jurisdiction, record.hazard_class] += 1
+            continue
+        if record.casrn not in matrix:
+            matrix[record.casrn] = [record.name, dict()]
+        cell = matrix[record.casrn][1].setdefault(key, dict())
+        categories = cell.setdefault(record.jurisdiction, [])
+        if category not in categories:
+            categories.append(category)
+    for (j, hazard_class), n in sorted(unknown.items()):
+        print('Left out %d %s classifications with hazard class %r, which '
+              'has no common hazard class.' % (n, j, hazard_class),
+              file=sys.stderr)
+    return matrix
+
+
+def format_cell(cell):
+    # e.g. 'jp: Category 1A; nz: Category 1'
+    return '; '.join(j + ': ' + ', '.join(cell[j])
+                     for j in JURISDICTIONS if j in cell)
+
+
+def merge(root='.', output_dir='GHS-all/output'):
+    # Write the chemical x hazard class matrix to output_dir/matrix.csv.
+    matrix = build_matrix(read_all(root))
+    os.makedirs(output_dir, exist_ok=True)
+    filename = os.path.join(output_dir, 'matrix.csv')
+    with ghscrunch.OutputFile(filename, newline='',
+                              buffering=ghscrunch.OUTPUT_BUFFER) as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['CASRN', 'Name'] + [h[1] for h in COMMON_HAZARDS])
+        for casrn in sorted(matrix.keys()):
+            name, cells = matrix[casrn]
+            writer.writerow([casrn, name] +
+                            [format_cell(cells[key]) if key in cells else ''
+                             for key, heading in COMMON_HAZARDS])
+    print('Wrote %d chemicals to %s.' % (len(matrix), filename))
+    return matrix
+
+
+# Category codes in the arrays: 0 for no classification, these sentinels,
+# or a positive code from the category dictionary (see build_arrays()).
+NO_DATA = 0
+NOT_CLASSIFIED = -1
+NOT_POSSIBLE = -2
+NOT_APPLICABLE = -3
+SENTINELS = [
+    (re.compile(r'\bnot\s*classified', re.I), NOT_CLASSIFIED,
+     'Not classified'),
+    (re.compile(r'\bclassification\s*not\s*possible', re.I), NOT_POSSIBLE,
+     'Classification not possible'),
+    (re.compile(r'\bnot\s*applicable', re.I), NOT_APPLICABLE,
+     'Not applicable')
+    ]
+
+# Categories as they appear in the Japan, Korea and NZ data, e.g.
+# 'Category1', 'Category 2A-2B', 'Category 3 (narcotic effects)',
+# 'Repeated exposure - Category 1', 'Division 1.1', 'Type B'.
+CATEGORY = re.compile(r'\b(category|division|type)\s*'
+                      r'(\d+(?:\.\d+)?[A-G]?(?:\s*-\s*\d*[A-G])?|'
+                      r'[A-G](?:\s*-\s*[A-G])?)\b', re.I)
+
+# A bare number, as a numeric spreadsheet cell comes out (e.g. '2.0').
+NUMBER = re.compile(r'^(\d+)(?:\.0*)?$')
+
+
+def category_label(category):
+    # Normalize a category: one of the sentinel codes for the "not"
+    # classifications, a label like 'Category 1A' (the most severe one if
+    # several are given, e.g. for different target organs), the text itself
+    # if it has no category (e.g. 'Liquefied gas'), or None if empty.
+    # Texts that only list "not" classifications for the isomers or forms
+    # of a substance get the sentinel that says the most. Bare numbers are
+    # categories ('2.0' is 'Category 2'), except 0, which is what empty
+    # numeric cells come out as.
+    category = ' '.join(category.split())
+    if category == '':
+        return None
+    number = NUMBER.match(category)
+    if number:
+        n = int(number.group(1))
+        return 'Category %d' % n if n > 0 else None
+    for pattern, code, label in SENTINELS:
+        if pattern.match(category):
+            return code
+    labels = [m.group(1).capitalize() + ' ' +
+              ''.join(m.group(2).split()).upper()
+              for m in CATEGORY.finditer(category)]
+    if labels:
+        return min(labels, key=severity)
+    if re.search(r'\bgas\b', category, re.I) is None:
+        found = [code for pattern, code, label in SENTINELS
+                 if pattern.search(category)]
+        if found:
+            return max(found)
+    return category
+
+
+def severity(label):
+    # Sort key that puts more severe categories first: by number, then
+    # letter ('Category 1A' before 'Category 1B' before 'Category 2'), with
+    # labels that aren't categories at the end.
+    m = re.match(r'^(Category|Division|Type) (\d+(?:\.\d+)?)?(.*)$', label)
+    if m is None:
+        return (1, '', 0.0, label)
+    return (0, m.group(1), float(m.group(2) or 0), m.group(3))
+
+
+def build_arrays(matrix):
+    # The matrix from build_matrix() as NumPy arrays:
+    #   casrn, name:      One per chemical (sorted by CASRN)
+    #   jurisdiction:     'jp', 'kr', 'nz'
+    #   hazard, heading:  Common hazard class keys and column headings
+    #   codes:            int8 category codes, jurisdiction x chemical x
+    #                     hazard class; where a cell has several
+    #                     categories, the most severe one
+    #   category:         Category dictionary: code c is category[c - 1],
+    #                     and lower codes are more severe
+    #   sentinel_code, sentinel_label: The sentinel codes and their meaning
+    casrns = sorted(matrix.keys())
+    labels = dict()
+    cells = []
+    for i, casrn in enumerate(casrns):
+        for h, (key, heading) in enumerate(COMMON_HAZARDS):
+            cell = matrix[casrn][1].get(key)
+            if cell is None:
+                continue
+            for j, jurisdiction in enumerate(JURISDICTIONS):
+                if jurisdiction not in cell:
+                    continue
+                found = [category_label(c) for c in cell[jurisdiction]]
+                found = [c for c in found if c is not None]
+                for c in found:
+                    if isinstance(c, str):
+                        labels[c] = None
+                if found:
+                    cells.append((j, i, h, found))
+    categories = sorted(labels, key=severity)
+    if len(categories) > 127:
+        raise ValueError('Too many categories for int8 codes: %d' %
+                         len(categories))
+    code = {c: n + 1 for n, c in enumerate(categories)}
+    codes = numpy.zeros((len(JURISDICTIONS), len(casrns),
+                         len(COMMON_HAZARDS)), dtype=numpy.int8)
+    for j, i, h, found in cells:
+        found = [code[c] if isinstance(c, str) else c for c in found]
+        positive = [c for c in found if c > 0]
+        # A category beats the sentinels; of those, "not classified" (a
+        # conclusion) beats "not possible" and "not applicable".
+        codes[j, i, h] = min(positive) if positive else max(found)
+    return dict(
+        casrn=numpy.array(casrns, dtype=str),
+        name=numpy.array([matrix[c][0] for c in casrns], dtype=str),
+        jurisdiction=numpy.array(JURISDICTIONS, dtype=str),
+        hazard=numpy.array([key for key, heading in COMMON_HAZARDS],
+                           dtype=str),
+        heading=numpy.array([heading for key, heading in COMMON_HAZARDS],
+                            dtype=str),
+        codes=codes,
+        category=numpy.array(categories, dtype=str),
+        sentinel_code=numpy.array([code for p, code, label in SENTINELS],
+                                  dtype=numpy.int8),
+        sentinel_label=numpy.array([label for p, code, label in SENTINELS],
+                                   dtype=str))
+
+
+def save_atomic(path, save):
+    # Call save(f) with a binary temporary file next to path, which then
+    # replaces path.
+    directory, basename = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(dir=directory or '.', prefix='.' + basename,
+                               suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            save(f)
+        os.chmod(tmp, 0o666 & ~ghscrunch.UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def write_arrays(path, matrix=None, root='.', npy=False):
+    # Write the arrays of build_arrays() to an uncompressed .npz file (whose
+    # members numpy.load() reads on demand), or with npy, to a directory of
+    # .npy files, one per array, for numpy.load(..., mmap_mode='r').
+    # The matrix is built from the output files in root if not given.
+    if matrix is None:
+        matrix = build_matrix(read_all(root))
+    arrays = build_arrays(matrix)
+    if npy:
+        os.makedirs(path, exist_ok=True)
+        for name, array in arrays.items():
+            save_atomic(os.path.join(path, name + '.npy'),
+                        lambda f: numpy.save(f, array))
+    else:
+        save_atomic(path, lambda f: numpy.savez(f, **arrays))
+    print('Wrote %d chemicals x %d hazard classes (%d categories) to %s.' %
+          (len(arrays['casrn']), len(COMMON_HAZARDS),
+           len(arrays['category']), path))
+    return arrays
+
+
+if __name__ == '__main__':
+    merge()
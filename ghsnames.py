@@ -0,0 +1,271 @@
+#!/usr/local/bin/python3
+
+# ghsnames.py
+# Fuzzy matching of chemical names across jurisdictions, for the records
+# that can't be joined on CASRN: Japan chemicals with made-up IDs, the NZ
+# substance without a CASRN, NZ solution variants, or CASRNs with typos.
+# Names (and the Korean synonyms) are indexed by their character trigrams
+# in an inverted index; a query only looks at the names that share a
+# trigram with it, counting shared trigrams per name with one bincount over
+# the concatenated postings, and scores them by trigram (Jaccard)
+# similarity. Run ghscrunch.py first to produce the output files.
+#
+#   names = NameIndex.load()
+#   names.search('1,2-dichloroethane', k=5)
+#   names.match_unkeyed()               # no valid CASRN, or NZ variants
+#
+# Running this module prints the top matches for the names given, or with
+# no names, writes the best matches of every record without a valid CASRN,
+# and of every NZ variant, to GHS-all/output/name_matches.csv.
+
+import array
+import collections
+import csv
+import math
+import os
+import re
+import sys
+import time
+
+import ghscas
+import ghscrunch
+import ghsindex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# One name of one record: the name (or synonym) as written, and where it
+# comes from.
+NameEntry = collections.namedtuple('NameEntry',
+    'jurisdiction casrn record_id name')
+
+# A search result: similarity (0-1) and the entry.
+Match = collections.namedtuple('Match', 'score jurisdiction casrn record_id '
+                                        'name')
+
+WORD = re.compile(r'\w+')
+
+
+def name_key(name):
+    # Names are compared lowercased, as words separated by single spaces.
+    return ' '.join(WORD.findall(name.lower()))
+
+
+def trigrams(key):
+    # Distinct trigrams of a name key, padded so that word starts and ends
+    # count.
+    padded = '  ' + key + ' '
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def read_jp_names(root='.'):
+    # NameEntries of the Japan chemicals.
+    for row in ghsindex.read_csv(os.path.join(root,
+                                              'GHS-jp/output/index.csv')):
+        yield NameEntry('jp', ghsindex.normalize_casrn(row[0]), row[0],
+                        row[1])
+
+
+def read_kr_names(root='.'):
+    # NameEntries of the Korea chemicals, for their names and each synonym.
+    seen = set()
+    for row in ghsindex.read_csv(os.path.join(root,
+                                              'GHS-kr/output/GHS-kr.csv')):
+        if (row[0], row[1], row[2]) in seen:
+            continue
+        seen.add((row[0], row[1], row[2]))
+        for name in [row[1]] + row[2].split(';'):
+            if name.strip() != '':
+                yield NameEntry('kr', ghsindex.normalize_casrn(row[0]),
+                                row[0], name.strip())
+
+
+def read_nz_names(root='.'):
+    # NameEntries of the NZ substances, variants and excluded solutions.
+    for f in ('GHS-nz.csv', 'variants.csv', 'exclude.csv'):
+        last = None
+        for row in ghsindex.read_csv(os.path.join(root, 'GHS-nz/output', f)):
+            # One row per classification, so a substance comes in a run.
+            if (row[0], row[1]) != last:
+                last = (row[0], row[1])
+                yield NameEntry('nz', ghsindex.normalize_casrn(row[0]),
+                                row[0], row[1])
+
+
+NAME_READERS = dict(jp=read_jp_names, kr=read_kr_names, nz=read_nz_names)
+
+
+class NameIndex:
+    # Trigram index of names. Entries with the same name key share one
+    # indexed name; searches return the entries of the best names. Entries
+    # can only be added before freeze().
+
+    def __init__(self, entries=()):
+        self.keys = []
+        self.key_ids = dict()
+        self.entries = []
+        self.grams = dict()
+        self.sizes = []
+        for entry in entries:
+            self.add(entry)
+        if entries:
+            self.freeze()
+
+    @classmethod
+    def load(cls, root='.', jurisdictions=('jp', 'kr', 'nz')):
+        # Index the names in the output files of the given jurisdictions
+        # (skipping any that haven't been crunched).
+        start = time.perf_counter()
+        index = cls()
+        for j in jurisdictions:
+            try:
+                for entry in NAME_READERS[j](root):
+                    index.add(entry)
+            except FileNotFoundError as e:
+                print('Skipping %s: %s' % (j, e), file=sys.stderr)
+        index.freeze()
+        index.load_seconds = time.perf_counter() - start
+        return index
+
+    def add(self, entry):
+        key = name_key(entry.name)
+        if key == '':
+            return
+        if key not in self.key_ids:
+            self.key_ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.entries.append([])
+            grams = trigrams(key)
+            self.sizes.append(len(grams))
+            for g in grams:
+                self.grams.setdefault(g, array.array('i')).append(
+                    self.key_ids[key])
+        entries = self.entries[self.key_ids[key]]
+        # Korea repeats synonyms across rows.
+        if entry not in entries:
+            entries.append(entry)
+
+    def freeze(self):
+        # Postings become NumPy arrays (when available), for bincount().
+        if numpy is not None:
+            self.grams = {g: numpy.frombuffer(ids, dtype=numpy.int32)
+                          for g, ids in self.grams.items()}
+            self.sizes = numpy.array(self.sizes, dtype=numpy.int32)
+        self.entries = [tuple(e) for e in self.entries]
+
+    def scores(self, key, threshold=0.0):
+        # Similarity of the name key to the indexed names that share a
+        # trigram with it and may reach threshold: (name ids, scores). A
+        # name can only reach threshold if it shares at least threshold *
+        # (the query's trigrams) of them, so the others aren't scored.
+        grams = trigrams(key)
+        postings = [self.grams[g] for g in grams if g in self.grams]
+        need = max(1, math.ceil(threshold * len(grams) - 1e-9))
+        if numpy is None:
+            shared = collections.Counter()
+            for ids in postings:
+                shared.update(ids)
+            ids = [i for i in shared if shared[i] >= need]
+            return ids, [shared[i] / (len(grams) + self.sizes[i] - shared[i])
+                         for i in ids]
+        if len(postings) < need:
+            return numpy.zeros(0, dtype=numpy.intp), numpy.zeros(0)
+        counts = numpy.bincount(numpy.concatenate(postings))
+        ids = numpy.flatnonzero(counts >= need)
+        shared = counts[ids]
+        return ids, shared / (len(grams) + self.sizes[ids] - shared)
+
+    def search(self, name, k=5, threshold=0.3, exclude=None):
+        # Entries of the k names most similar to name, with a similarity of
+        # at least threshold, best first. exclude is a function that says
+        # which entries to leave out (e.g. those of the query's own
+        # record).
+        ids, scores = self.scores(name_key(name), threshold)
+        if numpy is None:
+            best = sorted(((s, i) for i, s in zip(ids, scores)
+                           if s >= threshold), key=lambda x: (-x[0], x[1]))
+        else:
+            keep = scores >= threshold
+            ids, scores = ids[keep], scores[keep]
+            # Only sort the best few, plus some to spare for exclude.
+            if len(ids) > 4 * k:
+                top = numpy.argpartition(-scores, 4 * k)[:4 * k]
+                ids, scores = ids[top], scores[top]
+            order = numpy.lexsort((ids, -scores))
+            best = zip(scores[order].tolist(), ids[order].tolist())
+        matches = []
+        names = 0
+        for score, i in best:
+            entries = [e for e in self.entries[i]
+                       if exclude is None or not exclude(e)]
+            if not entries:
+                continue
+            matches.extend(Match(round(score, 4), *e) for e in entries)
+            names += 1
+            if names == k:
+                break
+        return matches
+
+    def search_many(self, names, k=5, threshold=0.3):
+        # search() for each of many names: dict of name -> matches.
+        return {name: self.search(name, k, threshold) for name in names}
+
+    def match_unkeyed(self, k=3, threshold=0.5):
+        # For every entry whose CASRN isn't valid (see ghscas), and every NZ
+        # solution variant (whose CASRN is that of the pure substance), the
+        # best matches other than the entry's own record: list of (entry,
+        # matches).
+        entries = [e for group in self.entries for e in group]
+        valid = ghscas.validate([e.casrn for e in entries])
+        results = []
+        for entry, ok in zip(entries, valid):
+            if ok and not ghsindex.VARIANT_PREFIX.match(entry.record_id):
+                continue
+            matches = self.search(
+                entry.name, k, threshold,
+                exclude=lambda e: e.jurisdiction == entry.jurisdiction and
+                e.record_id == entry.record_id)
+            results.append((entry, matches))
+        return results
+
+
+def write_matches(results, filename):
+    # Write match_unkeyed() results as CSV, one row per match.
+    with ghscrunch.OutputFile(filename, newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['Jurisdiction', 'CASRN', 'Name', 'Score',
+                         'Match jurisdiction', 'Match CASRN', 'Match name'])
+        for entry, matches in results:
+            for m in matches:
+                writer.writerow([entry.jurisdiction, entry.record_id,
+                                 entry.name, m.score, m.jurisdiction,
+                                 m.record_id, m.name])
+
+
+def main(output_dir='GHS-all/output'):
+    index = NameIndex.load()
+    print('Indexed %d names (%d distinct) in %.2f s.' %
+          (sum(len(e) for e in index.entries), len(index.keys),
+           index.load_seconds), file=sys.stderr)
+    if len(sys.argv) > 1:
+        for name in sys.argv[1:]:
+            for m in index.search(name):
+                print('\t'.join([name, '%.3f' % m.score, m.jurisdiction,
+                                 m.record_id, m.name]))
+        return
+    start = time.perf_counter()
+    results = index.match_unkeyed()
+    seconds = time.perf_counter() - start
+    os.makedirs(output_dir, exist_ok=True)
+    filename = os.path.join(output_dir, 'name_matches.csv')
+    write_matches(results, filename)
+    print('Matched %d records without a valid CASRN or NZ variants in %.2f '
+          's; wrote %s.' %
+          (len(results), seconds, filename))
+
+
+if __name__ == '__main__':
+    main()
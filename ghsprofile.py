@@ -0,0 +1,219 @@
+#!/usr/local/bin/python3
+
+# ghsprofile.py
+# Instrumentation for `ghscrunch.py --profile`: wall time, rows processed,
+# memory high-water mark and output bytes for each stage of each country,
+# broken down by source file where there are several, plus optional cProfile
+# dumps per stage. Instrumented code goes through the module-level
+# `profiler`, which does nothing unless a Profiler has been put in its place,
+# so with profiling off the cost is a method call per stage or file.
+#
+#   with ghsprofile.profiler.stage('jp', 'read', filename) as stage:
+#       batch = read(filename)
+#       stage.count(rows=..., sheets=len(batch))
+#
+# Stage boundaries are also where the countries of `--parallel` stop when
+# another one has failed (see stop_event).
+
+import cProfile
+import os
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def maxrss_kb():
+    # Memory high-water mark of this process, in kB (None if unknown).
+    # ru_maxrss is in kB on Linux but in bytes on macOS.
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if os.uname().sysname == 'Darwin':
+        rss //= 1024
+    return rss
+
+
+class Stopped(Exception):
+    # Raised when a stage is about to start after stop_event was set.
+    pass
+
+
+# In the worker processes of `ghscrunch.py --parallel`, an Event that the
+# parent sets when a country has failed; None elsewhere. Every stage checks
+# it before it starts, so the other countries stop between stages, never
+# in the middle of writing an output file.
+stop_event = None
+
+
+def set_stop_event(event):
+    # Process pool initializer.
+    global stop_event
+    stop_event = event
+
+
+def check_stop():
+    if stop_event is not None and stop_event.is_set():
+        raise Stopped('another country failed')
+
+
+def timed_call(func, arg):
+    # For worker processes, which can't report to the parent's profiler:
+    # returns (func(arg), wall time, the worker's memory high-water mark).
+    # See Profiler.record().
+    start = time.perf_counter()
+    result = func(arg)
+    return result, time.perf_counter() - start, maxrss_kb()
+
+
+class NullStage:
+    # What NullProfiler.stage() hands out: does nothing.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, rows=0, sheets=0):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class NullProfiler:
+    # The profiler when profiling is off.
+
+    def stage(self, country, name, source=None):
+        check_stop()
+        return NULL_STAGE
+
+    def record(self, country, name, source, seconds, maxrss, rows=0,
+               sheets=0):
+        pass
+
+    def output(self, size):
+        pass
+
+
+class Stage:
+    # Context manager for one run of a stage (on one source file, if
+    # given). Times it, and adds the times and counts to the stage's entry
+    # and the file's entry in the report.
+
+    def __init__(self, profiler, entries, cprofile):
+        self.profiler = profiler
+        self.entries = entries
+        self.cprofile = cprofile
+
+    def __enter__(self):
+        self.profiler.current.append(self)
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.profiler.current.pop()
+        rss = maxrss_kb()
+        for entry in self.entries:
+            entry['seconds'] += seconds
+            entry['maxrss_kb'] = rss
+        return False
+
+    def count(self, rows=0, sheets=0):
+        for entry in self.entries:
+            entry['rows'] += rows
+            entry['sheets'] += sheets
+
+    def output(self, size):
+        for entry in self.entries:
+            entry['output_bytes'] += size
+
+
+class Profiler:
+    # Collects the report. Stages are identified by (country, name); a stage
+    # that is run several times (e.g. once per source file) accumulates.
+    # With cprofile_dir, each stage is also run under cProfile, and dump()
+    # writes the stats to cprofile_dir/COUNTRY-STAGE.prof.
+
+    def __init__(self, cprofile_dir=None):
+        self.stages = []
+        self.by_name = dict()
+        self.current = []
+        self.cprofile_dir = cprofile_dir
+        self.cprofiles = dict()
+
+    def entry(self, country, name, source=None):
+        key = (country, name)
+        if key not in self.by_name:
+            self.by_name[key] = dict(country=country, stage=name,
+                                     seconds=0.0, rows=0, sheets=0,
+                                     output_bytes=0, maxrss_kb=None,
+                                     files=[])
+            self.stages.append(self.by_name[key])
+        stage = self.by_name[key]
+        entries = [stage]
+        if source is not None:
+            entries.append(dict(source=source, seconds=0.0, rows=0,
+                                sheets=0, output_bytes=0, maxrss_kb=None))
+            stage['files'].append(entries[-1])
+        return entries
+
+    def stage(self, country, name, source=None):
+        check_stop()
+        cprofile = None
+        # cProfile can't be nested, so only the outermost stage gets it.
+        if self.cprofile_dir is not None and not self.current:
+            cprofile = self.cprofiles.setdefault((country, name),
+                                                 cProfile.Profile())
+        return Stage(self, self.entry(country, name, source), cprofile)
+
+    def record(self, country, name, source, seconds, maxrss, rows=0,
+               sheets=0):
+        # Add a stage run that was timed elsewhere (see timed_call()).
+        stage, f = self.entry(country, name, source)
+        for entry in (stage, f):
+            entry['seconds'] += seconds
+            entry['rows'] += rows
+            entry['sheets'] += sheets
+        f['maxrss_kb'] = maxrss
+        stage['maxrss_kb'] = max(stage['maxrss_kb'] or 0, maxrss or 0)
+
+    def output(self, size):
+        # Bytes written to an output file, counted for the current stage.
+        if self.current:
+            self.current[-1].output(size)
+
+    def dump(self):
+        # Write the cProfile stats. Returns the file names.
+        filenames = []
+        for (country, name), cprofile in self.cprofiles.items():
+            os.makedirs(self.cprofile_dir, exist_ok=True)
+            filenames.append(os.path.join(self.cprofile_dir,
+                                          '%s-%s.prof' % (country, name)))
+            cprofile.dump_stats(filenames[-1])
+        return filenames
+
+
+# The current profiler.
+profiler = NullProfiler()
+
+
+def profiled(func, cprofile_dir=None):
+    # Run func() with a fresh Profiler in place. Returns what func()
+    # returns, the list of stage entries, and the cProfile dump files.
+    global profiler
+    previous = profiler
+    profiler = Profiler(cprofile_dir)
+    try:
+        result = func()
+        return result, profiler.stages, profiler.dump()
+    finally:
+        profiler = previous
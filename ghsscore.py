@@ -0,0 +1,229 @@
+#!/usr/local/bin/python3
+
+# ghsscore.py
+# GreenScreen hazard levels from the GHS classifications. Each hazard class
+# of the common vocabulary (see ghsmatrix) feeds one or more GreenScreen
+# endpoints, and each category maps to a hazard level. All chemicals are
+# scored at once with NumPy lookup tables over the category code arrays of
+# ghsmatrix.build_arrays(), taking the worst case across jurisdictions.
+# `ghscrunch.py score` (or running this module) writes
+# GHS-all/output/greenscreen.csv. Needs NumPy.
+#
+# The mapping tables follow the GHS part of the GreenScreen List
+# Translator, and can be replaced with a JSON file of the same shape as
+# DEFAULT_MAPPING (with --greenscreen-mapping).
+
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy
+
+import ghscrunch
+import ghsmatrix
+
+
+# Hazard levels, from least to most hazardous. Level 0 means no data.
+LEVELS = ('', 'vL', 'L', 'M', 'H', 'vH')
+LEVEL_CODES = {level: n for n, level in enumerate(LEVELS)}
+
+# endpoints: (code, name, common hazard classes that feed it)
+# levels: common hazard class -> category label (as normalized by
+# ghsmatrix.category_label(), or a sentinel label such as 'Not classified')
+# -> level. Labels that aren't listed fall back to their more general form
+# ('Category 1A-1B' -> 'Category 1A' -> 'Category 1'); what is still not
+# listed isn't scored.
+DEFAULT_MAPPING = dict(
+    endpoints=[
+        ('C', 'Carcinogenicity', ['cancer']),
+        ('M', 'Mutagenicity/Genotoxicity', ['mutagen']),
+        ('R', 'Reproductive toxicity', ['repr_tox']),
+        ('AT', 'Acute mammalian toxicity',
+         ['acute_oral', 'acute_derm', 'acute_inhal']),
+        ('ST-single', 'Systemic toxicity/organ effects (single exposure)',
+         ['sys_single']),
+        ('ST-repeat', 'Systemic toxicity/organ effects (repeated exposure)',
+         ['sys_rept', 'sys_organ']),
+        ('SnS', 'Skin sensitization', ['skin_sens']),
+        ('SnR', 'Respiratory sensitization', ['resp_sens']),
+        ('IrS', 'Skin irritation/corrosivity', ['skin_cor']),
+        ('IrE', 'Eye irritation/corrosivity', ['eye_dmg']),
+        ('AA', 'Acute aquatic toxicity', ['aq_acute', 'aquatic']),
+        ('CA', 'Chronic aquatic toxicity', ['aq_chronic', 'aquatic']),
+        ('Rx', 'Reactivity',
+         ['explosive', 'self_react', 'org_perox', 'oxid_gas', 'oxidizer']),
+        ('F', 'Flammability',
+         ['flamm_gas', 'flamm_aer', 'flamm_liq', 'flamm_sol', 'pyrophoric',
+          'self_heat', 'water_fire'])
+        ],
+    levels={
+        'cancer': {'Category 1': 'H', 'Category 2': 'M'},
+        'mutagen': {'Category 1': 'H', 'Category 2': 'M'},
+        'repr_tox': {'Category 1': 'H', 'Category 2': 'M'},
+        'acute_oral': {'Category 1': 'vH', 'Category 2': 'vH',
+                       'Category 3': 'H', 'Category 4': 'M',
+                       'Category 5': 'L'},
+        'acute_derm': {'Category 1': 'vH', 'Category 2': 'vH',
+                       'Category 3': 'H', 'Category 4': 'M',
+                       'Category 5': 'L'},
+        'acute_inhal': {'Category 1': 'vH', 'Category 2': 'vH',
+                        'Category 3': 'H', 'Category 4': 'M',
+                        'Category 5': 'L'},
+        'sys_single': {'Category 1': 'vH', 'Category 2': 'H',
+                       'Category 3': 'M'},
+        'sys_rept': {'Category 1': 'H', 'Category 2': 'M'},
+        'sys_organ': {'Category 1': 'H', 'Category 2': 'M'},
+        'skin_sens': {'Category 1': 'H', 'Category 1A': 'H',
+                      'Category 1B': 'M'},
+        'resp_sens': {'Category 1': 'H', 'Category 1A': 'H',
+                      'Category 1B': 'M'},
+        'skin_cor': {'Category 1': 'vH', 'Category 2': 'H',
+                     'Category 3': 'M'},
+        'eye_dmg': {'Category 1': 'vH', 'Category 2': 'H',
+                    'Category 2A': 'H', 'Category 2B': 'M'},
+        'aq_acute': {'Category 1': 'vH', 'Category 2': 'H',
+                     'Category 3': 'M'},
+        'aq_chronic': {'Category 1': 'vH', 'Category 2': 'H',
+                       'Category 3': 'M', 'Category 4': 'L'},
+        'aquatic': {'Category 1': 'vH', 'Category 2': 'H',
+                    'Category 3': 'M', 'Category 4': 'L'},
+        'explosive': {'Unstable Explosive': 'vH', 'Division 1.1': 'vH',
+                      'Division 1.2': 'vH', 'Division 1.3': 'vH',
+                      'Division 1.4': 'H', 'Division 1.5': 'M',
+                      'Division 1.6': 'M'},
+        'self_react': {'Type A': 'vH', 'Type B': 'vH', 'Type C': 'H',
+                       'Type D': 'H', 'Type E': 'M', 'Type F': 'M',
+                       'Type G': 'L'},
+        'org_perox': {'Type A': 'vH', 'Type B': 'vH', 'Type C': 'H',
+                      'Type D': 'H', 'Type E': 'M', 'Type F': 'M',
+                      'Type G': 'L'},
+        'oxid_gas': {'Category 1': 'H'},
+        'oxidizer': {'Category 1': 'vH', 'Category 2': 'H',
+                     'Category 3': 'M'},
+        'flamm_gas': {'Category 1': 'H', 'Category 2': 'M'},
+        'flamm_aer': {'Category 1': 'H', 'Category 2': 'M'},
+        'flamm_liq': {'Category 1': 'vH', 'Category 2': 'H',
+                      'Category 3': 'M', 'Category 4': 'L'},
+        'flamm_sol': {'Category 1': 'H', 'Category 2': 'M'},
+        'pyrophoric': {'Category 1': 'vH'},
+        'self_heat': {'Category 1': 'H', 'Category 2': 'M'},
+        'water_fire': {'Category 1': 'vH', 'Category 2': 'H',
+                       'Category 3': 'M'}
+        })
+
+
+def load_mapping(filename):
+    # A mapping from a JSON file, checked against the hazard classes and
+    # levels that exist.
+    with open(filename) as f:
+        mapping = json.load(f)
+    hazards = set(key for key, heading in ghsmatrix.COMMON_HAZARDS)
+    for code, name, sources in mapping['endpoints']:
+        for h in sources:
+            if h not in hazards:
+                raise ValueError('%s: unknown hazard class %r for %s' %
+                                 (filename, h, code))
+    for h, table in mapping['levels'].items():
+        if h not in hazards:
+            raise ValueError('%s: unknown hazard class %r' % (filename, h))
+        for label, level in table.items():
+            if level not in LEVEL_CODES:
+                raise ValueError('%s: unknown level %r for %s, %s' %
+                                 (filename, level, h, label))
+    return mapping
+
+
+def general_labels(label):
+    # 'Category 1A-1B', then 'Category 1A', then 'Category 1'.
+    yield label
+    if '-' in label:
+        label = label.split('-')[0]
+        yield label
+    if label[-1:].isalpha() and label[-2:-1].isdigit():
+        yield label[:-1]
+
+
+def level_table(arrays, mapping):
+    # Lookup table of levels: hazard class x (category code + 3), so that
+    # the sentinels -3..-1 and 0 (no data) index it too.
+    hazards = [str(h) for h in arrays['hazard']]
+    labels = [str(c) for c in arrays['category']]
+    sentinels = dict(zip((int(c) for c in arrays['sentinel_code']),
+                         (str(l) for l in arrays['sentinel_label'])))
+    table = numpy.zeros((len(hazards), len(labels) + 4), dtype=numpy.int8)
+    for h, hazard in enumerate(hazards):
+        levels = mapping['levels'].get(hazard, dict())
+        for code in range(-3, len(labels) + 1):
+            if code == 0:
+                continue
+            label = labels[code - 1] if code > 0 else sentinels[code]
+            for l in general_labels(label):
+                if l in levels:
+                    table[h, code + 3] = LEVEL_CODES[levels[l]]
+                    break
+    return table
+
+
+def score(arrays, mapping=DEFAULT_MAPPING):
+    # Score all chemicals. Returns dict(endpoint=codes of the endpoints,
+    # by_jurisdiction=levels as jurisdiction x chemical x endpoint,
+    # levels=worst case across jurisdictions as chemical x endpoint,
+    # worst=worst level of each chemical), levels being indexes into LEVELS.
+    codes = arrays['codes']
+    table = level_table(arrays, mapping)
+    hazard_index = {str(h): i for i, h in enumerate(arrays['hazard'])}
+    # Level of every cell, in one fancy-indexing pass.
+    cells = table[numpy.arange(codes.shape[2]), codes.astype(numpy.intp) + 3]
+    endpoints = mapping['endpoints']
+    by_jurisdiction = numpy.zeros(codes.shape[:2] + (len(endpoints),),
+                                  dtype=numpy.int8)
+    for e, (code, name, sources) in enumerate(endpoints):
+        columns = [hazard_index[h] for h in sources]
+        by_jurisdiction[:, :, e] = cells[:, :, columns].max(axis=2)
+    levels = by_jurisdiction.max(axis=0)
+    return dict(endpoint=numpy.array([e[0] for e in endpoints], dtype=str),
+                by_jurisdiction=by_jurisdiction, levels=levels,
+                worst=levels.max(axis=1))
+
+
+def write_scores(arrays, scores, filename):
+    # One row per chemical that has at least one level, with a column per
+    # endpoint and the chemical's worst level.
+    with ghscrunch.OutputFile(filename, newline='',
+                              buffering=ghscrunch.OUTPUT_BUFFER) as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['CASRN', 'Name'] + list(scores['endpoint']) +
+                        ['Worst'])
+        levels = numpy.array(LEVELS, dtype=object)[scores['levels']]
+        worst = numpy.array(LEVELS, dtype=object)[scores['worst']]
+        for i in numpy.flatnonzero(scores['worst']):
+            writer.writerow([arrays['casrn'][i], arrays['name'][i]] +
+                            list(levels[i]) + [worst[i]])
+
+
+def main(matrix=None, mapping_file=None, root='.',
+         output_dir='GHS-all/output'):
+    # Score the chemicals of the matrix (built from the output files in root
+    # if not given) and write output_dir/greenscreen.csv.
+    mapping = DEFAULT_MAPPING
+    if mapping_file is not None:
+        mapping = load_mapping(mapping_file)
+    if matrix is None:
+        matrix = ghsmatrix.build_matrix(ghsmatrix.read_all(root))
+    arrays = ghsmatrix.build_arrays(matrix)
+    start = time.perf_counter()
+    scores = score(arrays, mapping)
+    seconds = time.perf_counter() - start
+    os.makedirs(output_dir, exist_ok=True)
+    filename = os.path.join(output_dir, 'greenscreen.csv')
+    write_scores(arrays, scores, filename)
+    print('Scored %d chemicals on %d endpoints in %.3f s; wrote %d to %s.' %
+          (len(arrays['casrn']), len(scores['endpoint']), seconds,
+           numpy.count_nonzero(scores['worst']), filename))
+    return scores
+
+
+if __name__ == '__main__':
+    main(mapping_file=sys.argv[1] if len(sys.argv) > 1 else None)
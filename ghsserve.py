@@ -0,0 +1,291 @@
+#!/usr/local/bin/python3
+
+# ghsserve.py
+# Local lookup service over the crunched classifications, so that other
+# tools don't have to load the output files for every lookup. Keeps a
+# GHSIndex in memory and answers JSON queries over HTTP, on a TCP port or a
+# Unix socket. A watcher thread reloads the index in the background when the
+# output files change (and with recrunch, runs ghscrunch.py first when the
+# source workbooks change); the new index replaces the old one in a single
+# assignment, so requests in flight are answered from whichever one they
+# started with.
+#
+#   ./ghscrunch.py serve [--port 8765 | --socket PATH]
+#   curl localhost:8765/lookup/50-00-0
+#   curl -d '{"casrns": ["50-00-0", "71-43-2"]}' localhost:8765/lookup
+#   curl localhost:8765/stats
+
+import http.server
+import json
+import os
+import socketserver
+import stat
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import ghscrunch
+from ghsindex import GHSIndex
+
+# Largest request body accepted, in bytes (a few hundred thousand CASRNs).
+MAX_REQUEST = 16 << 20
+
+JURISDICTIONS = ('jp', 'kr', 'nz')
+
+# Output directories; the manifest is saved after all other output files of
+# a country, so it is what the watcher looks at.
+OUTPUT_DIRS = dict(jp='GHS-jp/output', kr='GHS-kr/output',
+                   nz='GHS-nz/output')
+
+
+def source_files(nz_source=ghscrunch.NZ_SOURCE_FILE):
+    # Source files of each country, for recrunch.
+    return dict(jp=ghscrunch.GHS_jp_2006_files + ghscrunch.GHS_jp_2007_files +
+                ghscrunch.GHS_jp_2008_files,
+                kr=[ghscrunch.KR_SOURCE_FILE], nz=[nz_source])
+
+
+def signature(filenames):
+    # What changes when any of the files does: (mtime, size) of each file,
+    # or None for missing files.
+    result = []
+    for f in filenames:
+        try:
+            st = os.stat(f)
+            result.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            result.append(None)
+    return result
+
+
+def record_json(record):
+    return dict(jurisdiction=record.jurisdiction, casrn=record.casrn,
+                record_id=record.record_id, name=record.name,
+                hazard_class=record.hazard_class,
+                classification=record.classification,
+                fields=list(record.fields))
+
+
+class Service:
+    # The index being served, and the watcher that replaces it.
+
+    def __init__(self, root='.', interval=5.0, recrunch=False,
+                 nz_source=ghscrunch.NZ_SOURCE_FILE):
+        self.root = root
+        self.interval = interval
+        self.recrunch = recrunch
+        self.nz_source = nz_source
+        self.stop = threading.Event()
+        self.current = (None, 0, None)
+        self.reloads = 0
+        self.errors = 0
+        self.watched = self.output_signature()
+        self.sources = self.source_signature()
+        self.load()
+
+    def output_signature(self):
+        return signature([os.path.join(self.root, OUTPUT_DIRS[j],
+                                       'manifest.json')
+                          for j in JURISDICTIONS])
+
+    def source_signature(self):
+        sources = source_files(self.nz_source)
+        return {j: signature([os.path.join(self.root, f)
+                              for f in sources[j]])
+                for j in JURISDICTIONS}
+
+    def load(self):
+        # Build a new index, then swap it in: current is (index, generation,
+        # load time), replaced as a whole.
+        index = GHSIndex.load(self.root)
+        generation = self.current[1] + 1
+        self.current = (index, generation, time.time())
+        print('Loaded generation %d: %d classifications of %d chemicals.' %
+              (generation, index.stats['records'], index.stats['chemicals']))
+
+    def check(self):
+        # One round of the watcher.
+        if self.recrunch:
+            sources = self.source_signature()
+            changed = [j for j in JURISDICTIONS
+                       if sources[j] != self.sources[j]]
+            if changed:
+                self.crunch(changed)
+                self.sources = sources
+        watched = self.output_signature()
+        if watched != self.watched:
+            self.watched = watched
+            self.load()
+            self.reloads += 1
+
+    def crunch(self, countries):
+        # Re-crunch the countries whose source files changed, in a separate
+        # process so that the service keeps answering meanwhile.
+        print('Source files changed, crunching %s.' % ' '.join(countries))
+        command = [sys.executable,
+                   os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'ghscrunch.py')] + countries + \
+                  ['--nz-source', self.nz_source]
+        result = subprocess.run(command, cwd=self.root)
+        if result.returncode != 0:
+            self.errors += 1
+            print('Crunching failed with status %d; still serving '
+                  'generation %d.' % (result.returncode, self.current[1]))
+
+    def watch(self):
+        while not self.stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                # A failed reload leaves the old index in place.
+                self.errors += 1
+                print('Reload failed: %r' % e, file=sys.stderr)
+
+    def start(self):
+        thread = threading.Thread(target=self.watch, daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        index, generation, loaded_at = self.current
+        return dict(index.stats, generation=generation, loaded_at=loaded_at,
+                    reloads=self.reloads, errors=self.errors)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # GET /lookup/CASRN, GET /lookup?casrn=A&casrn=B, POST /lookup with
+    # {"casrns": [...]} or a plain list, and GET /stats. Lookups answer
+    # {"results": {CASRN: [classification, ...]}, "generation": N}.
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # Unix socket clients have no address.
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def send_json(self, status, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def lookup(self, casrns):
+        # Take the index once, so the whole answer comes from one
+        # generation even if a reload happens meanwhile.
+        index, generation, loaded_at = self.server.service.current
+        results = index.lookup_many(casrns)
+        return dict(generation=generation,
+                    results={c: [record_json(r) for r in records]
+                             for c, records in results.items()})
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/stats':
+            self.send_json(200, self.server.service.stats())
+        elif url.path.startswith('/lookup/'):
+            casrn = urllib.parse.unquote(url.path[len('/lookup/'):])
+            self.send_json(200, self.lookup([casrn]))
+        elif url.path == '/lookup':
+            query = urllib.parse.parse_qs(url.query)
+            self.send_json(200, self.lookup(query.get('casrn', [])))
+        else:
+            self.send_json(404, dict(error='not found'))
+
+    def do_POST(self):
+        if urllib.parse.urlsplit(self.path).path != '/lookup':
+            self.send_json(404, dict(error='not found'))
+            return
+        # The body can't be read (or skipped) without a valid length, so
+        # the connection is closed after any of these errors.
+        length = self.headers.get('Content-Length')
+        error = None
+        if length is None:
+            error = 411, 'Content-Length required'
+        elif not length.strip().isdigit():
+            error = 400, 'invalid Content-Length: %r' % length
+        elif int(length) > MAX_REQUEST:
+            error = 413, 'request too large'
+        if error is not None:
+            self.close_connection = True
+            self.send_json(error[0], dict(error=error[1]))
+            return
+        length = int(length)
+        try:
+            query = json.loads(self.rfile.read(length) or b'null')
+            if isinstance(query, dict):
+                query = query.get('casrns')
+            if not isinstance(query, list) or \
+                    not all(isinstance(c, str) for c in query):
+                raise ValueError('expected a list of CASRN strings')
+        except ValueError as e:
+            self.send_json(400, dict(error=str(e)))
+            return
+        self.send_json(200, self.lookup(query))
+
+
+class HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+def serve(service, host='127.0.0.1', port=8765, socket_path=None):
+    # Serve until interrupted. A socket left at socket_path by an earlier
+    # run is replaced, but nothing else is.
+    if socket_path is not None:
+        if is_socket(socket_path):
+            os.remove(socket_path)
+        elif os.path.lexists(socket_path):
+            sys.exit('%s exists and is not a socket.' % socket_path)
+        server = UnixHTTPServer(socket_path, Handler)
+        where = socket_path
+    else:
+        server = HTTPServer((host, port), Handler)
+        where = 'http://%s:%d/' % server.server_address[:2]
+    server.service = service
+    service.start()
+    print('Serving on %s.' % where)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop.set()
+        server.server_close()
+        if socket_path is not None and is_socket(socket_path):
+            os.remove(socket_path)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve GHS classification \
+                lookups.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', metavar='PATH',
+                        help='Listen on a Unix socket instead of a port.')
+    parser.add_argument('--interval', type=float, default=5.0,
+                        help='Seconds between checks for changed files.')
+    parser.add_argument('--recrunch', action='store_true',
+                        help='Run ghscrunch.py when source files change.')
+    args = parser.parse_args()
+    serve(Service(interval=args.interval, recrunch=args.recrunch),
+          args.host, args.port, args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+#!/usr/local/bin/python3
+
+# ghstext.py
+# Full-text index of the free text in the crunched results: the Japan
+# "Rationale for classification" of each chemical and hazard class, and the
+# NZ key studies of each substance and HSNO code. A document is one such
+# field, identified by (jurisdiction, CASRN field, hazard class or HSNO
+# code). The index is an inverted index in a SQLite database: a postings
+# row per term and document, with the positions of the term in the
+# document, so that phrase queries don't have to look at the text.
+#
+# `ghscrunch.py jp nz --text-index PATH` updates the index with the results
+# of the countries that were processed. Documents whose text hasn't changed
+# (by hash) are left alone, so when one source workbook changes only the
+# chemicals it touches are tokenized again.
+#
+#   ./ghstext.py PATH '"OECD TG 471"'    # phrase
+#   ./ghstext.py PATH ld50 rat           # all of these terms
+#   ./ghstext.py PATH '"key study" mutagen*'
+#
+# Terms are runs of letters and digits, lowercased; a query word that
+# tokenizes into several terms (like 'mg/kg' or '1332-21-4') is a phrase,
+# and a word ending in * matches all terms with that prefix.
+
+import array
+import collections
+import hashlib
+import re
+import sqlite3
+import sys
+
+import ghscrunch
+import ghsindex
+
+
+TOKEN = re.compile(r'\w+')
+QUERY = re.compile(r'"([^"]*)"|(\S+)')
+
+TEXT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    jurisdiction TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    casrn TEXT NOT NULL,
+    hazard_class TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    UNIQUE (jurisdiction, record_id, hazard_class)
+);
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term_id INTEGER NOT NULL,
+    doc_id INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY (term_id, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings(doc_id);
+"""
+
+# One search result.
+Hit = collections.namedtuple('Hit',
+    'jurisdiction casrn record_id hazard_class')
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+def jp_documents(chemicals):
+    # (record_id, hazard class, text) for the rationales in what
+    # crunch_jp() returns. Like the output files, classifications with an
+    # empty category are left out.
+    for casrn in sorted(chemicals.keys()):
+        for h, datalist in zip(ghscrunch.JP_HAZARD_CLASSES,
+                               chemicals[casrn].hazards):
+            if ghscrunch.jp_sublist(datalist[0], datalist[1])[0] == '':
+                continue
+            text = str(datalist[5])
+            if text.strip() != '':
+                yield casrn, h, text
+
+
+def nz_documents(nz):
+    # (record_id, HSNO code, text) for the key studies in what crunch_nz()
+    # returns, joined the same way as in the output files.
+    for dest, casrn_field, casrn, name, thisclass in nz['screened']:
+        for c in sorted(thisclass.keys()):
+            text = '\n'.join(thisclass[c])
+            if text.strip() != '':
+                yield casrn_field, c, text
+
+
+class TextIndex:
+    # The index in the SQLite database at path (created if needed). Terms
+    # are looked up through the unique index on terms.term, which also
+    # serves prefix queries as a range scan.
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(TEXT_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def update(self, jurisdiction, documents):
+        # Make the index's documents of a jurisdiction the given ones, an
+        # iterable of (record_id, hazard class, text). Only new and changed
+        # documents are tokenized. All in one transaction, so readers see
+        # the old or the new index. Returns dict of counts.
+        conn = self.conn
+        counts = dict(added=0, changed=0, removed=0, unchanged=0)
+        with conn:
+            existing = {(r, h): (i, digest) for i, r, h, digest in
+                        conn.execute('SELECT id, record_id, hazard_class, '
+                                     'text_hash FROM documents WHERE '
+                                     'jurisdiction = ?', (jurisdiction,))}
+            term_ids = dict(conn.execute('SELECT term, id FROM terms'))
+            next_id = max(term_ids.values(), default=0) + 1
+            new_terms = []
+            postings = []
+            for record_id, hazard_class, text in documents:
+                digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+                old = existing.pop((record_id, hazard_class), None)
+                if old is not None and old[1] == digest:
+                    counts['unchanged'] += 1
+                    continue
+                if old is not None:
+                    doc_id = old[0]
+                    conn.execute('DELETE FROM postings WHERE doc_id = ?',
+                                 (doc_id,))
+                    conn.execute('UPDATE documents SET text_hash = ? '
+                                 'WHERE id = ?', (digest, doc_id))
+                    counts['changed'] += 1
+                else:
+                    doc_id = conn.execute(
+                        'INSERT INTO documents (jurisdiction, record_id, '
+                        'casrn, hazard_class, text_hash) VALUES '
+                        '(?, ?, ?, ?, ?)',
+                        (jurisdiction, record_id,
+                         ghsindex.normalize_casrn(record_id), hazard_class,
+                         digest)).lastrowid
+                    counts['added'] += 1
+                positions = dict()
+                for n, term in enumerate(tokenize(text)):
+                    positions.setdefault(term, array.array('I')).append(n)
+                for term, p in positions.items():
+                    if term not in term_ids:
+                        term_ids[term] = next_id
+                        new_terms.append((next_id, term))
+                        next_id += 1
+                    postings.append((term_ids[term], doc_id, p.tobytes()))
+            # Terms are never removed; ones that no document uses anymore
+            # just have no postings.
+            conn.executemany('INSERT INTO terms VALUES (?, ?)', new_terms)
+            conn.executemany('INSERT INTO postings VALUES (?, ?, ?)',
+                             postings)
+            for doc_id, digest in existing.values():
+                conn.execute('DELETE FROM postings WHERE doc_id = ?',
+                             (doc_id,))
+                conn.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+                counts['removed'] += 1
+        return counts
+
+    def postings(self, term):
+        # {doc_id: positions} of a term.
+        return {doc_id: array.array('I', blob) for doc_id, blob in
+                self.conn.execute(
+                    'SELECT doc_id, positions FROM postings JOIN terms '
+                    'ON terms.id = term_id WHERE term = ?', (term,))}
+
+    def term_docs(self, term):
+        return set(self.postings(term))
+
+    def prefix_docs(self, prefix):
+        # Documents with any term that starts with prefix.
+        return set(doc_id for doc_id, in self.conn.execute(
+            'SELECT doc_id FROM postings JOIN terms ON terms.id = term_id '
+            'WHERE term >= ? AND term < ?', (prefix, prefix + '\U0010ffff')))
+
+    def phrase_docs(self, terms):
+        # Documents with the terms in this order, one after another.
+        if len(terms) == 1:
+            return self.term_docs(terms[0])
+        postings = [self.postings(t) for t in terms]
+        docs = set(postings[0])
+        for p in postings[1:]:
+            docs &= set(p)
+        found = set()
+        for doc_id in docs:
+            following = [set(p[doc_id]) for p in postings[1:]]
+            for start in postings[0][doc_id]:
+                if all(start + n + 1 in f for n, f in enumerate(following)):
+                    found.add(doc_id)
+                    break
+        return found
+
+    def search(self, query, jurisdiction=None):
+        # Documents that match every part of the query (see the top of this
+        # file), as Hits sorted by jurisdiction, CASRN and hazard class.
+        docs = None
+        for phrase, word in QUERY.findall(query):
+            if word.endswith('*') and TOKEN.fullmatch(word[:-1]):
+                found = self.prefix_docs(word[:-1].lower())
+            else:
+                terms = tokenize(phrase or word)
+                if not terms:
+                    continue
+                found = self.phrase_docs(terms)
+            docs = found if docs is None else docs & found
+            if not docs:
+                return []
+        if docs is None:
+            return []
+        hits = []
+        ids = sorted(docs)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            hits.extend(Hit(*row) for row in self.conn.execute(
+                'SELECT jurisdiction, casrn, record_id, hazard_class FROM '
+                'documents WHERE id IN (%s)' % ','.join('?' * len(chunk)),
+                chunk))
+        return sorted(h for h in hits
+                      if jurisdiction in (None, h.jurisdiction))
+
+    def stats(self):
+        return dict((name, self.conn.execute(
+            'SELECT count(*) FROM ' + name).fetchone()[0])
+            for name in ('documents', 'terms', 'postings'))
+
+
+def update_index(path, jp=None, nz=None):
+    # Update the index at path with what crunch_jp() and crunch_nz()
+    # returned (None for countries that weren't processed).
+    with TextIndex(path) as index:
+        for jurisdiction, result, documents in (('jp', jp, jp_documents),
+                                                ('nz', nz, nz_documents)):
+            if result is None:
+                continue
+            counts = index.update(jurisdiction, documents(result))
+            print('Text index %s, %s: %d documents added, %d changed, '
+                  '%d removed, %d unchanged.' %
+                  (path, jurisdiction, counts['added'], counts['changed'],
+                   counts['removed'], counts['unchanged']))
+
+
+def main():
+    if len(sys.argv) < 3:
+        print('Usage: ghstext.py INDEX QUERY...', file=sys.stderr)
+        sys.exit(2)
+    with TextIndex(sys.argv[1]) as index:
+        for hit in index.search(' '.join(sys.argv[2:])):
+            print('\t'.join(hit))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+#!/usr/local/bin/python3
+
+# ghsvocab.py
+# Vocabulary tables for GHS and HSNO classifications: GHS chapters (hazard
+# classes), H-statements, and GHS translations of HSNO classifications.
+# The tables are built once, when the module is imported, and are
+# read-only.
+
+import functools
+import re
+import sys
+import types
+
+
+def frozen(table):
+    # Read-only view of a dict, with interned keys.
+    return types.MappingProxyType({sys.intern(k): v for k, v in table.items()})
+
+
+# Hazard classes by GHS chapter reference. Accurate to GHS Revision 4.
+GHS_CHAPTERS = frozen({
+    '2.1': 'Explosives',
+    '2.2': 'Flammable gases',
+    '2.3': 'Aerosols',
+    '2.4': 'Oxidizing gases',
+    '2.5': 'Gases under pressure',
+    '2.6': 'Flammable liquids',
+    '2.7': 'Flammable solids',
+    '2.8': 'Self-reactive substances and mixtures',
+    '2.9': 'Pyrophoric liquids',
+    '2.10': 'Pyrophoric solids',
+    '2.11': 'Self-heating substances and mixtures',
+    '2.12': 'Substances and mixtures which, in contact with water, emit flammable gases',
+    '2.13': 'Oxidizing liquids',
+    '2.14': 'Oxidizing solids',
+    '2.15': 'Organic peroxides',
+    '2.16': 'Corrosive to metals',
+    '3.1': 'Acute toxicity',
+    '3.2': 'Skin corrosion/irritation',
+    '3.3': 'Serious eye damage/irritation',
+    '3.4': 'Respiratory or skin sensitization',
+    '3.5': 'Germ cell mutagenicity',
+    '3.6': 'Carcinogenicity',
+    '3.7': 'Reproductive toxicity',
+    '3.8': 'Specific target organ toxicity - Single exposure',
+    '3.9': 'Specific target organ toxicity - Repeated exposure',
+    '3.10': 'Aspiration hazard',
+    '4.1': 'Hazardous to the aquatic environment',
+    '4.2': 'Hazardous to the ozone layer'
+    })
+
+# H-statements: List from GHS Revision 4. The abbreviated combinations
+# (e.g. H302 + H332) are handled by h_statement().
+H_STATEMENTS = frozen({
+    'H200': 'Unstable explosive',
+    'H201': 'Explosive; mass explosion hazard',
+    'H202': 'Explosive; severe projection hazard',
+    'H203': 'Explosive; fire, blast or projection hazard',
+    'H204': 'Fire or projection hazard',
+    'H205': 'May mass explode in fire',
+    'H220': 'Extremely flammable gas',
+    'H221': 'Flammable gas',
+    'H222': 'Extremely flammable aerosol',
+    'H223': 'Flammable aerosol',
+    'H224': 'Extremely flammable liquid and vapour',
+    'H225': 'Highly flammable liquid and vapour',
+    'H226': 'Flammable liquid and vapour',
+    'H227': 'Combustible liquid',
+    'H228': 'Flammable solid',
+    'H229': 'Pressurized container: may burst if heated',
+    'H230': 'May react explosively even in the absence of air',
+    'H231': 'May react explosively even in the absence of air at elevated pressure and/or temperature',
+    'H240': 'Heating may cause an explosion',
+    'H241': 'Heating may cause a fire or explosion',
+    'H242': 'Heating may cause a fire',
+    'H250': 'Catches fire spontaneously if exposed to air',
+    'H251': 'Self-heating; may catch fire',
+    'H252': 'Self-heating in large quantities; may catch fire',
+    'H260': 'In contact with water releases flammable gases which may ignite spontaneously',
+    'H261': 'In contact with water releases flammable gas',
+    'H270': 'May cause or intensify fire; oxidizer',
+    'H271': 'May cause fire or explosion; strong oxidizer',
+    'H272': 'May intensify fire; oxidizer',
+    'H280': 'Contains gas under pressure; may explode if heated',
+    'H281': 'Contains refrigerated gas; may cause cryogenic burns or injury',
+    'H290': 'May be corrosive to metals',
+    'H300': 'Fatal if swallowed',
+    'H301': 'Toxic if swallowed',
+    'H302': 'Harmful if swallowed',
+    'H303': 'May be harmful if swallowed',
+    'H304': 'May be fatal if swallowed and enters airways',
+    'H305': 'May be harmful if swallowed and enters airways',
+    'H310': 'Fatal in contact with skin',
+    'H311': 'Toxic in contact with skin',
+    'H312': 'Harmful in contact with skin',
+    'H313': 'May be harmful in contact with skin',
+    'H314': 'Causes severe skin burns and eye damage',
+    'H315': 'Causes skin irritation',
+    'H316': 'Causes mild skin irritation',
+    'H317': 'May cause an allergic skin reaction',
+    'H318': 'Causes serious eye damage',
+    'H319': 'Causes serious eye irritation',
+    'H320': 'Causes eye irritation',
+    'H330': 'Fatal if inhaled',
+    'H331': 'Toxic if inhaled',
+    'H332': 'Harmful if inhaled',
+    'H333': 'May be harmful if inhaled',
+    'H334': 'May cause allergy or asthma symptoms or breathing difficulties if inhaled',
+    'H335': 'May cause respiratory irritation',
+    'H336': 'May cause drowsiness or dizziness',
+    'H340': 'May cause genetic defects',
+    'H341': 'Suspected of causing genetic defects',
+    'H350': 'May cause cancer',
+    'H351': 'Suspected of causing cancer',
+    'H360': 'May damage fertility or the unborn child',
+    'H361': 'Suspected of damaging fertility or the unborn child',
+    'H362': 'May cause harm to breast-fed children',
+    'H370': 'Causes damage to organs',
+    'H371': 'May cause damage to organs',
+    'H372': 'Causes damage to organs through prolonged or repeated exposure',
+    'H373': 'May cause damage to organs through prolonged or repeated exposure',
+    'H400': 'Very toxic to aquatic life',
+    'H401': 'Toxic to aquatic life',
+    'H402': 'Harmful to aquatic life',
+    'H410': 'Very toxic to aquatic life with long lasting effects',
+    'H411': 'Toxic to aquatic life with long lasting effects',
+    'H412': 'Harmful to aquatic life with long lasting effects',
+    'H413': 'May cause long lasting harmful effects to aquatic life',
+    'H420': 'Harms public health and the environment by destroying ozone in the upper atmosphere'
+    })
+
+# These are GHS translations of the HSNO classes/categories, used to create
+# a 'Hazard description' field: (GHS hazard class, GHS category), or '' for
+# classes that aren't GHS-translatable.
+HSNO_GHS = frozen({
+    '1.1': ('Explosives', 'Division 1.1'),
+    '1.2': ('Explosives', 'Division 1.2'),
+    '1.3': ('Explosives', 'Division 1.3'),
+    '1.4': ('Explosives', 'Division 1.4'),
+    '1.5': ('Explosives', 'Division 1.5'),
+    '1.6': ('Explosives', 'Division 1.6'),
+    '2.1.1A': ('Flammable gases', 'Category 1'),
+    '2.1.1B': ('Flammable gases', 'Category 2'),
+    '2.1.2A': ('Flammable aerosols', 'Category 1'),
+    '3.1A': ('Flammable liquids', 'Category 1'),
+    '3.1B': ('Flammable liquids', 'Category 2'),
+    '3.1C': ('Flammable liquids', 'Category 3'),
+    '3.1D': ('Flammable liquids', 'Category 4'),
+    '4.1.1A': ('Flammable solids', 'Category 1'),
+    '4.1.1B': ('Flammable solids', 'Category 2'),
+    '4.1.2A': ('Self-reactive substances and mixtures', 'Type A'),
+    '4.1.2B': ('Self-reactive substances and mixtures', 'Type B'),
+    '4.1.2C': ('Self-reactive substances and mixtures', 'Type C'),
+    '4.1.2D': ('Self-reactive substances and mixtures', 'Type D'),
+    '4.1.2E': ('Self-reactive substances and mixtures', 'Type E'),
+    '4.1.2F': ('Self-reactive substances and mixtures', 'Type F'),
+    '4.1.2G': ('Self-reactive substances and mixtures', 'Type G'),
+    # HSNO doesn't distinguish pyrophoric liquids and solids.
+    '4.2A': ('Pyrophoric substances', 'Category 1'),
+    '4.2B': ('Self-heating substances and mixtures', 'Category 1'),
+    '4.2C': ('Self-heating substances and mixtures', 'Category 2'),
+    '4.3A': ('Substances and mixtures, which in contact with water, emit flammable gases', 'Category 1'),
+    '4.3B': ('Substances and mixtures, which in contact with water, emit flammable gases', 'Category 2'),
+    '4.3C': ('Substances and mixtures, which in contact with water, emit flammable gases', 'Category 3'),
+    # HSNO doesn't distinguish between oxidizing liquids and solids 
+    # but does distinguish them from oxidizing gases.
+    '5.1.1A': ('Oxidizing liquids/solids', 'Category 1'),
+    '5.1.1B': ('Oxidizing liquids/solids', 'Category 2'),
+    '5.1.1C': ('Oxidizing liquids/solids', 'Category 3'),
+    '5.1.2A': ('Oxidizing gases', 'Category 1'),
+    '5.2A': ('Organic peroxides', 'Type A'),
+    '5.2B': ('Organic peroxides', 'Type B'),
+    '5.2C': ('Organic peroxides', 'Type C'),
+    '5.2D': ('Organic peroxides', 'Type D'),
+    '5.2E': ('Organic peroxides', 'Type E'),
+    '5.2F': ('Organic peroxides', 'Type F'),
+    '5.2G': ('Organic peroxides', 'Type G'),
+    '6.1A (dermal)': ('Acute toxicity: Dermal', 'Category 1'),
+    '6.1A (inhalation)': ('Acute toxicity: Inhalation', 'Category 1'),
+    '6.1A (oral)': ('Acute toxicity: Oral', 'Category 1'),
+    '6.1B (dermal)': ('Acute toxicity: Dermal', 'Category 2'),
+    '6.1B (inhalation)': ('Acute toxicity: Inhalation', 'Category 2'),
+    '6.1B (oral)': ('Acute toxicity: Oral', 'Category 2'),
+    '6.1C (dermal)': ('Acute toxicity: Dermal', 'Category 3'),
+    '6.1C (inhalation)': ('Acute toxicity: Inhalation', 'Category 3'),
+    '6.1C (oral)': ('Acute toxicity: Oral', 'Category 3'),
+    '6.1D (dermal)': ('Acute toxicity: Dermal', 'Category 4'),
+    '6.1D (inhalation)': ('Acute toxicity: Inhalation', 'Category 4'),
+    '6.1D (oral)': ('Acute toxicity: Oral', 'Category 4'),
+    '6.1E (dermal)': ('Acute toxicity: Dermal', 'Category 5'),
+    '6.1E (inhalation)': ('Acute toxicity: Inhalation', 'Category 5'),
+    '6.1E (oral)': ('Acute toxicity: Oral', 'Category 5'),
+    '6.3A': ('Skin corrosion/irritation', 'Category 2'),
+    '6.3B': ('Skin corrosion/irritation', 'Category 3'),
+    # 6.4A is both Category 2A and 2B.
+    '6.4A': ('Serious eye damage/eye irritation', 'Category 2'),
+    '6.5A (respiratory)': ('Respiratory sensitization', 'Category 1'),
+    '6.5B (contact)': ('Skin sensitization', 'Category 1'),
+    # 6.6A is both Category 1A and 1B.
+    '6.6A': ('Germ cell mutagenicity', 'Category 1'),
+    '6.6B': ('Germ cell mutagenicity', 'Category 2'),
+    # 6.7A is both Category 1A and 1B.
+    '6.7A': ('Carcinogenicity', 'Category 1'),
+    '6.7B': ('Carcinogenicity', 'Category 2'),
+    # 6.8A is both Category 1A and 1B.
+    '6.8A': ('Reproductive toxicity', 'Category 1'),
+    '6.8B': ('Reproductive toxicity', 'Category 2'),
+    '6.8C': ('Reproductive toxicity', 'Effects on or via lactation'),
+    # HSNO doesn't distinguish between single or repeated exposure,
+    # but does distinguish among exposure routes.
+    '6.9A (dermal)': ('Specific Target Organ Systemic Toxicity', 'Category 1'),
+    '6.9A (inhalation)': ('Specific Target Organ Systemic Toxicity', 'Category 1'),
+    '6.9A (oral)': ('Specific Target Organ Systemic Toxicity', 'Category 1'),
+    '6.9A (other)': ('Specific Target Organ Systemic Toxicity', 'Category 1'),
+    '6.9B (dermal)': ('Specific Target Organ Systemic Toxicity', 'Category 2'),
+    '6.9B (inhalation)': ('Specific Target Organ Systemic Toxicity', 'Category 2'),
+    '6.9B (oral)': ('Specific Target Organ Systemic Toxicity', 'Category 2'),
+    '6.9B (other)': ('Specific Target Organ Systemic Toxicity', 'Category 2'),
+    '8.1A': ('Corrosive to metals', 'Category 1'),
+    '8.2A': ('Skin corrosion/irritation', 'Category 1A'),
+    '8.2B': ('Skin corrosion/irritation', 'Category 1B'),
+    '8.2C': ('Skin corrosion/irritation', 'Category 1C'),
+    '8.3A': ('Serious eye damage/eye irritation', 'Category 1'),
+    # In 9.1A, HSNO doesn't distinguish between acute and chronic.
+    '9.1A (algal)': ('Aquatic toxicity (Acute or Chronic)', 'Category 1'),
+    '9.1A (crustacean)': ('Aquatic toxicity (Acute or Chronic)', 'Category 1'),
+    '9.1A (fish)': ('Aquatic toxicity (Acute or Chronic)', 'Category 1'),
+    '9.1A (other)': ('Aquatic toxicity (Acute or Chronic)', 'Category 1'),
+    '9.1B (algal)': ('Aquatic toxicity (Chronic)', 'Category 2'),
+    '9.1B (crustacean)': ('Aquatic toxicity (Chronic)', 'Category 2'),
+    '9.1B (fish)': ('Aquatic toxicity (Chronic)', 'Category 2'),
+    '9.1B (other)': ('Aquatic toxicity (Chronic)', 'Category 2'),
+    '9.1C (algal)': ('Aquatic toxicity (Chronic)', 'Category 3'),
+    '9.1C (crustacean)': ('Aquatic toxicity (Chronic)', 'Category 3'),
+    '9.1C (fish)': ('Aquatic toxicity (Chronic)', 'Category 3'),
+    '9.1C (other)': ('Aquatic toxicity (Chronic)', 'Category 3'),
+    # The mapping of 9.1D to GHS is very odd.
+    '9.1D (algal)': ('Aquatic toxicity', 'Category 2-3 (Acute) or Category 4 (Chronic)'),
+    '9.1D (crustacean)': ('Aquatic toxicity', 'Category 2-3 (Acute) or Category 4 (Chronic)'),
+    '9.1D (fish)': ('Aquatic toxicity', 'Category 2-3 (Acute) or Category 4 (Chronic)'),
+    '9.1D (other)': ('Aquatic toxicity', 'Category 2-3 (Acute) or Category 4 (Chronic)'),
+    # Classes that aren't GHS-translatable:
+    '3.2A': '', # Liquid desensitized explosives
+    '3.2B': '', # Liquid desensitized explosives
+    '3.2C': '', # Liquid desensitized explosives
+    '4.1.3A': '', # Solid desensitized explosives: high hazard
+    '4.1.3B': '', # Solid desensitized explosives: medium hazard
+    '4.1.3C': '', # Solid desensitized explosives: low hazard
+    '9.2A': '', # Ecotoxic to soil environment
+    '9.2B': '', # Ecotoxic to soil environment
+    '9.2C': '', # Ecotoxic to soil environment
+    '9.2D': '', # Ecotoxic to soil environment
+    '9.3A': '', # Ecotoxic to terrestrial vertebrates
+    '9.3B': '', # Ecotoxic to terrestrial vertebrates
+    '9.3C': '', # Ecotoxic to terrestrial vertebrates
+    '9.4A': '', # Ecotoxic to terrestrial invertebrates
+    '9.4B': '', # Ecotoxic to terrestrial invertebrates
+    '9.4C': '', # Ecotoxic to terrestrial invertebrates
+    })
+
+# Reverse lookups, from hazard class or H-statement text to the code.
+GHS_CHAPTER_REFS = frozen({v: k for k, v in GHS_CHAPTERS.items()})
+H_STATEMENT_CODES = frozen({v: k for k, v in H_STATEMENTS.items()})
+
+# Separator of combined H-statement codes, e.g. 'H302 + H332'.
+H_COMBINATION = re.compile(r'\s*\+\s*')
+
+
+def ghs_hazard(ref):
+    # Look up the hazard class based on GHS chapter reference.
+    return GHS_CHAPTERS[ref]
+
+
+def ghs_chapter(hazard_class):
+    # Look up the GHS chapter reference of a hazard class.
+    return GHS_CHAPTER_REFS[hazard_class]
+
+
+def h_codes(h):
+    # Split a (possibly combined) H-statement code into its parts:
+    # 'H302 + H332' -> ('H302', 'H332').
+    if '+' not in h:
+        return (h.strip(),)
+    return tuple(H_COMBINATION.split(h.strip()))
+
+
+def h_statement(h):
+    # Look up the text of an H-statement code. Combined codes like
+    # 'H302 + H332' give the texts of their parts joined with ' + '.
+    # Raises KeyError for unknown codes.
+    if h in H_STATEMENTS:
+        return H_STATEMENTS[h]
+    return combined_statement(h)
+
+
+@functools.lru_cache(maxsize=None)
+def combined_statement(h):
+    return ' + '.join(H_STATEMENTS[c] for c in h_codes(h))
+
+
+def h_code(statement):
+    # Look up the H-statement code for the text of an H-statement.
+    return H_STATEMENT_CODES[statement]
@@ -0,0 +1,44 @@
+# Shared helpers for the tests. The modules live in the repository root.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ghscrunch
+
+
+def jp_batch(chemicals):
+    # A batch for ghscrunch.merge_jp(), like read_jp_workbook() makes: for
+    # each (name, CASRN, {hazard class: (hazard name, classification)}),
+    # a sheet with those classifications and nothing for the other hazard
+    # classes.
+    batch = []
+    for name, casrn, classes in chemicals:
+        hazards = []
+        for h in ghscrunch.JP_HAZARD_CLASSES:
+            hazard_name, classification = classes.get(h, (h, ''))
+            hazards.append((h, (hazard_name, classification, '-', '-', '-',
+                                'Rationale for ' + h, '2006/3/31')))
+        batch.append((name, (casrn,), tuple(hazards)))
+    return batch
+
+
+@pytest.fixture
+def jp_output(tmp_path, monkeypatch):
+    # Write the Japan CSV output files for some chemicals (see jp_batch())
+    # under tmp_path, which becomes the working directory. Returns a
+    # function that takes the chemicals and returns the merged dict.
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('GHS-jp/output')
+    source = 'GHS-jp/source.xls'
+    with open(source, 'wb') as f:
+        f.write(b'not really a workbook')
+
+    def write(chemicals):
+        merged = dict()
+        ghscrunch.merge_jp(merged, jp_batch(chemicals), dict(), 0)
+        ghscrunch.write_jp_csv(merged, [source])
+        return merged
+    return write
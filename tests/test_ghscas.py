@@ -0,0 +1,105 @@
+import pytest
+
+import ghscas
+
+
+CASRNS = ['7732-18-5', '50-00-0', '1332-21-4', '7440-44-0', '64-17-5',
+          '7732-18-4', '0050-00-0', ' 50-00-0 ', '50-0-0', '05-00-0', '',
+          '12345678-90-1', 'ID123', '７７３２-18-5', '64　17-5']
+
+
+def test_check_digit():
+    # (8*1 + 1*2 + 2*3 + 3*4 + 7*5 + 7*6) % 10 == 5
+    assert ghscas.check_digit('7732-18') == 5
+    assert ghscas.check_digit('773218') == 5
+    assert ghscas.check_digit('50-00') == 0
+
+
+def test_check_digit_needs_ascii_digits():
+    with pytest.raises(ValueError):
+        ghscas.check_digit('7７３２-18')
+
+
+@pytest.mark.parametrize('casrn, valid', [
+    ('7732-18-5', True), ('50-00-0', True), ('1332-21-4', True),
+    ('7732-18-4', False), ('050-00-0', False), ('5-00-0', False),
+    ('12345678-90-1', False), ('50-0-0', False), ('50-00-00', False),
+    ('', False), ('ID123', False)])
+def test_valid_casrn(casrn, valid):
+    assert ghscas.valid_casrn(casrn) is valid
+
+
+def test_normalize_casrn():
+    assert ghscas.normalize_casrn(' 0050-00-0 ') == '50-00-0'
+    assert ghscas.normalize_casrn('64　17-5') == '6417-5'
+    # Leading zeros are only stripped from well-formed CASRNs.
+    assert ghscas.normalize_casrn('0ID') == '0ID'
+
+
+def test_columns_match_scalar_functions():
+    pytest.importorskip('numpy')
+    normalized = ghscas.normalize(CASRNS)
+    assert list(normalized) == [ghscas.normalize_casrn(c) for c in CASRNS]
+    assert list(ghscas.validate(normalized)) == \
+        [ghscas.valid_casrn(c) for c in normalized]
+
+
+def test_columns_without_numpy(monkeypatch):
+    monkeypatch.setattr(ghscas, 'numpy', None)
+    normalized = ghscas.normalize(CASRNS)
+    assert normalized == [ghscas.normalize_casrn(c) for c in CASRNS]
+    assert ghscas.validate(normalized) == \
+        [ghscas.valid_casrn(c) for c in normalized]
+
+
+def test_columns_in_chunks(monkeypatch):
+    pytest.importorskip('numpy')
+    monkeypatch.setattr(ghscas, 'CHUNK', 4)
+    normalized = ghscas.normalize(CASRNS)
+    assert list(normalized) == [ghscas.normalize_casrn(c) for c in CASRNS]
+    assert list(ghscas.validate(normalized)) == \
+        [ghscas.valid_casrn(c) for c in normalized]
+
+
+def test_empty_column():
+    assert len(ghscas.validate([])) == 0
+    assert len(ghscas.normalize([])) == 0
+
+
+@pytest.mark.parametrize('with_numpy', [True, False])
+def test_dedupe(monkeypatch, with_numpy):
+    if with_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(ghscas, 'numpy', None)
+    column = ['50-00-0', '0050-00-0', '64-17-5', ' 50-00-0']
+    unique, where = ghscas.dedupe(column)
+    assert list(unique) == ['50-00-0', '64-17-5']
+    assert list(where) == [0, 0, 1, 0]
+
+
+# Non-ASCII digits (full-width, Arabic-Indic) are not CASRN digits, with or
+# without NumPy.
+NON_ASCII = ['7７３２-18-5', '０50-00-0', '0７７-18-5', '٥٠-٠٠-٠', '50-00-٠',
+             '7732-１8-5']
+
+
+@pytest.mark.parametrize('with_numpy', [True, False])
+def test_non_ascii_digits(monkeypatch, with_numpy):
+    if with_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(ghscas, 'numpy', None)
+    normalized = ghscas.normalize(NON_ASCII)
+    # Not well-formed, so leading zeros stay.
+    assert list(normalized) == NON_ASCII
+    assert list(ghscas.validate(normalized)) == [False] * len(NON_ASCII)
+    assert [ghscas.valid_casrn(c) for c in NON_ASCII] == \
+        [False] * len(NON_ASCII)
+
+
+def test_non_ascii_digits_are_a_bad_format():
+    pytest.importorskip('numpy')
+    problems, summary = ghscas.check({'jp': ['7７３２-18-5', 'ID123']})
+    assert [(p[1], p[3]) for p in problems] == [
+        ('7７３２-18-5', ghscas.BAD_FORM), ('ID123', ghscas.NOT_CASRN)]
@@ -0,0 +1,155 @@
+import pytest
+
+import ghscrunch
+import ghsindex
+
+
+ROWS = [
+    ['_v1_50-00-0', 'Formaldehyde, >25% in water', '6.1B', 'Key study'],
+    ['50-00-0', 'Formaldehyde', '6.1B', 'LD50 rat: 100 mg/kg'],
+    ['50-00-0', 'Formaldehyde', '8.2B', 'Spans\ntwo lines, "quoted"'],
+    ['64-17-5', 'エタノール', '3.1B', 'Non-ASCII text'],
+    ['7732-18-5', 'Water', '', ''],
+    # A second run of a CASRN that already had one.
+    ['50-00-0', 'Formaldehyde', '6.7B', 'Later run'],
+    ]
+
+
+def write(filename, rows):
+    with ghscrunch.OutputFile(filename, newline='') as outfile:
+        writer = ghscrunch.csv_writer(outfile, index=True)
+        writer.writerow(['CASRN', 'Name', 'HSNO code', 'Key study'])
+        writer.writerows(rows)
+
+
+def test_round_trip(tmp_path):
+    filename = str(tmp_path / 'GHS-nz.csv')
+    write(filename, ROWS)
+    with ghsindex.OffsetIndex(filename) as index:
+        # One entry per run.
+        assert len(index) == 5
+        for casrn in ('_v1_50-00-0', '64-17-5', '7732-18-5', '50-00-0'):
+            assert index.rows(casrn) == [r for r in ROWS if r[0] == casrn]
+        assert index.rows('71-43-2') == []
+        assert index.rows('50-00') == []
+        assert index.rows('x' * 100) == []
+    # The same rows as reading the whole file.
+    assert list(ghsindex.read_csv(filename)) == ROWS
+
+
+def test_empty_file(tmp_path):
+    filename = str(tmp_path / 'empty.csv')
+    write(filename, [])
+    with ghsindex.OffsetIndex(filename) as index:
+        assert len(index) == 0
+        assert index.rows('50-00-0') == []
+
+
+def test_out_of_date_index(tmp_path):
+    filename = str(tmp_path / 'GHS-nz.csv')
+    write(filename, ROWS)
+    index_file = filename + ghscrunch.INDEX_SUFFIX
+    with open(index_file, 'rb') as f:
+        old_index = f.read()
+    write(filename, ROWS[1:])
+    with open(index_file, 'wb') as f:
+        f.write(old_index)
+    with ghsindex.OffsetIndex(filename) as index:
+        with pytest.raises(ValueError):
+            index.rows('50-00-0')
+
+
+def test_not_an_index(tmp_path):
+    filename = str(tmp_path / 'GHS-nz.csv')
+    write(filename, ROWS)
+    with open(filename + ghscrunch.INDEX_SUFFIX, 'r+b') as f:
+        f.write(b'XXXX')
+    with pytest.raises(ValueError):
+        ghsindex.OffsetIndex(filename)
+
+
+def record(jurisdiction, record_id, hazard_class, classification):
+    return ghsindex.Classification(
+        jurisdiction, ghsindex.normalize_casrn(record_id), record_id,
+        'Chemical ' + record_id, hazard_class, classification, ())
+
+
+RECORDS = [
+    record('jp', '50-00-0', 'cancer', 'Category 1A'),
+    record('jp', '50-00-0', 'skin_sens', 'Category 1'),
+    record('jp', 'ID123', 'cancer', 'Category 2'),
+    record('kr', '050-00-0', 'cancer', 'Carcinogenicity - Category 1A'),
+    record('nz', '50-00-0', '6.7A', 'Carcinogenicity - Category 1A'),
+    record('nz', '_v1_50-00-0', '6.7B', 'Carcinogenicity - Category 2'),
+    record('nz', '64-17-5', '3.1B', 'Flammable liquids - Category 2'),
+    record('nz', '64-17-9', '3.1B', 'Flammable liquids - Category 2'),
+    ]
+
+
+def test_lookup_normalizes_casrns():
+    index = ghsindex.GHSIndex(RECORDS)
+    formaldehyde = index.lookup('50-00-0')
+    # Leading zeros and the variant prefix are ignored, in the index and
+    # in the query.
+    assert [r.record_id for r in formaldehyde] == [
+        '50-00-0', '50-00-0', '050-00-0', '50-00-0', '_v1_50-00-0']
+    assert index.lookup(' 0050-00-0') == formaldehyde
+    assert index.lookup('_v2_50-00-0') == formaldehyde
+    assert index.lookup('71-43-2') == ()
+    assert index.lookup_many(['0050-00-0', '64-17-5', '71-43-2']) == {
+        '0050-00-0': formaldehyde, '64-17-5': (RECORDS[6],), '71-43-2': ()}
+
+
+def test_by_hazard():
+    index = ghsindex.GHSIndex(RECORDS)
+    assert index.by_hazard('cancer', 'jp') == (RECORDS[0], RECORDS[2])
+    assert index.by_hazard('cancer', 'nz') == ()
+    # Without a jurisdiction, in the order jp, kr, nz.
+    assert index.by_hazard('cancer') == (RECORDS[0], RECORDS[2], RECORDS[3])
+    assert index.by_hazard('3.1B') == (RECORDS[6], RECORDS[7])
+    assert index.by_hazard('nothing') == ()
+    assert index.hazard_classes('nz') == ['3.1B', '6.7A', '6.7B']
+
+
+def test_profile_is_cached():
+    index = ghsindex.GHSIndex(RECORDS, cache_size=2)
+    profile = index.profile('50-00-0')
+    assert profile == {
+        'jp': {'cancer': ('Category 1A',), 'skin_sens': ('Category 1',)},
+        'kr': {'cancer': ('Carcinogenicity - Category 1A',)},
+        'nz': {'6.7A': ('Carcinogenicity - Category 1A',),
+               '6.7B': ('Carcinogenicity - Category 2',)}}
+    # Keyed by the normalized CASRN, so other spellings hit the cache.
+    assert index.profile('050-00-0') is profile
+    info = index._cached_profile.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+    index.profile('64-17-5')
+    index.profile('71-43-2')
+    assert index.profile('71-43-2') == {}
+    # Bounded: the first profile has been evicted.
+    assert index.profile('50-00-0') is not profile
+    assert index._cached_profile.cache_info().currsize == 2
+
+
+def test_stats_and_invalid():
+    index = ghsindex.GHSIndex(RECORDS)
+    assert sorted(index.invalid) == ['64-17-9', 'ID123']
+    assert index.stats['chemicals'] == 4
+    assert index.stats['records'] == len(RECORDS)
+    assert index.stats['invalid_casrns'] == 2
+    empty = ghsindex.GHSIndex()
+    empty.freeze()
+    assert empty.stats['chemicals'] == 0 and empty.invalid == ()
+
+
+def test_load(jp_output, capsys):
+    jp_output([('Formaldehyde', '50-00-0',
+                {'cancer': ('Carcinogenicity', 'Category 1A')})])
+    index = ghsindex.GHSIndex.load(measure_memory=True)
+    assert [(r.jurisdiction, r.hazard_class, r.classification)
+            for r in index.lookup('50-00-0')] == [
+        ('jp', 'cancer', 'Carcinogenicity - Category 1A')]
+    assert index.stats['memory_bytes'] > 0
+    # Korea and NZ haven't been crunched.
+    err = capsys.readouterr().err
+    assert 'Skipping kr' in err and 'Skipping nz' in err
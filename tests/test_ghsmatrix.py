@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+import ghsindex
+import ghsmatrix
+
+numpy = pytest.importorskip('numpy')
+
+
+CHEMICALS = [
+    ('Formaldehyde', '50-00-0', {
+        'cancer': ('Carcinogenicity', 'Category 1A'),
+        'explosive': ('Explosives', 'Not classified'),
+        'flamm_gas': ('Flammable gases', 'Classification not possible'),
+        'pyro_liq': ('Pyrophoric liquids', 'Not applicable'),
+        'pyro_sol': ('Pyrophoric solids', 'Not classified')}),
+    ('Benzene', '71-43-2', {
+        'cancer': ('Carcinogenicity', 'Not classified'),
+        'flamm_liq': ('Flammable liquids', 'Category 2'),
+        'aq_acute': ('Hazardous to the aquatic environment (acute)', 0.0),
+        'aq_chronic': ('Hazardous to the aquatic environment (chronic)',
+                       2.0)}),
+    # A hazard class name that isn't in NITE_HAZARD_NAMES, but is used by
+    # the per-hazard-class file of acute_oral.
+    ('Ethanol', '64-17-5', {
+        'acute_oral': ('Acute oral', 'Category 4')}),
+    ('Methanol', '67-56-1', {
+        'acute_oral': ('Acute oral', 'Not applicable'),
+        'acute_derm': ('Acute toxicity (dermal)',
+                       'Classification not possible')}),
+    ]
+
+
+def codes(arrays, casrn, hazard, jurisdiction='jp'):
+    return int(arrays['codes'][
+        list(arrays['jurisdiction']).index(jurisdiction),
+        list(arrays['casrn']).index(casrn),
+        list(arrays['hazard']).index(hazard)])
+
+
+def test_sentinel_codes(jp_output):
+    jp_output(CHEMICALS)
+    arrays = ghsmatrix.build_arrays(
+        ghsmatrix.build_matrix(ghsmatrix.read_all()))
+    counts = {code: int((arrays['codes'] == code).sum())
+              for code in (ghsmatrix.NOT_CLASSIFIED, ghsmatrix.NOT_POSSIBLE,
+                           ghsmatrix.NOT_APPLICABLE)}
+    # pyro_liq and pyro_sol share the pyrophoric column, where "not
+    # classified" wins over "not applicable".
+    assert counts == {ghsmatrix.NOT_CLASSIFIED: 3,
+                      ghsmatrix.NOT_POSSIBLE: 2,
+                      ghsmatrix.NOT_APPLICABLE: 1}
+    assert codes(arrays, '50-00-0', 'pyrophoric') == ghsmatrix.NOT_CLASSIFIED
+    assert codes(arrays, '71-43-2', 'cancer') == ghsmatrix.NOT_CLASSIFIED
+    assert codes(arrays, '67-56-1', 'acute_oral') == \
+        ghsmatrix.NOT_APPLICABLE
+    assert codes(arrays, '67-56-1', 'acute_derm') == ghsmatrix.NOT_POSSIBLE
+    category = list(arrays['category'])
+    assert codes(arrays, '50-00-0', 'cancer') == \
+        category.index('Category 1A') + 1
+    # Numeric cells: 2.0 is Category 2, and 0.0 is no classification.
+    assert codes(arrays, '71-43-2', 'aq_chronic') == \
+        category.index('Category 2') + 1
+    assert codes(arrays, '71-43-2', 'aq_acute') == ghsmatrix.NO_DATA
+    assert '0.0' not in category and '2.0' not in category
+
+
+def test_missing_jp_file_skips_jp(jp_output, capsys):
+    jp_output(CHEMICALS)
+    os.remove('GHS-jp/output/notpossible.csv')
+    assert list(ghsmatrix.read_all()) == []
+    assert 'Skipping jp' in capsys.readouterr().out
+
+
+def test_unmapped_kr_hazard_class_is_left_out(capsys):
+    records = [
+        ghsindex.Classification('kr', '50-00-0', '50-00-0', 'Formaldehyde',
+                                'Acute toxicity',
+                                'Acute toxicity - Category 3 [H301]', ()),
+        ghsindex.Classification('kr', '50-00-0', '50-00-0', 'Formaldehyde',
+                                'Carcinogenicity',
+                                'Carcinogenicity - Category 1A [H350]', ())]
+    matrix = ghsmatrix.build_matrix(records)
+    assert matrix == {'50-00-0': ['Formaldehyde',
+                                  {'cancer': {'kr': ['Category 1A']}}]}
+    assert "'Acute toxicity'" in capsys.readouterr().err
@@ -0,0 +1,21 @@
+import ghsnames
+from ghsnames import NameEntry
+
+
+def test_match_unkeyed_includes_variants():
+    index = ghsnames.NameIndex([
+        NameEntry('nz', '50-00-0', '50-00-0', 'Formaldehyde'),
+        NameEntry('nz', '50-00-0', '_v0_50-00-0',
+                  'Formaldehyde, >25% in water'),
+        NameEntry('kr', '50-00-0', '50-00-0', 'Formaldehyde solution'),
+        NameEntry('jp', '123-45-6', '123-45-6', 'Formaldehyde, in water'),
+        NameEntry('jp', '64-17-5', '64-17-5', 'Ethanol')])
+    results = dict(index.match_unkeyed(k=5, threshold=0.3))
+    # The typo'd CASRN and the variant; the others have valid CASRNs.
+    assert sorted(e.record_id for e in results) == ['123-45-6',
+                                                     '_v0_50-00-0']
+    variant = [e for e in results if e.record_id == '_v0_50-00-0'][0]
+    matched = [(m.jurisdiction, m.record_id) for m in results[variant]]
+    # The pure substance shares the variant's CASRN, but is another record.
+    assert ('nz', '50-00-0') in matched
+    assert ('nz', '_v0_50-00-0') not in matched
@@ -0,0 +1,73 @@
+import ghstext
+from ghstext import Hit
+
+
+DOCUMENTS = [
+    ('50-00-0', 'cancer', 'Carcinogenic in rats (OECD TG 451); IARC 1.'),
+    ('50-00-0', 'skin_sens', 'Positive in the LLNA, OECD TG 429.'),
+    ('64-17-5', 'cancer', 'No data; rats given 10 mg/kg showed no tumours.'),
+    ('_v1_7732-18-5', 'acute_oral', 'LD50 rat > 90 mL/kg.'),
+    ]
+
+
+def test_tokenize():
+    assert ghstext.tokenize('OECD TG 471, 10 mg/kg') == \
+        ['oecd', 'tg', '471', '10', 'mg', 'kg']
+
+
+def test_incremental_update(tmp_path):
+    path = str(tmp_path / 'text.sqlite')
+    with ghstext.TextIndex(path) as index:
+        assert index.update('jp', DOCUMENTS) == dict(
+            added=4, changed=0, removed=0, unchanged=0)
+        assert index.update('jp', DOCUMENTS) == dict(
+            added=0, changed=0, removed=0, unchanged=4)
+        assert index.search('rat*') == [
+            Hit('jp', '50-00-0', '50-00-0', 'cancer'),
+            Hit('jp', '64-17-5', '64-17-5', 'cancer'),
+            Hit('jp', '7732-18-5', '_v1_7732-18-5', 'acute_oral')]
+
+    # Reopened: one document changed, one removed, one added.
+    documents = DOCUMENTS[:2] + [
+        ('64-17-5', 'cancer', 'Not carcinogenic in mice.'),
+        ('71-43-2', 'cancer', 'Leukaemia in humans; OECD TG 451.')]
+    with ghstext.TextIndex(path) as index:
+        assert index.update('jp', documents) == dict(
+            added=1, changed=1, removed=1, unchanged=2)
+        assert [h.casrn for h in index.search('rat*')] == ['50-00-0']
+        assert [h.casrn for h in index.search('mice')] == ['64-17-5']
+        assert index.search('ld50') == []
+        assert index.stats()['documents'] == 4
+
+    # Other jurisdictions are left alone.
+    with ghstext.TextIndex(path) as index:
+        assert index.update('nz', [('50-00-0', '6.7A', 'OECD TG 451')]) == \
+            dict(added=1, changed=0, removed=0, unchanged=0)
+        assert index.update('jp', []) == dict(
+            added=0, changed=0, removed=4, unchanged=0)
+        assert index.search('oecd') == [Hit('nz', '50-00-0', '50-00-0',
+                                            '6.7A')]
+
+
+def test_search(tmp_path):
+    with ghstext.TextIndex(str(tmp_path / 'text.sqlite')) as index:
+        index.update('jp', DOCUMENTS)
+        index.update('nz', [('50-00-0', '6.7A', 'TG 451 OECD')])
+
+        def casrns(query, jurisdiction=None):
+            return [(h.jurisdiction, h.record_id, h.hazard_class)
+                    for h in index.search(query, jurisdiction)]
+
+        # Phrases, quoted or from a word that tokenizes into several terms.
+        assert casrns('"OECD TG 451"') == [('jp', '50-00-0', 'cancer')]
+        assert casrns('OECD TG') == [('jp', '50-00-0', 'cancer'),
+                                     ('jp', '50-00-0', 'skin_sens'),
+                                     ('nz', '50-00-0', '6.7A')]
+        assert casrns('mg/kg') == [('jp', '64-17-5', 'cancer')]
+        assert casrns('kg/mg') == []
+        # All terms, in any order.
+        assert casrns('451 oecd', 'nz') == [('nz', '50-00-0', '6.7A')]
+        assert casrns('LLNA* oecd') == [('jp', '50-00-0', 'skin_sens')]
+        assert casrns('tumour*') == [('jp', '64-17-5', 'cancer')]
+        assert casrns('nothing') == []
+        assert casrns('') == []